@@ -1,122 +1,404 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import hashlib
 import uuid
 import os
 import json
 from datetime import datetime
 import time
+import csv
+import io
+from vote_journal import VoteJournal
+from storage import CachedStorage, JsonStorage, SqliteStorage
+from sharded_storage import ShardedStorage
+from tally import Tally
+from catalog import CatalogCache
+from results_engine import ResultsEngineCache
+from figure_cache import FigureCache
+from change_feed import Subscription
+from results_snapshot import SnapshotPublisher, SnapshotReader
+from write_behind import WriteBehindQueue
+from replication import Aggregator, LEASE_TTL
+from offline_sync import OfflineLog, PayloadError, build_payload, read_payload
+from compaction import verify_counts
+from table_index import TableIndexCache
+from auth import KdfSettings, PasswordHasher, UserIndex
+from metrics import registry as metrics_registry, timed, timer
+
+# Data directory; replicas on one host point ELECTION_DATA_DIR at the same
+# local directory
+DATA_DIR = os.environ.get("ELECTION_DATA_DIR", "data")
 
 # Create folders for data storage if they don't exist
-os.makedirs("data", exist_ok=True)
+os.makedirs(DATA_DIR, exist_ok=True)
 
 # File paths
-USERS_FILE = "data/users.json"
-CANDIDATES_FILE = "data/candidates.json"
-ELECTORAL_BOXES_FILE = "data/electoral_boxes.json"
-VOTES_FILE = "data/votes.json"
-VOTE_COUNTS_FILE = "data/vote_counts.json"
-OFFLINE_VOTES_FILE = "data/offline_votes.json"
-
-# Initialize data files if they don't exist
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
+CANDIDATES_FILE = os.path.join(DATA_DIR, "candidates.json")
+ELECTORAL_BOXES_FILE = os.path.join(DATA_DIR, "electoral_boxes.json")
+VOTES_FILE = os.path.join(DATA_DIR, "votes.json")
+VOTE_COUNTS_FILE = os.path.join(DATA_DIR, "vote_counts.json")
+OFFLINE_VOTES_FILE = os.path.join(DATA_DIR, "offline_votes.json")
+JOURNAL_DIR = os.path.join(DATA_DIR, "journal")
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+SHARDS_DIR = os.path.join(DATA_DIR, "shards")
+PENDING_VOTES_DIR = os.path.join(DATA_DIR, "pending")
+OFFLINE_LOG_DIR = os.path.join(DATA_DIR, "offline")
+
+# Offline votes are synced this many at a time, one storage write per chunk
+SYNC_CHUNK_SIZE = 500
+
+# Ballots per sync payload built from the offline log; each payload is
+# applied to the main store in one write
+OFFLINE_PAYLOAD_BALLOTS = 20000
+
+# Online ballots from the vote entry grid are journaled locally and committed
+# to the store in groups by a background writer; 0 writes each one directly
+WRITE_BEHIND = os.environ.get("ELECTION_WRITE_BEHIND", "1") == "1"
+
+# Whether the counter dashboard shows box and overall results below the
+# vote grid by default; counters can still switch them on or off. With them
+# off, a counter's page never loads pandas or Plotly.
+COUNTER_RESULTS = os.environ.get("ELECTION_COUNTER_RESULTS", "1") == "1"
+
+# Rows per page in the admin's Users, Candidates and Electoral Boxes tables
+ADMIN_PAGE_SIZE = 50
+
+# Build only the results view the user has selected instead of every tab
+LAZY_RESULT_TABS = os.environ.get("ELECTION_LAZY_RESULT_TABS", "0") == "1"
+
+# Results panels poll the change feed this often (seconds); 0 turns live
+# updates off so they only refresh on a full rerun
+LIVE_REFRESH_SECONDS = float(os.environ.get("ELECTION_LIVE_REFRESH", "5"))
+LIVE_RUN_EVERY = LIVE_REFRESH_SECONDS or None
+
+# Published results snapshots for the public page: a new one every
+# SNAPSHOT_EVERY_BALLOTS ballots (0 = no ballot trigger), and at least every
+# SNAPSHOT_INTERVAL seconds while votes keep coming in
+SNAPSHOT_INTERVAL = float(os.environ.get("ELECTION_SNAPSHOT_INTERVAL", "10"))
+SNAPSHOT_EVERY_BALLOTS = int(os.environ.get("ELECTION_SNAPSHOT_EVERY", "500"))
+
+# Password hashing: ELECTION_PASSWORD_KDF is "scrypt" (default) or
+# "pbkdf2_sha256"; raise the cost settings as hardware allows (see
+# benchmarks/password_bench.py). Existing hashes are upgraded on login.
+PASSWORD_KDF = KdfSettings(
+    algorithm=os.environ.get("ELECTION_PASSWORD_KDF", "scrypt"),
+    n=int(os.environ.get("ELECTION_SCRYPT_N", str(2 ** 14))),
+    r=int(os.environ.get("ELECTION_SCRYPT_R", "8")),
+    p=int(os.environ.get("ELECTION_SCRYPT_P", "1")),
+    iterations=int(os.environ.get("ELECTION_PBKDF2_ITERATIONS", "600000"))
+)
+PASSWORD_WORKERS = int(os.environ.get("ELECTION_PASSWORD_WORKERS", "2"))
+
+# Also write the performance metrics to this file every 15s (Prometheus text,
+# or JSON if it ends in .json), e.g. for a node_exporter textfile collector
+METRICS_FILE = os.environ.get("ELECTION_METRICS_FILE")
+
+# Storage backend: "json" (default) keeps the files above, "sqlite" keeps the
+# same datasets in one WAL-mode database (see `python storage.py migrate`),
+# "sharded" keeps ballots in one shard per box under SHARDS_DIR (see
+# `python sharded_storage.py migrate`)
+STORAGE_BACKEND = os.environ.get("ELECTION_STORAGE", "json")
+SQLITE_DB_FILE = os.environ.get("ELECTION_DB", os.path.join(DATA_DIR, "election.db"))
+
+# Replica mode (ELECTION_REPLICAS=1): several app processes on one host share
+# one store, usually the sqlite backend in a local ELECTION_DATA_DIR (not a
+# network filesystem; see replication.py). One of them, the
+# aggregator, holds a lease and publishes the results snapshots; every
+# replica's results views read those snapshots. ELECTION_NODE_ID names this
+# replica (default: host name and pid).
+REPLICA_MODE = os.environ.get("ELECTION_REPLICAS", "0") == "1"
+NODE_ID = os.environ.get("ELECTION_NODE_ID")
+AGGREGATOR_LEASE_TTL = float(os.environ.get("ELECTION_LEASE_TTL", str(LEASE_TTL)))
+
+# One storage object per process, shared by every session and rerun so its
+# cache survives between script runs
+@st.cache_resource
+def open_storage():
+    if STORAGE_BACKEND == "sqlite":
+        backend = SqliteStorage(SQLITE_DB_FILE)
+    elif STORAGE_BACKEND == "sharded":
+        backend = ShardedStorage(VOTES_FILE, VOTE_COUNTS_FILE, SHARDS_DIR)
+    else:
+        # Ballots are appended to the journal instead of rewriting votes.json/
+        # vote_counts.json; those two files are base snapshots it is replayed on
+        backend = JsonStorage(VOTES_FILE, VOTE_COUNTS_FILE, VoteJournal(JOURNAL_DIR))
+    return CachedStorage(backend)
+
+storage = open_storage()
+
+# Running totals shared by all sessions; dashboards read results from here
+@st.cache_resource
+def open_tally():
+    return Tally(storage, CANDIDATES_FILE)
+
+tally = open_tally()
+
+# Candidate indexes (by ID, category and party), rebuilt only when
+# candidates.json changes
+@st.cache_resource
+def open_candidate_catalog():
+    return CatalogCache(storage, CANDIDATES_FILE)
+
+candidate_catalog = open_candidate_catalog()
+
+# Box x candidate count matrix behind every results table
+@st.cache_resource
+def open_results_engine():
+    return ResultsEngineCache(tally, candidate_catalog, storage, ELECTORAL_BOXES_FILE)
+
+results_engine = open_results_engine()
+
+# Plotly figures reused across reruns while their counts are unchanged
+@st.cache_resource
+def open_figure_cache():
+    return FigureCache()
+
+figure_cache = open_figure_cache()
+
+# Aggregator lease; whichever process holds it publishes the results
+# snapshots, in replica mode or not, so the other processes sharing the data
+# directory never build the results engine (or import pandas) to publish
+@st.cache_resource
+def open_aggregator():
+    return Aggregator(storage, NODE_ID, ttl=AGGREGATOR_LEASE_TTL)
+
+aggregator = open_aggregator()
+
+# Background publisher of results snapshots, one per process; it only
+# publishes while this process is the aggregator
+@st.cache_resource
+def open_snapshot_publisher():
+    publisher = SnapshotPublisher(
+        SNAPSHOT_DIR, tally, candidate_catalog, storage, ELECTORAL_BOXES_FILE,
+        interval=SNAPSHOT_INTERVAL, every_ballots=SNAPSHOT_EVERY_BALLOTS,
+        leader=aggregator
+    )
+    # A new aggregator publishes straight away
+    aggregator.on_elected = publisher.notify
+    aggregator.start()
+    publisher.start()
+    return publisher
+
+snapshot_publisher = open_snapshot_publisher()
+
+# Latest published snapshot, parsed once per version for all public viewers
+@st.cache_resource
+def open_snapshot_reader():
+    return SnapshotReader(SNAPSHOT_DIR)
+
+snapshot_reader = open_snapshot_reader()
+
+# Offline-mode ballots, appended here until they are synced
+@st.cache_resource
+def open_offline_log():
+    return OfflineLog(OFFLINE_LOG_DIR)
+
+offline_log = open_offline_log()
+
+# Users by name, shared by every login
+@st.cache_resource
+def open_user_index():
+    return UserIndex(storage, USERS_FILE)
+
+user_index = open_user_index()
+
+# Admin table rows; users never show their password hash
+def user_row(username, details):
+    return {"Username": username, "Role": details["role"], "Created At": details["created_at"]}
+
+def candidate_row(cid, details):
+    return {
+        "ID": cid,
+        "Name": details["name"],
+        "Party": details["party"],
+        "Category": details.get("category", "Uncategorized")
+    }
+
+def box_row(bid, details):
+    return {
+        "ID": bid,
+        "Name": details["name"],
+        "Location": details["location"],
+        "Registered Voters": details["registered_voters"]
+    }
+
+# Searchable, sortable indexes behind the admin tables, rebuilt only when
+# their dataset changes
+@st.cache_resource
+def open_admin_tables():
+    return {
+        "users": TableIndexCache(storage, USERS_FILE, user_row, ["Username", "Role", "Created At"], ["Username", "Role"]),
+        "candidates": TableIndexCache(
+            storage, CANDIDATES_FILE, candidate_row, ["Name", "Party", "Category"], ["Name", "Party", "Category"]
+        ),
+        "boxes": TableIndexCache(
+            storage, ELECTORAL_BOXES_FILE, box_row, ["Name", "Location", "Registered Voters"], ["Name", "Location"]
+        )
+    }
+
+admin_tables = open_admin_tables()
+
+# Thread pool that runs password hashing off the session threads
+@st.cache_resource
+def open_password_hasher():
+    return PasswordHasher(PASSWORD_KDF, max_workers=PASSWORD_WORKERS)
+
+password_hasher = open_password_hasher()
+
+# Periodic metrics file export, started once per process
+@st.cache_resource
+def open_metrics_exporter():
+    if METRICS_FILE:
+        return metrics_registry.start_file_exporter(METRICS_FILE)
+    return None
+
+open_metrics_exporter()
+
+# Seed the datasets a fresh deployment needs (a default admin user, empty
+# candidate and box registries) through the storage backend, so the sqlite
+# and sharded backends get them too; once per process, not on every script
+# run. Ballot datasets need no seeding: every backend reads a missing one as
+# empty.
+@st.cache_resource
 def initialize_data_files():
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f:
-            # Create a default admin user
-            default_admin = {
-                "admin": {
-                    "password": hashlib.sha256("admin123".encode()).hexdigest(),
-                    "role": "admin",
-                    "created_at": datetime.now().isoformat()
-                }
+    defaults = {
+        USERS_FILE: lambda: {
+            "admin": {
+                "password": password_hasher.hash("admin123"),
+                "role": "admin",
+                "created_at": datetime.now().isoformat()
             }
-            json.dump(default_admin, f)
-    
-    if not os.path.exists(CANDIDATES_FILE):
-        with open(CANDIDATES_FILE, "w") as f:
-            json.dump({}, f)
-    
-    if not os.path.exists(ELECTORAL_BOXES_FILE):
-        with open(ELECTORAL_BOXES_FILE, "w") as f:
-            json.dump({}, f)
-    
-    if not os.path.exists(VOTES_FILE):
-        with open(VOTES_FILE, "w") as f:
-            json.dump({}, f)
-            
-    if not os.path.exists(VOTE_COUNTS_FILE):
-        with open(VOTE_COUNTS_FILE, "w") as f:
-            json.dump({}, f)
-            
-    if not os.path.exists(OFFLINE_VOTES_FILE):
-        with open(OFFLINE_VOTES_FILE, "w") as f:
-            json.dump({}, f)
+        },
+        CANDIDATES_FILE: dict,
+        ELECTORAL_BOXES_FILE: dict
+    }
+    for file_path, default in defaults.items():
+        # A JSON file counts as initialized once it exists, even if empty
+        if storage.load(file_path) or (STORAGE_BACKEND != "sqlite" and os.path.exists(file_path)):
+            continue
+        with storage.lock(file_path):
+            # Another process may have seeded it meanwhile
+            if storage.load(file_path):
+                continue
+            data = default()
+            # An empty table needs no write
+            if data or STORAGE_BACKEND != "sqlite":
+                storage.save(data, file_path)
+
+initialize_data_files()
 
 # Load data
+@timed("load_data")
 def load_data(file_path):
-    try:
-        with open(file_path, "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    return storage.load(file_path)
 
 # Save data
+@timed("save_data")
 def save_data(data, file_path):
-    with open(file_path, "w") as f:
-        json.dump(data, f)
+    storage.save(data, file_path)
 
 # Authentication functions
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    return password_hasher.hash(password)
 
 def authenticate(username, password):
-    users = load_data(USERS_FILE)
-    if username in users and users[username]["password"] == hash_password(password):
-        return users[username]["role"]
-    return None
+    user = user_index.get(username)
+    if user is None:
+        password_hasher.verify_unknown_user(password)
+        return None
+    
+    matches, needs_upgrade = password_hasher.verify(password, user["password"])
+    if not matches:
+        return None
+    if needs_upgrade:
+        upgrade_password_hash(username, user["password"], password)
+    return user["role"]
+
+# Re-hash a password stored as legacy SHA-256 (or with old KDF settings)
+# now that we know it in plain text
+def upgrade_password_hash(username, old_hash, password):
+    new_hash = hash_password(password)
+    with storage.lock(USERS_FILE):
+        users = dict(load_data(USERS_FILE))
+        # Someone changed it meanwhile; leave theirs alone
+        if username not in users or users[username]["password"] != old_hash:
+            return
+        users[username] = {**users[username], "password": new_hash}
+        save_data(users, USERS_FILE)
+    user_index.invalidate()
 
 # Add user function
 def add_user(username, password, role):
-    users = load_data(USERS_FILE)
-    if username in users:
-        return False, "Username already exists"
-    
-    users[username] = {
-        "password": hash_password(password),
-        "role": role,
-        "created_at": datetime.now().isoformat()
-    }
-    save_data(users, USERS_FILE)
+    # Hash before taking the lock; the KDF is deliberately slow
+    password_hash = hash_password(password)
+    with storage.lock(USERS_FILE):
+        users = dict(load_data(USERS_FILE))
+        if username in users:
+            return False, "Username already exists"
+        
+        users[username] = {
+            "password": password_hash,
+            "role": role,
+            "created_at": datetime.now().isoformat()
+        }
+        save_data(users, USERS_FILE)
+    user_index.invalidate()
     return True, "User added successfully"
 
 # Add candidate function with category
 def add_candidate(name, party, category):
-    candidates = load_data(CANDIDATES_FILE)
-    candidate_id = str(uuid.uuid4())
-    candidates[candidate_id] = {
-        "name": name,
-        "party": party,
-        "category": category,
-        "created_at": datetime.now().isoformat()
-    }
-    save_data(candidates, CANDIDATES_FILE)
+    with storage.lock(CANDIDATES_FILE):
+        candidates = dict(load_data(CANDIDATES_FILE))
+        candidate_id = str(uuid.uuid4())
+        candidates[candidate_id] = {
+            "name": name,
+            "party": party,
+            "category": category,
+            "created_at": datetime.now().isoformat()
+        }
+        save_data(candidates, CANDIDATES_FILE)
     return True, "Candidate added successfully"
 
 # Add electoral box function
 def add_electoral_box(name, location, registered_voters):
-    boxes = load_data(ELECTORAL_BOXES_FILE)
-    box_id = str(uuid.uuid4())
-    boxes[box_id] = {
-        "name": name,
-        "location": location,
-        "registered_voters": registered_voters,
-        "created_at": datetime.now().isoformat()
-    }
-    save_data(boxes, ELECTORAL_BOXES_FILE)
+    with storage.lock(ELECTORAL_BOXES_FILE):
+        boxes = dict(load_data(ELECTORAL_BOXES_FILE))
+        box_id = str(uuid.uuid4())
+        boxes[box_id] = {
+            "name": name,
+            "location": location,
+            "registered_voters": registered_voters,
+            "created_at": datetime.now().isoformat()
+        }
+        save_data(boxes, ELECTORAL_BOXES_FILE)
     return True, "Electoral box added successfully"
 
+# Write ballots, then fold them into the tally right away so they reach the
+# change feed (and every live results view) without waiting for a poll
+def commit_ballots(records):
+    storage.record_ballots(records)
+    tally.sync()
+    snapshot_publisher.notify()
+
+# Group-commits queued online ballots through commit_ballots; started even
+# with WRITE_BEHIND off so ballots queued by an earlier run still get in
+@st.cache_resource
+def open_write_queue():
+    queue = WriteBehindQueue(PENDING_VOTES_DIR, storage, tally, commit_ballots)
+    queue.start()
+    return queue
+
+write_queue = open_write_queue()
+
+# Live change-feed position for one results view in this session; returns
+# which boxes and candidates changed since the view last rendered
+def results_feed(view):
+    key = f"results_feed_{view}"
+    if key not in st.session_state:
+        st.session_state[key] = Subscription(tally)
+    return st.session_state[key].poll(LIVE_REFRESH_SECONDS)
+
 # Record a single vote (supports both online and offline storage)
+@timed("record_single_vote")
 def record_single_vote(box_id, candidate_ids, counter_username, offline_mode=False):
     vote_id = str(uuid.uuid4())
     timestamp = datetime.now().isoformat()
@@ -128,35 +410,18 @@ def record_single_vote(box_id, candidate_ids, counter_username, offline_mode=Fal
     }
     
     if offline_mode:
-        # Store vote in offline storage
-        offline_votes = load_data(OFFLINE_VOTES_FILE)
-        if box_id not in offline_votes:
-            offline_votes[box_id] = {}
-        
-        offline_votes[box_id][vote_id] = vote_data
-        save_data(offline_votes, OFFLINE_VOTES_FILE)
+        # One append to the offline log; synced later as a payload
+        offline_log.append([{"box_id": box_id, "vote_id": vote_id, **vote_data}])
         return True
     else:
-        # Store vote in main storage
-        votes = load_data(VOTES_FILE)
-        if box_id not in votes:
-            votes[box_id] = {}
-        
-        votes[box_id][vote_id] = vote_data
-        save_data(votes, VOTES_FILE)
-        
-        # Also update the vote counts for easier reporting
-        vote_counts = load_data(VOTE_COUNTS_FILE)
-        
-        if box_id not in vote_counts:
-            vote_counts[box_id] = {}
-        
-        for candidate_id in candidate_ids:
-            if candidate_id not in vote_counts[box_id]:
-                vote_counts[box_id][candidate_id] = 0
-            vote_counts[box_id][candidate_id] += 1
-        
-        save_data(vote_counts, VOTE_COUNTS_FILE)
+        record = {"box_id": box_id, "vote_id": vote_id, **vote_data}
+        if WRITE_BEHIND:
+            # Durable once journaled; the writer commits it moments later
+            write_queue.submit([record])
+        else:
+            # One journal append (JSON) or one transaction (SQLite) that
+            # records the ballot and bumps the box counts together
+            commit_ballots([record])
         
         return True
 
@@ -164,55 +429,261 @@ def record_single_vote(box_id, candidate_ids, counter_username, offline_mode=Fal
 def record_invalid_vote(box_id, counter_username, offline_mode=False):
     return record_single_vote(box_id, ["invalid"], counter_username, offline_mode)
 
+# Record many votes for one box in a single write
+# `votes` is either a list of ballots (each a list of candidate IDs) or a
+# tally sheet {candidate_id: count}
+@timed("record_votes_batch")
+def record_votes_batch(box_id, votes, counter_username):
+    candidates = load_data(CANDIDATES_FILE)
+    valid_ids = set(candidates) | {"invalid"}
+    timestamp = datetime.now().isoformat()
+    
+    if isinstance(votes, dict):
+        unknown = {cid for cid in votes if cid not in valid_ids}
+        bad_counts = [
+            cid for cid, count in votes.items()
+            if isinstance(count, bool) or not isinstance(count, int) or count < 0
+        ]
+        if unknown:
+            return False, f"Unknown candidate IDs: {', '.join(sorted(unknown))}"
+        if bad_counts:
+            return False, f"Counts must be non-negative whole numbers: {', '.join(sorted(bad_counts))}"
+        
+        # Stored like the legacy batch entries in votes.json
+        records = [{
+            "box_id": box_id,
+            "vote_id": str(uuid.uuid4()),
+            "counts": {cid: count for cid, count in votes.items() if count},
+            "recorded_by": counter_username,
+            "recorded_at": timestamp
+        }]
+        recorded = sum(votes.values())
+    else:
+        unknown = {cid for ballot in votes for cid in ballot if cid not in valid_ids}
+        if unknown:
+            return False, f"Unknown candidate IDs: {', '.join(sorted(unknown))}"
+        if any(not ballot for ballot in votes):
+            return False, "Every ballot needs at least one candidate (or \"invalid\")"
+        
+        records = [
+            {
+                "box_id": box_id,
+                "vote_id": str(uuid.uuid4()),
+                "candidates": list(ballot),
+                "recorded_by": counter_username,
+                "recorded_at": timestamp
+            }
+            for ballot in votes
+        ]
+        recorded = len(records)
+    
+    if recorded == 0:
+        return False, "No votes to record"
+    
+    commit_ballots(records)
+    return True, f"Recorded {recorded} votes"
+
+# A JSON tally count as an int if it is a whole number (5, 5.0 or "5");
+# anything else (fractions, booleans) is kept as is for record_votes_batch
+# to reject
+def upload_count(count):
+    if isinstance(count, float) and count.is_integer():
+        return int(count)
+    if isinstance(count, str) and count.strip().lstrip("-").isdigit():
+        return int(count)
+    return count
+
+# Parse an uploaded tally sheet or ballot file for record_votes_batch
+# CSV: "candidate_id,count" rows (tally sheet) or a "candidates" column with
+# ";"-separated IDs per ballot. JSON: {"counts": {...}} or {"ballots": [[...]]}
+def parse_vote_upload(filename, content):
+    if filename.lower().endswith(".json"):
+        data = json.loads(content)
+        if isinstance(data, dict) and "counts" in data:
+            if not isinstance(data["counts"], dict):
+                raise ValueError("\"counts\" must map candidate IDs to counts")
+            return {str(cid): upload_count(count) for cid, count in data["counts"].items()}
+        if isinstance(data, dict) and "ballots" in data:
+            data = data["ballots"]
+        if not isinstance(data, list):
+            raise ValueError("JSON must contain \"counts\" or \"ballots\"")
+        for number, ballot in enumerate(data, start=1):
+            if not isinstance(ballot, list) or not all(isinstance(cid, str) for cid in ballot):
+                raise ValueError(f"Ballot {number} must be a list of candidate IDs")
+        return [list(ballot) for ballot in data]
+    
+    reader = csv.DictReader(io.StringIO(content))
+    fields = reader.fieldnames or []
+    if "candidate_id" in fields and "count" in fields:
+        counts = {}
+        for row in reader:
+            cid = (row["candidate_id"] or "").strip()
+            if not cid or row["count"] is None:
+                raise ValueError(f"Line {reader.line_num} needs a candidate ID and a count")
+            counts[cid] = counts.get(cid, 0) + int(row["count"])
+        return counts
+    if "candidates" in fields:
+        return [
+            [cid.strip() for cid in (row["candidates"] or "").split(";") if cid.strip()]
+            for row in reader
+        ]
+    raise ValueError("CSV needs \"candidate_id,count\" columns or a \"candidates\" column")
+
+# Apply a sync payload (see offline_sync.py) to the main store in one write.
+# Ballots already there are skipped, so a payload can safely be applied
+# twice. Returns (recorded, already_synced); raises PayloadError if the
+# payload is damaged.
+@timed("apply_sync_payload")
+def apply_sync_payload(data):
+    payload = read_payload(data)
+    already_synced = storage.existing_vote_ids(record["vote_id"] for record in payload.records)
+    records = [record for record in payload.records if record["vote_id"] not in already_synced]
+    if records:
+        commit_ballots(records)
+    return len(records), len(payload) - len(records)
+
+# Sync payload of every offline ballot not synced yet, for carrying a field
+# station's backlog to the main server; returns (payload, ballots)
+def export_offline_payload():
+    records = [
+        {"box_id": box_id, "vote_id": vote_id, **vote_data}
+        for box_id, box_votes in load_data(OFFLINE_VOTES_FILE).items()
+        for vote_id, vote_data in box_votes.items()
+    ]
+    records.extend(offline_log.read_pending()[1])
+    return build_payload(records), len(records)
+
+# Offline ballots waiting to be synced, per box: the offline log plus any
+# left in offline_votes.json by older versions
+def pending_offline_counts():
+    counts = {box_id: len(votes) for box_id, votes in load_data(OFFLINE_VOTES_FILE).items() if votes}
+    for box_id, count in offline_log.pending_by_box().items():
+        counts[box_id] = counts.get(box_id, 0) + count
+    return counts
+
+# Checkpoint the vote counts and archive the ballot segments before it, so
+# restarts and recounts replay only what came after (see compaction.py)
+@timed("compact_ballot_store")
+def compact_ballot_store():
+    return storage.compact()
+
+# Recount every box from the stored ballots; returns (ballots, drift rows)
+@timed("verify_vote_counts")
+def verify_vote_counts():
+    return verify_counts(storage)
+
 # Sync offline votes with the main system
-def sync_offline_votes():
-    offline_votes = load_data(OFFLINE_VOTES_FILE)
-    if not offline_votes:
-        return 0  # No votes to sync
-    
-    synced_count = 0
-    
-    for box_id, box_votes in offline_votes.items():
-        for vote_id, vote_data in box_votes.items():
-            # Get data from offline vote
-            candidate_ids = vote_data["candidates"]
-            counter_username = vote_data["recorded_by"]
+# Votes keep their original vote_id, and IDs already in the main store are
+# skipped, so re-running a sync that was interrupted never double counts.
+# `progress(done, total, elapsed_seconds)` is called after every chunk or
+# payload.
+@timed("sync_offline_votes")
+def sync_offline_votes(chunk_size=SYNC_CHUNK_SIZE, progress=None):
+    synced_count = _sync_legacy_offline_votes(chunk_size, progress)
+    
+    # The offline log goes over as sync payloads, each one write to the store;
+    # the sync lock keeps two syncs from sending the same ballots
+    with offline_log.sync_lock():
+        total = offline_log.backlog()
+        done = 0
+        started = time.perf_counter()
+        while True:
+            end, records = offline_log.read_pending(OFFLINE_PAYLOAD_BALLOTS)
+            if not records:
+                break
+            recorded, _ = apply_sync_payload(build_payload(records))
+            offline_log.mark_synced(end)
+            synced_count += recorded
+            done += len(records)
             
-            # Record in main system
-            record_single_vote(box_id, candidate_ids, counter_username)
-            synced_count += 1
+            if progress:
+                progress(min(done, total), max(total, done), time.perf_counter() - started)
     
-    # Clear offline votes after successful sync
-    save_data({}, OFFLINE_VOTES_FILE)
+    return synced_count
+
+# Ballots in offline_votes.json, where versions before the offline log kept
+# them, synced in chunks of full ballot documents
+def _sync_legacy_offline_votes(chunk_size, progress):
+    # Hold the offline store for the whole sync so votes recorded meanwhile
+    # aren't cleared without being synced
+    with storage.lock(OFFLINE_VOTES_FILE):
+        offline_votes = load_data(OFFLINE_VOTES_FILE)
+        if not offline_votes:
+            return 0  # No votes to sync
+        
+        pending = [
+            (box_id, vote_id, vote_data)
+            for box_id, box_votes in offline_votes.items()
+            for vote_id, vote_data in box_votes.items()
+        ]
+        total = len(pending)
+        synced_count = 0
+        started = time.perf_counter()
+        
+        for start in range(0, total, chunk_size):
+            chunk = pending[start:start + chunk_size]
+            already_synced = storage.existing_vote_ids(vote_id for _, vote_id, _ in chunk)
+            
+            # Record the whole chunk in main system with one write
+            records = [
+                {"box_id": box_id, "vote_id": vote_id, **vote_data}
+                for box_id, vote_id, vote_data in chunk
+                if vote_id not in already_synced
+            ]
+            if records:
+                commit_ballots(records)
+            synced_count += len(records)
+            
+            if progress:
+                progress(start + len(chunk), total, time.perf_counter() - started)
+        
+        # Clear offline votes after successful sync
+        save_data({}, OFFLINE_VOTES_FILE)
     
     return synced_count
 
-# Get total votes by candidate
-def get_total_votes():
-    vote_counts = load_data(VOTE_COUNTS_FILE)
-    candidates = load_data(CANDIDATES_FILE)
+# Progress callback for sync_offline_votes that drives a Streamlit progress bar
+def sync_progress_bar():
+    bar = st.progress(0.0, text="Syncing offline votes...")
+    
+    def update(done, total, elapsed):
+        rate = done / elapsed if elapsed > 0 else 0
+        eta = (total - done) / rate if rate > 0 else 0
+        bar.progress(
+            done / total,
+            text=f"Synced {done}/{total} votes ({rate:.0f} votes/s, ETA {eta:.0f}s)"
+        )
     
-    # Initialize results dictionary
-    results = {candidate_id: 0 for candidate_id in candidates}
-    results["invalid"] = 0
+    return update
+
+# Get total votes by candidate; fully up to date unless the caller (a live
+# panel re-rendering on a timer) accepts a tally up to max_age seconds old
+@timed("get_total_votes")
+def get_total_votes(max_age=0):
+    if REPLICA_MODE:
+        # The aggregator's published totals, the same on every replica
+        snapshot = snapshot_reader.latest()
+        totals = snapshot.candidate_totals if snapshot else {}
+    else:
+        totals = tally.totals(max_age)
+    candidates = load_data(CANDIDATES_FILE)
     
-    # Sum up all votes
-    for box_id, box_votes in vote_counts.items():
-        for candidate_id, count in box_votes.items():
-            if candidate_id in results:
-                results[candidate_id] += count
-            elif candidate_id == "invalid":
-                results["invalid"] += count
+    # Known candidates only, plus invalid votes
+    results = {candidate_id: totals.get(candidate_id, 0) for candidate_id in candidates}
+    results["invalid"] = totals.get("invalid", 0)
     
     return results
 
-# Calculate progress of counting
-def get_counting_progress():
+# Calculate progress of counting (max_age as in get_total_votes)
+def get_counting_progress(max_age=0):
     boxes = load_data(ELECTORAL_BOXES_FILE)
-    votes = load_data(VOTES_FILE)
     
     total_boxes = len(boxes)
-    counted_boxes = sum(1 for box_id in votes if votes[box_id])
+    if REPLICA_MODE:
+        snapshot = snapshot_reader.latest()
+        counted_boxes = snapshot.totals["counted_boxes"] if snapshot else 0
+    else:
+        counted_boxes = tally.counted_box_count(max_age)
     
     if total_boxes == 0:
         return 0
@@ -230,13 +701,55 @@ def get_categories():
     
     return sorted(list(categories))
 
+# Tabs for results views. With LAZY_RESULT_TABS a radio picks one view and only
+# that view gets a container; the others come back as None and are skipped, so
+# their tables and figures are never built or sent to the browser
+def result_views(labels, key):
+    if not LAZY_RESULT_TABS:
+        return st.tabs(labels)
+    
+    selected = st.radio("View", labels, horizontal=True, key=key, label_visibility="collapsed")
+    return [st.container() if label == selected else None for label in labels]
+
+# One page of an indexed admin table, with search, sort and page controls;
+# only the visible page is turned into a table
+def paged_table(table, key, placeholder):
+    import pandas as pd
+    
+    index = table.get()
+    if not len(index):
+        return
+    
+    col1, col2, col3 = st.columns([3, 2, 1])
+    query = col1.text_input("Search", key=f"{key}_search", placeholder=placeholder)
+    sort = col2.selectbox("Sort by", index.sortable, key=f"{key}_sort")
+    descending = col3.toggle("Descending", key=f"{key}_descending")
+    
+    keys = index.search(query, sort)
+    pages = max(1, -(-len(keys) // ADMIN_PAGE_SIZE))
+    # A narrower search can leave the page number past the end
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    
+    rows = index.page(keys, (page - 1) * ADMIN_PAGE_SIZE, ADMIN_PAGE_SIZE, descending)
+    if rows:
+        st.dataframe(pd.DataFrame(rows), hide_index=True)
+        first = (page - 1) * ADMIN_PAGE_SIZE + 1
+        st.caption(f"{first}-{first + len(rows) - 1} of {len(keys)} (from {len(index)} in total)")
+    else:
+        st.info("No matches.")
+
 # Admin dashboard
 def admin_dashboard():
+    import pandas as pd
+    
     st.title("Admin Dashboard")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Users", "Candidates", "Electoral Boxes", "Results", "Offline Votes"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["Users", "Candidates", "Electoral Boxes", "Results", "Offline Votes", "Bulk Import", "Performance"])
     
-    with tab1:
+    with tab1, timer("section.admin.users"):
         st.header("Add User")
         new_username = st.text_input("Username", key="new_user")
         new_password = st.text_input("Password", type="password", key="new_pass")
@@ -247,19 +760,9 @@ def admin_dashboard():
             st.write(message)
         
         st.header("Existing Users")
-        users = load_data(USERS_FILE)
-        user_data = []
-        for username, details in users.items():
-            user_data.append({
-                "Username": username,
-                "Role": details["role"],
-                "Created At": details["created_at"]
-            })
-        
-        if user_data:
-            st.dataframe(pd.DataFrame(user_data))
+        paged_table(admin_tables["users"], "users", "Username or role")
     
-    with tab2:
+    with tab2, timer("section.admin.candidates"):
         st.header("Add Candidate")
         candidate_name = st.text_input("Candidate Name")
         candidate_party = st.text_input("Party")
@@ -274,20 +777,9 @@ def admin_dashboard():
                 st.error("All fields are required")
         
         st.header("Existing Candidates")
-        candidates = load_data(CANDIDATES_FILE)
-        candidate_data = []
-        for cid, details in candidates.items():
-            candidate_data.append({
-                "ID": cid,
-                "Name": details["name"],
-                "Party": details["party"],
-                "Category": details.get("category", "Uncategorized")
-            })
-        
-        if candidate_data:
-            st.dataframe(pd.DataFrame(candidate_data))
+        paged_table(admin_tables["candidates"], "candidates", "Name, party or category")
     
-    with tab3:
+    with tab3, timer("section.admin.electoral_boxes"):
         st.header("Add Electoral Box")
         box_name = st.text_input("Box Name")
         box_location = st.text_input("Location")
@@ -298,51 +790,60 @@ def admin_dashboard():
             st.write(message)
         
         st.header("Existing Electoral Boxes")
-        boxes = load_data(ELECTORAL_BOXES_FILE)
-        box_data = []
-        for bid, details in boxes.items():
-            box_data.append({
-                "ID": bid,
-                "Name": details["name"],
-                "Location": details["location"],
-                "Registered Voters": details["registered_voters"]
-            })
-        
-        if box_data:
-            st.dataframe(pd.DataFrame(box_data))
+        paged_table(admin_tables["boxes"], "boxes", "Name or location")
     
-    with tab4:
+    with tab4, timer("section.admin.results"):
         display_results()
+        
+        # Shows whether reruns are served from memory or re-read from disk
+        cache_stats = storage.stats()
+        figure_stats = figure_cache.stats()
+        st.caption(
+            f"Data cache: {cache_stats['hits']} hits, {cache_stats['refreshes']} incremental "
+            f"refreshes, {cache_stats['misses']} full loads. Figures: {figure_stats['hits']} reused, "
+            f"{figure_stats['patches']} patched, {figure_stats['builds']} built"
+        )
     
-    with tab5:
+    with tab5, timer("section.admin.offline_votes"):
         st.header("Manage Offline Votes")
         
         # Show offline votes count
-        offline_votes = load_data(OFFLINE_VOTES_FILE)
-        offline_vote_count = sum(len(votes) for box_id, votes in offline_votes.items())
+        offline_counts = pending_offline_counts()
+        offline_vote_count = sum(offline_counts.values())
         
         st.write(f"Pending offline votes: {offline_vote_count}")
         
         if offline_vote_count > 0:
             if st.button("Sync Offline Votes"):
-                synced = sync_offline_votes()
+                synced = sync_offline_votes(progress=sync_progress_bar())
                 st.success(f"Successfully synced {synced} votes!")
                 # Force refresh
                 st.rerun()
         
+        # Payloads exported by field stations that counted offline elsewhere
+        st.subheader("Apply Sync Payload")
+        payload_file = st.file_uploader("Sync payload from a field station", type=["sync"], key="sync_payload")
+        if payload_file is not None and st.button("Apply Payload"):
+            try:
+                recorded, skipped = apply_sync_payload(payload_file.getvalue())
+            except PayloadError as e:
+                st.error(f"Could not apply {payload_file.name}: {e}")
+            else:
+                st.success(f"Recorded {recorded} votes ({skipped} were already synced)")
+        
         # Show offline votes by box
-        if offline_votes:
+        if offline_counts:
             st.subheader("Offline Votes by Electoral Box")
             offline_box_counts = {}
             
-            for box_id, votes in offline_votes.items():
-                # Get box name
-                boxes = load_data(ELECTORAL_BOXES_FILE)
+            # All box names in one lookup
+            box_rows = admin_tables["boxes"].get().lookup(offline_counts)
+            for box_id, count in offline_counts.items():
                 box_name = f"Unknown Box ({box_id})"
-                if box_id in boxes:
-                    box_name = f"{boxes[box_id]['name']} ({boxes[box_id]['location']})"
+                if box_id in box_rows:
+                    box_name = f"{box_rows[box_id]['Name']} ({box_rows[box_id]['Location']})"
                 
-                offline_box_counts[box_name] = len(votes)
+                offline_box_counts[box_name] = count
             
             offline_box_df = pd.DataFrame([
                 {"Electoral Box": box, "Pending Votes": count}
@@ -350,20 +851,134 @@ def admin_dashboard():
             ])
             
             st.dataframe(offline_box_df)
+    
+    with tab6, timer("section.admin.bulk_import"):
+        st.header("Bulk Import Tally Sheet")
+        st.write(
+            "Upload a whole tally sheet or a file of ballots for one electoral box. "
+            "CSV: `candidate_id,count` rows, or a `candidates` column with `;`-separated IDs per ballot. "
+            "JSON: `{\"counts\": {...}}` or `{\"ballots\": [[...], ...]}`. Use `invalid` for invalid votes."
+        )
+        
+        boxes = load_data(ELECTORAL_BOXES_FILE)
+        if not boxes:
+            st.warning("No electoral boxes have been created yet.")
+        else:
+            import_box_options = {f"{details['name']} ({details['location']})": bid for bid, details in boxes.items()}
+            import_box_name = st.selectbox("Electoral Box", list(import_box_options.keys()), key="import_box")
+            uploaded = st.file_uploader("Tally sheet", type=["csv", "json"], key="import_file")
+            
+            if uploaded is not None and st.button("Import Votes"):
+                try:
+                    votes = parse_vote_upload(uploaded.name, uploaded.getvalue().decode("utf-8"))
+                except (ValueError, KeyError, TypeError) as e:
+                    st.error(f"Could not read {uploaded.name}: {e}")
+                else:
+                    success, message = record_votes_batch(
+                        import_box_options[import_box_name],
+                        votes,
+                        st.session_state.get("username", "admin")
+                    )
+                    if success:
+                        st.success(message)
+                    else:
+                        st.error(message)
+    
+    with tab7:
+        performance_panel()
+
+# Timings, percentiles and I/O per operation from the metrics registry
+def performance_panel():
+    import pandas as pd
+    
+    st.header("Performance")
+    st.write(
+        "Latencies in milliseconds over each operation's last 1024 calls in this "
+        "server process. Bytes include the reads and writes of nested operations."
+    )
+    
+    snapshot = metrics_registry.snapshot()
+    if not snapshot:
+        st.info("No operations recorded yet.")
+    else:
+        performance_df = pd.DataFrame([
+            {
+                "Operation": name,
+                "Count": values["count"],
+                "p50 (ms)": values["p50"] * 1000,
+                "p95 (ms)": values["p95"] * 1000,
+                "p99 (ms)": values["p99"] * 1000,
+                "Total (s)": values["total_seconds"],
+                "Bytes Read": values["bytes_read"],
+                "Bytes Written": values["bytes_written"]
+            }
+            for name, values in snapshot.items()
+        ])
+        st.dataframe(performance_df.round(2), hide_index=True)
+    
+    col1, col2, col3 = st.columns(3)
+    col1.download_button(
+        "Download Prometheus metrics",
+        metrics_registry.to_prometheus(),
+        file_name="election_metrics.prom",
+        mime="text/plain"
+    )
+    col2.download_button(
+        "Download JSON",
+        metrics_registry.to_json(),
+        file_name="election_metrics.json",
+        mime="application/json"
+    )
+    if col3.button("Reset metrics"):
+        metrics_registry.reset()
+        st.rerun()
+    
+    st.subheader("Ballot Store")
+    st.metric("Ballots queued for the store", write_queue.backlog())
+    col1, col2 = st.columns(2)
+    if col1.button("Compact Ballot Store"):
+        with st.spinner("Compacting..."):
+            summary = compact_ballot_store()
+        st.success("Compacted: " + ", ".join(f"{key.replace('_', ' ')} {value}" for key, value in summary.items()))
+    if col2.button("Verify Vote Counts"):
+        with st.spinner("Recounting every ballot..."):
+            ballots, drift = verify_vote_counts()
+        if not drift:
+            st.success(f"Stored counts match all {ballots} ballots.")
+        else:
+            st.error(f"Stored counts drift from the ballots in {len(drift)} places.")
+            st.dataframe(pd.DataFrame([
+                {
+                    "Box ID": row["box_id"],
+                    "Candidate ID": row["candidate_id"],
+                    "Stored": row["stored"],
+                    "Recounted": row["recounted"]
+                }
+                for row in drift
+            ]), hide_index=True)
+    
+    if REPLICA_MODE:
+        leader = aggregator.leader()
+        role = "aggregator" if aggregator.is_leader() else "replica"
+        st.caption(
+            f"Replica mode: this node ({aggregator.node_id}) is a {role}; "
+            f"current aggregator: {leader[0] if leader else 'none'}"
+        )
 
 # Counter dashboard with improved vote entry interface and offline support
+@timed("section.counter")
 def counter_dashboard(username):
     st.title("Vote Counter Dashboard")
     
     # Get electoral boxes
     boxes = load_data(ELECTORAL_BOXES_FILE)
-    candidates = load_data(CANDIDATES_FILE)
+    catalog = candidate_catalog.get()
     
     if not boxes:
         st.warning("No electoral boxes have been created yet.")
         return
 
-    if not candidates:
+    if not catalog:
         st.warning("No candidates have been added yet.")
         return
     
@@ -373,40 +988,98 @@ def counter_dashboard(username):
     
     # If offline mode is active, show banner
     if offline_mode:
-        st.warning("?? OFFLINE MODE ACTIVE: Votes will be stored locally and need to be synced later.", icon="??")
+        st.warning("OFFLINE MODE ACTIVE: Votes will be stored locally and need to be synced later.", icon="⚠️")
     
     # Select box to count
     box_options = {f"{details['name']} ({details['location']})": bid for bid, details in boxes.items()}
     selected_box_name = st.selectbox("Select Electoral Box", list(box_options.keys()))
     selected_box_id = box_options[selected_box_name]
     
-    # Get candidate information and group by category
-    candidate_by_category = {}
-    for cid, details in candidates.items():
-        category = details.get("category", "Uncategorized")
-        if category not in candidate_by_category:
-            candidate_by_category[category] = []
-        
-        candidate_by_category[category].append({
-            "id": cid,
-            "name": details["name"],
-            "party": details["party"],
-            "category": category
-        })
-    
-    # Sort candidates by name within each category
-    for category in candidate_by_category:
-        candidate_by_category[category] = sorted(candidate_by_category[category], key=lambda x: x["name"])
-    
     # Set up session state for tracking selections in current vote
     if "current_selections" not in st.session_state:
         st.session_state.current_selections = set()
     
     # Set up session state for selected category
     if "selected_category" not in st.session_state:
-        categories = list(candidate_by_category.keys())
+        categories = catalog.categories
         st.session_state.selected_category = categories[0] if categories else None
     
+    # Sync offline votes function for counter
+    def sync_votes_counter():
+        synced = sync_offline_votes(progress=sync_progress_bar())
+        st.success(f"Successfully synced {synced} votes!")
+        # Force refresh
+        st.rerun()
+    
+    # Display vote entry interface with buttons
+    st.header("Quick Vote Entry")
+    
+    # If there are offline votes and not in offline mode, show sync button
+    offline_vote_count = sum(pending_offline_counts().values())
+    
+    if offline_vote_count > 0 and not offline_mode:
+        st.warning(f"You have {offline_vote_count} pending offline votes that need syncing.")
+        if st.button("Sync Offline Votes"):
+            sync_votes_counter()
+    
+    # A field station without a link to the main server hands its backlog
+    # over as a file, applied from the admin's Offline Votes tab
+    if offline_vote_count > 0 and offline_mode:
+        if st.button("Prepare Sync Payload"):
+            st.session_state.sync_payload = export_offline_payload()
+        if "sync_payload" in st.session_state:
+            payload, ballots = st.session_state.sync_payload
+            st.download_button(
+                f"Download sync payload ({ballots} votes, {len(payload) / 1024:.0f} KB)",
+                payload,
+                file_name=f"offline_votes_{datetime.now():%Y%m%d_%H%M%S}.sync",
+                mime="application/octet-stream"
+            )
+    
+    # Clicks in the grid only rerun the grid
+    vote_entry_grid(selected_box_id, username, offline_mode)
+    
+    # Show keyboard shortcuts instructions
+    with st.expander("Keyboard Shortcuts"):
+        st.markdown("""
+        For faster vote entry, you can use keyboard shortcuts:
+        - **Enter**: Submit the current vote
+        - **Esc**: Clear all selections
+        - **I**: Mark as invalid vote
+        """)
+        st.info("Note: Click anywhere on the page first to enable keyboard shortcuts")
+    
+    # Add JavaScript for keyboard shortcuts
+    st.markdown("""
+    <script>
+    document.addEventListener('keydown', function(e) {
+        if (e.key === 'Enter') {
+            document.querySelector('button[data-testid="submit_vote"]').click();
+        } else if (e.key === 'Escape') {
+            document.querySelector('button[data-testid="clear_selections"]').click();
+        } else if (e.key === 'i' || e.key === 'I') {
+            document.querySelector('button[data-testid="submit_invalid"]').click();
+        }
+    });
+    </script>
+    """, unsafe_allow_html=True)
+    
+    # Progress and results are separate fragments, so vote entry never
+    # re-renders them; they follow the change feed on their own
+    counting_progress_panel()
+    if st.toggle("Show Results", value=COUNTER_RESULTS, key="counter_show_results"):
+        box_results_panel(selected_box_id, selected_box_name)
+        
+        # Show overall results as well
+        display_results()
+
+# Vote entry grid for one box, rerun on its own when a button is clicked
+@st.fragment
+@timed("section.vote_entry_grid")
+def vote_entry_grid(selected_box_id, username, offline_mode):
+    catalog = candidate_catalog.get()
+    candidate_by_category = catalog.by_category
+    
     # Function to toggle candidate selection
     def toggle_candidate(candidate_id):
         if candidate_id in st.session_state.current_selections:
@@ -417,7 +1090,7 @@ def counter_dashboard(username):
     # Function to submit the current vote
     def submit_vote():
         if not st.session_state.current_selections:
-            st.warning("No candidates selected. Please select at least one candidate or mark as invalid.")
+            st.session_state.vote_entry_notice = ("warning", "No candidates selected. Please select at least one candidate or mark as invalid.")
             return
         
         success = record_single_vote(selected_box_id, list(st.session_state.current_selections), username, offline_mode)
@@ -425,25 +1098,10 @@ def counter_dashboard(username):
             st.session_state.current_selections = set()
             
             if offline_mode:
-                st.success("Vote recorded offline and will be synced later!")
+                st.session_state.vote_entry_notice = ("success", "Vote recorded offline and will be synced later!")
             else:
-                st.success("Vote recorded successfully!")
-                
-                # Update the vote counts display
-                vote_counts = load_data(VOTE_COUNTS_FILE)
-                box_counts = vote_counts.get(selected_box_id, {})
-                
-                # Update counts for all candidates
-                for category in candidate_by_category:
-                    for candidate in candidate_by_category[category]:
-                        st.session_state[f"count_{candidate['id']}"] = box_counts.get(candidate["id"], 0)
-                
-                st.session_state[f"count_invalid"] = box_counts.get("invalid", 0)
-                
-                # Update total count
-                total = sum(box_counts.values())
-                st.session_state["total_count"] = total
-
+                st.session_state.vote_entry_notice = ("success", "Vote recorded successfully!")
+    
     # Function to submit invalid vote
     def submit_invalid():
         success = record_invalid_vote(selected_box_id, username, offline_mode)
@@ -451,61 +1109,39 @@ def counter_dashboard(username):
             st.session_state.current_selections = set()
             
             if offline_mode:
-                st.success("Invalid vote recorded offline and will be synced later!")
+                st.session_state.vote_entry_notice = ("success", "Invalid vote recorded offline and will be synced later!")
             else:
-                st.success("Invalid vote recorded!")
-                
-                # Update the invalid vote count display
-                vote_counts = load_data(VOTE_COUNTS_FILE)
-                box_counts = vote_counts.get(selected_box_id, {})
-                st.session_state[f"count_invalid"] = box_counts.get("invalid", 0)
-                
-                # Update total count
-                total = sum(box_counts.values())
-                st.session_state["total_count"] = total
+                st.session_state.vote_entry_notice = ("success", "Invalid vote recorded!")
     
     # Function to clear selections
     def clear_selections():
         st.session_state.current_selections = set()
-        st.success("Selections cleared!")
-    
-    # Sync offline votes function for counter
-    def sync_votes_counter():
-        synced = sync_offline_votes()
-        st.success(f"Successfully synced {synced} votes!")
-        # Force refresh
-        st.rerun()
-    
-    # Display vote entry interface with buttons
-    st.header("Quick Vote Entry")
-    
-    # Initialize counts in session state
-    vote_counts = load_data(VOTE_COUNTS_FILE)
-    box_counts = vote_counts.get(selected_box_id, {})
+        st.session_state.vote_entry_notice = ("success", "Selections cleared!")
+    
+    # Callbacks leave their message here: elements written from a callback
+    # during a fragment rerun would land outside the fragment
+    notice = st.session_state.pop("vote_entry_notice", None)
+    if notice:
+        kind, message = notice
+        if kind == "warning":
+            st.warning(message)
+        else:
+            st.success(message)
     
-    if "total_count" not in st.session_state:
-        st.session_state["total_count"] = sum(box_counts.values())
+    # Counts come from memory: the running tally plus this process's
+    # ballots still queued for the store, so they include every submit
+    box_counts = write_queue.box_counts(selected_box_id)
     
     # Display current vote count
-    st.subheader(f"Total votes recorded: {st.session_state['total_count']}")
-    
-    # If there are offline votes and not in offline mode, show sync button
-    offline_votes = load_data(OFFLINE_VOTES_FILE)
-    offline_vote_count = sum(len(votes) for box_id, votes in offline_votes.items())
-    
-    if offline_vote_count > 0 and not offline_mode:
-        st.warning(f"You have {offline_vote_count} pending offline votes that need syncing.")
-        if st.button("Sync Offline Votes"):
-            sync_votes_counter()
+    st.subheader(f"Total votes recorded: {sum(box_counts.values())}")
     
     # Display info about current selections
     if st.session_state.current_selections:
-        selected_names = []
-        for cid in st.session_state.current_selections:
-            for category in candidate_by_category:
-                for candidate in candidate_by_category[category]:
-                    if candidate["id"] == cid:
-                        selected_names.append(f"{candidate['name']} ({candidate['party']}) - {category}")
+        selected_names = [
+            catalog.describe(cid)
+            for cid in st.session_state.current_selections
+            if cid in catalog.by_id
+        ]
         
         st.write("Current selection:")
         for name in selected_names:
@@ -516,15 +1152,6 @@ def counter_dashboard(username):
     # Category tabs
     category_tabs = st.tabs(list(candidate_by_category.keys()))
     
-    # Initialize counts for each candidate
-    for category in candidate_by_category:
-        for candidate in candidate_by_category[category]:
-            if f"count_{candidate['id']}" not in st.session_state:
-                st.session_state[f"count_{candidate['id']}"] = box_counts.get(candidate["id"], 0)
-    
-    if f"count_invalid" not in st.session_state:
-        st.session_state[f"count_invalid"] = box_counts.get("invalid", 0)
-    
     # Create a grid layout for candidate buttons within each category tab
     cols_per_row = 3
     for i, category in enumerate(candidate_by_category):
@@ -539,7 +1166,7 @@ def counter_dashboard(username):
                             # Determine button color based on selection state
                             button_key = f"candidate_{candidate['id']}"
                             is_selected = candidate["id"] in st.session_state.current_selections
-                            button_label = f"{candidate['name']}\n({candidate['party']})\nCount: {st.session_state[f'count_{candidate['id']}']}"
+                            button_label = f"{candidate['name']}\n({candidate['party']})\nCount: {box_counts.get(candidate['id'], 0)}"
                             
                             if is_selected:
                                 st.button(
@@ -570,7 +1197,7 @@ def counter_dashboard(username):
     
     with col2:
         st.button(
-            f"Submit Invalid Vote (Count: {st.session_state['count_invalid']})", 
+            f"Submit Invalid Vote (Count: {box_counts.get('invalid', 0)})", 
             key="submit_invalid",
             on_click=submit_invalid
         )
@@ -581,135 +1208,302 @@ def counter_dashboard(username):
             key="clear_selections",
             on_click=clear_selections
         )
-    
-    # Show keyboard shortcuts instructions
-    with st.expander("Keyboard Shortcuts"):
-        st.markdown("""
-        For faster vote entry, you can use keyboard shortcuts:
-        - **Enter**: Submit the current vote
-        - **Esc**: Clear all selections
-        - **I**: Mark as invalid vote
-        """)
-        st.info("Note: Click anywhere on the page first to enable keyboard shortcuts")
-    
-    # Add JavaScript for keyboard shortcuts
-    st.markdown("""
-    <script>
-    document.addEventListener('keydown', function(e) {
-        if (e.key === 'Enter') {
-            document.querySelector('button[data-testid="submit_vote"]').click();
-        } else if (e.key === 'Escape') {
-            document.querySelector('button[data-testid="clear_selections"]').click();
-        } else if (e.key === 'i' || e.key === 'I') {
-            document.querySelector('button[data-testid="submit_invalid"]').click();
-        }
-    });
-    </script>
-    """, unsafe_allow_html=True)
-    
-    # Show current progress
+
+# Counting progress bar
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@timed("section.counting_progress")
+def counting_progress_panel():
     st.header("Counting Progress")
-    progress = get_counting_progress()
+    progress = get_counting_progress(LIVE_REFRESH_SECONDS)
     st.progress(progress / 100)
     st.write(f"{progress:.1f}% of electoral boxes counted")
+
+# Tables and figures of a live results view as last built in this session,
+# by part (tab). Parts the change feed reports as changed are dropped, and
+# everything is dropped when `identity` (catalog, boxes, selected box) moves
+# or the feed resets, so a tick with no relevant change re-sends what was
+# built before and only the changed parts are rebuilt.
+def view_parts(view, identity, update, stale):
+    key = f"results_parts_{view}"
+    cached = st.session_state.get(key)
+    if cached is None or update.reset or cached[0] != identity:
+        cached = st.session_state[key] = (identity, {})
+    parts = cached[1]
+    if update.changed:
+        for label in [label for label in parts if stale(label)]:
+            del parts[label]
+    return parts
+
+# Categories of the candidates the change feed reported
+def changed_categories(catalog, update):
+    if not update.changed:
+        return set()
+    return {catalog.by_id[cid]["category"] for cid in update.candidates if cid in catalog.by_id}
+
+# Show a results part: its table and chart, or `empty` when it has no table
+def render_part(part, empty=None):
+    df, fig = part
+    if df is None:
+        st.info(empty)
+        return
+    st.dataframe(df)
+    if fig is not None:
+        st.plotly_chart(fig)
+
+# Per-category and overall results for one box
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@timed("section.box_results")
+def box_results_panel(selected_box_id, selected_box_name):
+    catalog = candidate_catalog.get()
+    candidate_by_category = catalog.by_category
+    update = results_feed("box")
     
     # Show current results for this electoral box
     st.header(f"Results for {selected_box_name}")
+    if selected_box_id in update.boxes:
+        st.caption(f"New votes since the last refresh (update #{update.sequence})")
+    
+    # Only this box's votes matter here
+    box_changed = selected_box_id in update.boxes
+    categories = changed_categories(catalog, update)
+    parts = view_parts(
+        "box", (catalog, selected_box_id, selected_box_name), update,
+        lambda label: box_changed and (label == "Overall" or label in categories)
+    )
     
     # Create tabs for each category in results
     result_categories = list(candidate_by_category.keys()) + ["Overall"]
-    result_tabs = st.tabs(result_categories)
-    
-    # Initialize result data by category
-    results_by_category = {category: [] for category in candidate_by_category}
-    
-    for category in candidate_by_category:
-        for candidate in candidate_by_category[category]:
-            count = box_counts.get(candidate["id"], 0)
-            results_by_category[category].append({
-                "Candidate": candidate["name"],
-                "Party": candidate["party"],
-                "Category": category,
-                "Votes": count
-            })
-    
-    # Add invalid votes to a general category
-    invalid_votes = {
-        "Candidate": "Invalid Votes",
-        "Party": "N/A",
-        "Category": "Invalid",
-        "Votes": box_counts.get("invalid", 0)
-    }
+    result_tabs = result_views(result_categories, key="box_results_view")
+    
+    # Per-category and overall tables for this box, from the results engine;
+    # computed only if a part has to be rebuilt
+    built = {}
+    def category_tables():
+        if "tables" not in built:
+            built["engine"] = results_engine.get(LIVE_REFRESH_SECONDS)
+            built["tables"] = built["engine"].category_tables(selected_box_id)
+        return built["tables"]
     
     # Display results by category
     for i, category in enumerate(candidate_by_category):
+        if result_tabs[i] is None:
+            continue
+        
         with result_tabs[i]:
-            if results_by_category[category]:
-                category_df = pd.DataFrame(results_by_category[category])
-                st.dataframe(category_df)
+            if category not in parts:
+                category_df = category_tables().get(category)
+                if category_df is not None and not category_df.empty:
+                    fig = None
+                    
+                    # Bar chart of results for this category
+                    if category_df["Votes"].sum() > 0:
+                        fig = figure_cache.bar(
+                            ("box", selected_box_id, category),
+                            category_df, 
+                            x="Candidate", 
+                            y="Votes", 
+                            color="Party", 
+                            title=f"{category} Vote Distribution for {selected_box_name}"
+                        )
+                    parts[category] = (category_df, fig)
+                else:
+                    parts[category] = (None, None)
+            render_part(parts[category], f"No votes recorded for {category} yet.")
+    
+    # Display overall results, invalid votes included
+    if result_tabs[-1] is not None:
+        with result_tabs[-1]:
+            if "Overall" not in parts:
+                category_tables()
+                all_results_df = built["engine"].candidate_table(selected_box_id)
                 
-                # Bar chart of results for this category
-                total_votes_category = sum(c["Votes"] for c in results_by_category[category])
-                if total_votes_category > 0:
-                    fig = px.bar(
-                        category_df, 
-                        x="Candidate", 
-                        y="Votes", 
-                        color="Party", 
-                        title=f"{category} Vote Distribution for {selected_box_name}"
-                    )
-                    st.plotly_chart(fig)
-            else:
-                st.info(f"No votes recorded for {category} yet.")
-    
-    # Display overall results
-    with result_tabs[-1]:
-        # Combine all category results
-        all_results = []
-        for category in results_by_category:
-            all_results.extend(results_by_category[category])
-        
-        # Add invalid votes
-        all_results.append(invalid_votes)
-        
-        if all_results:
-            all_results_df = pd.DataFrame(all_results)
-            st.dataframe(all_results_df)
-            
-            # Bar chart of overall results
-            total_votes = sum(r["Votes"] for r in all_results)
-            if total_votes > 0:
-                fig = px.bar(
-                    all_results_df, 
-                    x="Candidate", 
-                    y="Votes", 
-                    color="Category", 
-                    title=f"Overall Vote Distribution for {selected_box_name}"
-                )
-                st.plotly_chart(fig)
-        else:
-            st.info("No votes recorded yet.")
-    
-    # Show overall results as well
-    display_results()
+                if not all_results_df.empty:
+                    fig = None
+                    
+                    # Bar chart of overall results
+                    if all_results_df["Votes"].sum() > 0:
+                        fig = figure_cache.bar(
+                            ("box", selected_box_id, "Overall"),
+                            all_results_df, 
+                            x="Candidate", 
+                            y="Votes", 
+                            color="Category", 
+                            title=f"Overall Vote Distribution for {selected_box_name}"
+                        )
+                    parts["Overall"] = (all_results_df, fig)
+                else:
+                    parts["Overall"] = (None, None)
+            render_part(parts["Overall"], "No votes recorded yet.")
 
 # Display results and dashboard with category segregation
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@timed("section.overall_results")
 def display_results():
     st.header("Overall Election Results")
+    if REPLICA_MODE:
+        # Every replica shows the aggregator's published results
+        snapshot = snapshot_reader.latest()
+        if snapshot is None:
+            st.info("Results have not been published yet.")
+        else:
+            st.caption(f"Snapshot #{snapshot.version}, published {snapshot.published_at}")
+            snapshot_results(snapshot, "overall_results_view")
+        return
+    
+    update = results_feed("overall")
+    boxes = load_data(ELECTORAL_BOXES_FILE)
+    if update.boxes:
+        updated_names = sorted(boxes[box_id]["name"] for box_id in update.boxes if box_id in boxes)
+        if len(updated_names) > 5:
+            updated_names = updated_names[:5] + [f"{len(updated_names) - 5} more"]
+        st.caption(f"Update #{update.sequence}: new votes from {', '.join(updated_names)}")
     
     # Get total votes by candidate
-    results = get_total_votes()
-    candidates = load_data(CANDIDATES_FILE)
+    results = get_total_votes(LIVE_REFRESH_SECONDS)
+    
+    # Candidates organized by category (shared, read-only)
+    catalog = candidate_catalog.get()
+    candidates_by_category = catalog.by_category
+    
+    total_valid = sum(count for cid, count in results.items() if cid != "invalid")
+    col1, col2 = st.columns(2)
+    col1.metric("Valid votes", total_valid)
+    col2.metric("Invalid votes", results["invalid"])
+    
+    # Running per-category totals from the tally, no table needed
+    category_totals = tally.totals_by_category(LIVE_REFRESH_SECONDS)
+    st.caption(" · ".join(
+        f"{category}: {category_totals.get(category, 0)} votes" for category in candidates_by_category
+    ))
+    
+    # Drop only the tables the changed candidates and boxes appear in
+    categories = changed_categories(catalog, update)
+    stale = {
+        "By Party": bool(categories),
+        "By Electoral Box": bool(update.boxes)
+    }
+    parts = view_parts(
+        "overall", (catalog, storage.version(ELECTORAL_BOXES_FILE)), update,
+        lambda label: stale.get(label, label in categories)
+    )
+    
+    # Tables come from the results engine as column sums and groupbys, and
+    # only when a part has to be rebuilt
+    built = {}
+    def engine():
+        if "engine" not in built:
+            built["engine"] = results_engine.get(LIVE_REFRESH_SECONDS)
+        return built["engine"]
+    
+    result_tabs = result_views(
+        list(candidates_by_category.keys()) + ["By Party", "By Electoral Box"],
+        key="overall_results_view"
+    )
+    
+    for i, category in enumerate(candidates_by_category):
+        if result_tabs[i] is None:
+            continue
+        
+        with result_tabs[i]:
+            if category not in parts:
+                if "tables" not in built:
+                    built["tables"] = engine().category_tables()
+                category_df = built["tables"].get(category)
+                if category_df is not None and category_df["Votes"].sum() > 0:
+                    fig = figure_cache.bar(
+                        ("overall", category),
+                        category_df,
+                        x="Candidate",
+                        y="Votes",
+                        color="Party",
+                        title=f"{category} Results"
+                    )
+                    parts[category] = (category_df, fig)
+                else:
+                    parts[category] = (None, None)
+            render_part(parts[category], f"No votes recorded for {category} yet.")
+    
+    if result_tabs[-2] is not None:
+        with result_tabs[-2]:
+            if "By Party" not in parts:
+                party_df = engine().party_table()
+                fig = None
+                if party_df["Votes"].sum() > 0:
+                    fig = figure_cache.bar(
+                        ("overall", "By Party"), party_df, x="Party", y="Votes", color=None, title="Votes by Party"
+                    )
+                parts["By Party"] = (party_df, fig)
+            render_part(parts["By Party"])
+    
+    if result_tabs[-1] is not None:
+        with result_tabs[-1]:
+            if "By Electoral Box" not in parts:
+                parts["By Electoral Box"] = (engine().box_table(boxes), list(engine().box_ids))
+            box_df, box_ids = parts["By Electoral Box"]
+            # Flag the boxes the change feed reported since the last refresh
+            st.dataframe(box_df.assign(Updated=[box_id in update.boxes for box_id in box_ids]))
+
+# Public results page; reads only the published snapshot, never the vote
+# store, so any number of viewers cost one stat per refresh
+@st.fragment(run_every=LIVE_RUN_EVERY)
+@timed("section.public")
+def public_dashboard():
+    st.title("Election Results")
+    
+    snapshot = snapshot_reader.latest()
+    if snapshot is None:
+        st.info("Results have not been published yet.")
+        return
     
-    # Get categories and organize candidates by category
-    candidates_by_category = {}
-    for cid, details in candidates.items():
-        category = details.get("category", "Uncategorized")
-        if category not in candidates_by_category:
-            candidates_by_category[category] = []
+    st.caption(f"Snapshot #{snapshot.version}, published {snapshot.published_at}")
+    
+    totals = snapshot.totals
+    progress = totals["counted_boxes"] / totals["boxes"] if totals["boxes"] else 0
+    st.progress(min(progress, 1.0))
+    st.write(f"{progress * 100:.1f}% of electoral boxes counted")
+    
+    snapshot_results(snapshot, "public_results_view")
+
+# Vote metrics and results tabs of a published snapshot
+def snapshot_results(snapshot, view_key):
+    totals = snapshot.totals
+    col1, col2 = st.columns(2)
+    col1.metric("Valid votes", totals["valid"])
+    col2.metric("Invalid votes", totals["invalid"])
+    
+    result_tabs = result_views(
+        list(snapshot.categories) + ["By Party", "By Electoral Box"],
+        key=view_key
+    )
+    
+    for i, (category, category_df) in enumerate(snapshot.categories.items()):
+        if result_tabs[i] is None:
+            continue
         
-        candidates_by_category[category].append({
-            "id": cid,
-            "name": details["name"],
-            "party": details["party"]
-        })
\ No newline at end of file
+        with result_tabs[i]:
+            if category_df["Votes"].sum() > 0:
+                st.dataframe(category_df)
+                fig = figure_cache.bar(
+                    ("public", category),
+                    category_df,
+                    x="Candidate",
+                    y="Votes",
+                    color="Party",
+                    title=f"{category} Results"
+                )
+                st.plotly_chart(fig)
+            else:
+                st.info(f"No votes recorded for {category} yet.")
+    
+    if result_tabs[-2] is not None:
+        with result_tabs[-2]:
+            st.dataframe(snapshot.parties)
+            if snapshot.parties["Votes"].sum() > 0:
+                fig = figure_cache.bar(
+                    ("public", "By Party"), snapshot.parties, x="Party", y="Votes", color=None, title="Votes by Party"
+                )
+                st.plotly_chart(fig)
+    
+    if result_tabs[-1] is not None:
+        with result_tabs[-1]:
+            st.dataframe(snapshot.boxes)
@@ -0,0 +1,192 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from compact_ballots import CompactBallots, encode_votes
+
+# Post-election audit queries
+#
+# export_archive() writes every ballot in the main store to the compact
+# columnar format (compact_ballots.py) together with the candidate and box
+# datasets as they were at export time. The queries below memory-map that
+# archive and walk it CHUNK_BALLOTS ballots at a time with NumPy, so a
+# recount or a cross-tab touches each ballot once and holds one chunk of
+# integer arrays in memory, never a Python object per ballot.
+
+CHUNK_BALLOTS = 1_000_000
+
+
+# Write the main store's ballots to an audit archive at `path`
+def export_archive(storage, votes_file, candidates_file, boxes_file, path):
+    return encode_votes(
+        storage.load(votes_file),
+        path,
+        metadata={
+            "candidates": storage.load(candidates_file),
+            "electoral_boxes": storage.load(boxes_file),
+        }
+    )
+
+
+def open_archive(path):
+    return CompactBallots(path, mmap=True)
+
+
+# (ballot codes relative to `start`, candidate codes, weights) for every
+# selection entry of ballots [start, stop)
+def _chunk(archive, start, stop):
+    offsets = archive.columns["selection_offsets"][start:stop + 1]
+    begin, end = int(offsets[0]), int(offsets[-1])
+    ballots = np.repeat(np.arange(stop - start), np.diff(offsets))
+    selection = np.asarray(archive.columns["selection"][begin:end])
+    weights = archive.columns.get("weights")
+    weights = np.ones(end - begin, dtype=np.int64) if weights is None else np.asarray(weights[begin:end])
+    return ballots, selection, weights
+
+
+def _chunks(archive, chunk_ballots):
+    for start in range(0, len(archive), chunk_ballots):
+        yield start, min(start + chunk_ballots, len(archive))
+
+
+# Box x candidate vote counts recomputed from the ballots, as a DataFrame
+# indexed by box ID with one column per candidate ID
+def recount(archive, chunk_ballots=CHUNK_BALLOTS):
+    n_boxes, n_candidates = len(archive.boxes), len(archive.candidates)
+    counts = np.zeros(n_boxes * n_candidates, dtype=np.int64)
+    for start, stop in _chunks(archive, chunk_ballots):
+        ballots, selection, weights = _chunk(archive, start, stop)
+        boxes = np.asarray(archive.columns["box"][start:stop])[ballots].astype(np.int64)
+        counts += np.bincount(
+            boxes * n_candidates + selection, weights=weights, minlength=counts.size
+        ).astype(np.int64)
+    return pd.DataFrame(
+        counts.reshape(n_boxes, n_candidates), index=archive.boxes, columns=archive.candidates
+    )
+
+
+# Rows where the recount disagrees with stored vote counts (vote_counts.json
+# layout): box_id, candidate_id, recounted, stored
+def compare_counts(recounted, vote_counts):
+    stored = pd.DataFrame.from_dict(vote_counts, orient="index").fillna(0).astype(np.int64)
+    recounted, stored = recounted.align(stored, fill_value=0)
+    differences = recounted.ne(stored)
+    rows, columns = np.nonzero(differences.to_numpy())
+    return pd.DataFrame({
+        "box_id": recounted.index[rows],
+        "candidate_id": recounted.columns[columns],
+        "recounted": recounted.to_numpy()[rows, columns],
+        "stored": stored.to_numpy()[rows, columns],
+    })
+
+
+# Codes of the archive's candidates in `category`, per the exported catalog
+def _category_codes(archive, category):
+    candidates = archive.metadata.get("candidates", {})
+    return np.array([
+        code for code, candidate_id in enumerate(archive.candidates)
+        if candidate_id in candidates
+        and candidates[candidate_id].get("category", "Uncategorized") == category
+    ], dtype=np.int64)
+
+
+# 0, 1, .., k0 - 1, 0, 1, .., k1 - 1, ...
+def _ragged_arange(lengths):
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+# How many ballots chose each pair of candidates from two categories: rows
+# are candidates of `category_a`, columns candidates of `category_b`. Tally
+# sheets carry no per-ballot selections and are left out.
+def co_vote_matrix(archive, category_a, category_b, chunk_ballots=CHUNK_BALLOTS):
+    codes_a = _category_codes(archive, category_a)
+    codes_b = _category_codes(archive, category_b)
+    position_a = np.full(len(archive.candidates), -1, dtype=np.int64)
+    position_b = np.full(len(archive.candidates), -1, dtype=np.int64)
+    position_a[codes_a] = np.arange(len(codes_a))
+    position_b[codes_b] = np.arange(len(codes_b))
+    matrix = np.zeros(len(codes_a) * len(codes_b), dtype=np.int64)
+    tally_sheet = archive.columns.get("tally_sheet")
+
+    for start, stop in _chunks(archive, chunk_ballots):
+        ballots, selection, _ = _chunk(archive, start, stop)
+        if tally_sheet is not None:
+            keep = ~np.asarray(tally_sheet[start:stop])[ballots]
+            ballots, selection = ballots[keep], selection[keep]
+
+        in_a = position_a[selection] >= 0
+        in_b = position_b[selection] >= 0
+        ballots_a, a = ballots[in_a], position_a[selection[in_a]]
+        ballots_b, b = ballots[in_b], position_b[selection[in_b]]
+
+        # Entries are grouped by ballot, so each ballot's A entries are one
+        # contiguous run; pair every B entry with every A entry of its ballot
+        count_a = np.bincount(ballots_a, minlength=stop - start)
+        first_a = np.cumsum(count_a) - count_a
+        partners = count_a[ballots_b]
+        pair_a = a[np.repeat(first_a[ballots_b], partners) + _ragged_arange(partners)]
+        pair_b = np.repeat(b, partners)
+        matrix += np.bincount(pair_a * len(codes_b) + pair_b, minlength=matrix.size)
+
+    names = archive.metadata.get("candidates", {})
+
+    def label(code):
+        candidate_id = archive.candidates[code]
+        return names.get(candidate_id, {}).get("name", candidate_id)
+
+    return pd.DataFrame(
+        matrix.reshape(len(codes_a), len(codes_b)),
+        index=[label(code) for code in codes_a],
+        columns=[label(code) for code in codes_b],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ballot audit tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    export_command = subcommands.add_parser("export", help="Write an audit archive of every ballot")
+    export_command.add_argument("--out", default="data/audit")
+
+    recount_command = subcommands.add_parser("recount", help="Recount every box and compare with stored counts")
+    recount_command.add_argument("--archive", default="data/audit")
+
+    for command in (export_command, recount_command):
+        command.add_argument("--storage", choices=["json", "sqlite", "sharded"], default="json")
+        command.add_argument("--data-dir", default="data")
+        command.add_argument("--db", help="SQLite database (default: <data-dir>/election.db)")
+
+    covote_command = subcommands.add_parser("covote", help="Cross-tab the choices of two categories")
+    covote_command.add_argument("--archive", default="data/audit")
+    covote_command.add_argument("category_a")
+    covote_command.add_argument("category_b")
+
+    args = parser.parse_args()
+    if args.command in ("export", "recount"):
+        from compaction import open_storage
+
+        storage = open_storage(args.storage, args.data_dir, args.db)
+
+    if args.command == "export":
+        ballots = export_archive(
+            storage,
+            os.path.join(args.data_dir, "votes.json"),
+            os.path.join(args.data_dir, "candidates.json"),
+            os.path.join(args.data_dir, "electoral_boxes.json"),
+            args.out
+        )
+        print(f"ballots: {ballots}")
+    elif args.command == "recount":
+        recounted = recount(open_archive(args.archive))
+        differences = compare_counts(
+            recounted, storage.load(os.path.join(args.data_dir, "vote_counts.json"))
+        )
+        print(f"boxes: {len(recounted)}, votes: {int(recounted.to_numpy().sum())}")
+        if differences.empty:
+            print("OK: recount matches stored counts")
+        else:
+            print(differences.to_string(index=False))
+    elif args.command == "covote":
+        print(co_vote_matrix(open_archive(args.archive), args.category_a, args.category_b).to_string())
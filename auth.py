@@ -0,0 +1,119 @@
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Password hashing and user lookups
+#
+# Passwords are stored as salted KDF hashes in a self-describing string:
+#
+#   scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+#   pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+#
+# so the cost can be raised later without breaking existing users. Bare
+# SHA-256 hex digests from older users.json files still verify, and
+# verify_password() reports them (and hashes made with other settings) as
+# needing an upgrade, which the app does on the next successful login.
+#
+# PasswordHasher runs the KDF on a small thread pool: hashlib releases the
+# GIL while hashing, and the pool caps how many logins hash at once, so a
+# burst of counters logging in at poll close can't use up every core (or,
+# for scrypt, memory) while the rest of the app waits.
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class KdfSettings:
+    def __init__(self, algorithm="scrypt", n=2 ** 14, r=8, p=1, iterations=600_000):
+        if algorithm not in ("scrypt", "pbkdf2_sha256"):
+            raise ValueError(f"Unknown password KDF: {algorithm}")
+        self.algorithm = algorithm
+        self.n = n
+        self.r = r
+        self.p = p
+        self.iterations = iterations
+
+    # The "$"-separated parameter fields this setting writes
+    def params(self):
+        if self.algorithm == "scrypt":
+            return [str(self.n), str(self.r), str(self.p)]
+        return [str(self.iterations)]
+
+
+def _derive(algorithm, params, password, salt):
+    if algorithm == "scrypt":
+        n, r, p = (int(value) for value in params)
+        # OpenSSL's default 32 MiB cap is too small past n = 2**14
+        maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_BYTES)
+    if algorithm == "pbkdf2_sha256":
+        (iterations,) = params
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, int(iterations), dklen=KEY_BYTES)
+    raise ValueError(f"Unknown password KDF: {algorithm}")
+
+
+def hash_password(password, settings):
+    salt = os.urandom(SALT_BYTES)
+    key = _derive(settings.algorithm, settings.params(), password, salt)
+    return "$".join([settings.algorithm] + settings.params() + [salt.hex(), key.hex()])
+
+
+# (matches, needs_upgrade) for a password against a stored hash
+def verify_password(password, stored, settings):
+    fields = stored.split("$")
+    if len(fields) == 1:
+        # Legacy unsalted SHA-256
+        matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        return matches, True
+
+    algorithm, params, salt, key = fields[0], fields[1:-2], fields[-2], fields[-1]
+    try:
+        derived = _derive(algorithm, params, password, bytes.fromhex(salt))
+    except ValueError:
+        return False, False
+    matches = hmac.compare_digest(derived.hex(), key)
+    return matches, algorithm != settings.algorithm or params != settings.params()
+
+
+class PasswordHasher:
+    def __init__(self, settings, max_workers=2):
+        self.settings = settings
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password")
+        # Verified against for unknown users so a miss costs the same as a hit
+        self._decoy = hash_password(os.urandom(16).hex(), settings)
+
+    def hash(self, password):
+        return self._pool.submit(hash_password, password, self.settings).result()
+
+    def verify(self, password, stored):
+        return self._pool.submit(verify_password, password, stored, self.settings).result()
+
+    def verify_unknown_user(self, password):
+        self.verify(password, self._decoy)
+        return False, False
+
+
+# users.json indexed by username, rebuilt only when the dataset changes or
+# invalidate() is called after a write
+class UserIndex:
+    def __init__(self, storage, users_file):
+        self.storage = storage
+        self.users_file = users_file
+        self._lock = threading.Lock()
+        self._version = None
+        self._users = None
+
+    def invalidate(self):
+        with self._lock:
+            self._users = None
+
+    # User record (shared, read-only) or None
+    def get(self, username):
+        version = self.storage.version(self.users_file)
+        with self._lock:
+            if self._users is None or version != self._version:
+                self._version, users = self.storage.load_versioned(self.users_file)
+                self._users = dict(users)
+            return self._users.get(username)
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Password hashing benchmark
+#
+# Times one hash at several KDF cost settings, then a burst of concurrent
+# logins through PasswordHasher, to pick ELECTION_SCRYPT_N /
+# ELECTION_PBKDF2_ITERATIONS and ELECTION_PASSWORD_WORKERS for the server.
+# Run from the repository root:
+#
+#   python benchmarks/password_bench.py --logins 50 --workers 2
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from auth import KdfSettings, PasswordHasher, hash_password, verify_password
+
+SETTINGS = [
+    KdfSettings("scrypt", n=2 ** 13),
+    KdfSettings("scrypt", n=2 ** 14),
+    KdfSettings("scrypt", n=2 ** 15),
+    KdfSettings("scrypt", n=2 ** 16),
+    KdfSettings("pbkdf2_sha256", iterations=300_000),
+    KdfSettings("pbkdf2_sha256", iterations=600_000),
+    KdfSettings("pbkdf2_sha256", iterations=1_200_000),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password KDF cost benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="hashes per setting")
+    parser.add_argument("--logins", type=int, default=50, help="concurrent logins in the burst")
+    parser.add_argument("--workers", type=int, default=2, help="PasswordHasher pool size")
+    args = parser.parse_args()
+
+    for settings in SETTINGS:
+        stored = hash_password("correct horse", settings)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            verify_password("correct horse", stored, settings)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{settings.algorithm:<14} {'$'.join(settings.params()):<12} {elapsed * 1000:8.1f} ms/verify")
+
+    # Burst of logins from many sessions through the shared pool
+    settings = KdfSettings()
+    hasher = PasswordHasher(settings, max_workers=args.workers)
+    stored = hash_password("correct horse", settings)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.logins) as sessions:
+        list(sessions.map(lambda _: hasher.verify("correct horse", stored), range(args.logins)))
+    elapsed = time.perf_counter() - start
+    print(f"{args.logins} concurrent logins, {args.workers} workers: {elapsed:.2f}s "
+          f"({args.logins / elapsed:.1f} logins/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+# Multi-replica consistency harness
+#
+# Starts several app processes in replica mode on one shared data directory
+# and SQLite store, has every replica record ballots at the same time, kills
+# the aggregator part-way through, and then checks that
+#
+#   - another replica took over the aggregator lease,
+#   - the per-box counts in the store match a recount of the stored ballots,
+#   - every surviving replica's tally matches the store, and
+#   - the aggregator's final published snapshot matches the store.
+#
+# Ballots the killed replica had journaled but not committed are committed by
+# the survivors' write-behind writers. Run from the repository root:
+#
+#   python benchmarks/replica_harness.py --replicas 4 --votes 300
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def replica_env(data_dir, node_id, lease_ttl):
+    os.environ.update({
+        "ELECTION_DATA_DIR": data_dir,
+        "ELECTION_STORAGE": "sqlite",
+        "ELECTION_REPLICAS": "1",
+        "ELECTION_NODE_ID": node_id,
+        "ELECTION_LEASE_TTL": str(lease_ttl),
+        "ELECTION_SNAPSHOT_INTERVAL": "0.5",
+        "STREAMLIT_LOGGER_LEVEL": "error",
+    })
+
+
+def run_replica(replica, data_dir, votes, lease_ttl, started, stop, results):
+    replica_env(data_dir, f"replica-{replica}", lease_ttl)
+    import app
+
+    box_ids = list(app.load_data(app.ELECTORAL_BOXES_FILE))
+    candidate_ids = list(app.load_data(app.CANDIDATES_FILE))
+    rng = random.Random(replica)
+    started.wait()
+    for _ in range(votes):
+        selection = rng.sample(candidate_ids, rng.randint(1, min(3, len(candidate_ids))))
+        app.record_single_vote(rng.choice(box_ids), selection, f"counter{replica}")
+        time.sleep(0.002)  # a counter's pace, so the kill lands mid-run
+    app.write_queue.flush()
+    results.put(("done", replica))
+
+    # Keep serving (and, if elected, aggregating) until the parent is done
+    stop.wait()
+    app.write_queue.flush()
+    app.tally.sync()
+    results.put(("tally", replica, app.tally.totals()))
+
+
+def wait_for(condition, timeout, interval=0.2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = condition()
+        if value:
+            return value
+        time.sleep(interval)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-replica consistency harness")
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--votes", type=int, default=300, help="ballots per replica")
+    parser.add_argument("--boxes", type=int, default=8)
+    parser.add_argument("--candidates", type=int, default=6)
+    parser.add_argument("--lease-ttl", type=float, default=2.0)
+    parser.add_argument("--no-kill", action="store_true", help="don't kill the aggregator")
+    args = parser.parse_args()
+
+    from results_snapshot import SnapshotReader
+    from storage import SqliteStorage
+
+    data_dir = tempfile.mkdtemp(prefix="election-replicas-")
+    os.chdir(data_dir)
+    # The parent sets the election up and checks it straight from the store;
+    # it doesn't load the app, so it never aggregates
+    storage = SqliteStorage(os.path.join(data_dir, "election.db"))
+    snapshot_reader = SnapshotReader(os.path.join(data_dir, "snapshots"))
+    votes_file = os.path.join(data_dir, "votes.json")
+    vote_counts_file = os.path.join(data_dir, "vote_counts.json")
+    storage.save({
+        str(uuid.uuid4()): {"name": f"Candidate {i}", "party": f"Party {i % 3}", "category": f"Category {i % 2}"}
+        for i in range(args.candidates)
+    }, os.path.join(data_dir, "candidates.json"))
+    storage.save({
+        str(uuid.uuid4()): {"name": f"Box {i}", "location": f"Location {i}", "registered_voters": 1000}
+        for i in range(args.boxes)
+    }, os.path.join(data_dir, "electoral_boxes.json"))
+
+    def stored_ballot_count():
+        return sum(len(box_votes) for box_votes in storage.load(votes_file).values())
+
+    context = multiprocessing.get_context("spawn")
+    started = context.Event()
+    stop = context.Event()
+    results = context.Queue()
+    processes = {
+        replica: context.Process(
+            target=run_replica,
+            args=(replica, data_dir, args.votes, args.lease_ttl, started, stop, results)
+        )
+        for replica in range(args.replicas)
+    }
+    for process in processes.values():
+        process.start()
+
+    first_leader = wait_for(lambda: storage.lease_holder("aggregator"), 60)
+    if first_leader is None:
+        sys.exit("FAIL: no replica became the aggregator")
+    print(f"aggregator: {first_leader[0]}")
+    started.set()
+    begin = time.perf_counter()
+
+    killed = None
+    if not args.no_kill:
+        # Kill once about a quarter of the ballots are in
+        quarter = args.replicas * args.votes // 4
+        wait_for(lambda: stored_ballot_count() >= quarter, 60, interval=0.05)
+        killed = int(first_leader[0].rsplit("-", 1)[1])
+        processes[killed].kill()
+        processes[killed].join()
+        print(f"killed {first_leader[0]} mid-run")
+        new_leader = wait_for(
+            lambda: (storage.lease_holder("aggregator") or (first_leader[0],))[0] != first_leader[0]
+            and storage.lease_holder("aggregator"),
+            args.lease_ttl * 5
+        )
+        if not new_leader:
+            sys.exit("FAIL: nobody took over the aggregator lease")
+        print(f"failover to {new_leader[0]}")
+
+    survivors = [replica for replica in processes if replica != killed]
+    done = set()
+    while len(done) < len(survivors):
+        kind, replica, *_ = results.get(timeout=300)
+        done.add(replica)
+    elapsed = time.perf_counter() - begin
+
+    # Ground truth: recount the stored ballots
+    votes = storage.load(votes_file)
+    stored_ballots = sum(len(box_votes) for box_votes in votes.values())
+    recount = {}
+    for box_votes in votes.values():
+        for ballot in box_votes.values():
+            for candidate_id in ballot["candidates"]:
+                recount[candidate_id] = recount.get(candidate_id, 0) + 1
+    store_counts = {}
+    for box_counts in storage.load(vote_counts_file).values():
+        for candidate_id, count in box_counts.items():
+            store_counts[candidate_id] = store_counts.get(candidate_id, 0) + count
+    print(f"{stored_ballots} ballots from {len(processes)} replicas in {elapsed:.2f}s "
+          f"({stored_ballots / elapsed:.0f} ballots/s)")
+
+    failed = False
+    if store_counts != recount:
+        print(f"FAIL: store counts {store_counts} != recount {recount}")
+        failed = True
+    if killed is None and stored_ballots != args.replicas * args.votes:
+        print(f"FAIL: {stored_ballots} ballots stored, expected {args.replicas * args.votes}")
+        failed = True
+
+    # The aggregator's last snapshot must catch up with the store
+    def snapshot_matches():
+        snapshot = snapshot_reader.latest()
+        return snapshot is not None and snapshot.candidate_totals == recount and snapshot
+    snapshot = wait_for(snapshot_matches, args.lease_ttl * 5 + 10)
+    if snapshot:
+        print(f"snapshot #{snapshot.version} matches the store")
+    else:
+        latest = snapshot_reader.latest()
+        print(f"FAIL: latest snapshot {latest.candidate_totals if latest else None} != {recount}")
+        failed = True
+
+    stop.set()
+    for _ in survivors:
+        kind, replica, totals = results.get(timeout=60)
+        if totals != recount:
+            print(f"FAIL: replica-{replica} tally {totals} != {recount}")
+            failed = True
+    for process in processes.values():
+        process.join()
+
+    if failed:
+        sys.exit(1)
+    print(f"OK: {len(survivors)} replicas, store, tallies and snapshot agree ({data_dir})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+# Results engine benchmark
+#
+# Compares the dict-loop results path (sum vote_counts per candidate, build
+# per-category row lists, one DataFrame per tab) with the vectorized
+# ResultsEngine on a synthetic election. Run from the repository root:
+#
+#   python benchmarks/results_engine_bench.py --boxes 10000 --candidates 500
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from catalog import CandidateCatalog
+from results_engine import ResultsEngine
+
+
+def synthetic_election(n_boxes, n_candidates, n_categories, seed=0):
+    rng = random.Random(seed)
+    candidates = {
+        f"cand-{i}": {
+            "name": f"Candidate {i:04d}",
+            "party": f"Party {i % 12}",
+            "category": f"Category {i % n_categories}"
+        }
+        for i in range(n_candidates)
+    }
+    candidate_ids = list(candidates) + ["invalid"]
+    vote_counts = {
+        f"box-{b}": {cid: rng.randint(0, 50) for cid in candidate_ids}
+        for b in range(n_boxes)
+    }
+    return candidates, vote_counts
+
+
+# The pre-engine path: nested dict loops, then row-by-row DataFrames
+def dict_loop_results(candidates, vote_counts):
+    results = {candidate_id: 0 for candidate_id in candidates}
+    results["invalid"] = 0
+    for box_id, box_votes in vote_counts.items():
+        for candidate_id, count in box_votes.items():
+            if candidate_id in results:
+                results[candidate_id] += count
+
+    results_by_category = {}
+    for cid, details in candidates.items():
+        results_by_category.setdefault(details["category"], []).append({
+            "Candidate": details["name"],
+            "Party": details["party"],
+            "Category": details["category"],
+            "Votes": results[cid]
+        })
+    tables = {category: pd.DataFrame(rows) for category, rows in results_by_category.items()}
+
+    box_rows = [
+        {"Electoral Box": box_id, "Total Votes": sum(box_votes.values())}
+        for box_id, box_votes in vote_counts.items()
+    ]
+    tables["By Box"] = pd.DataFrame(box_rows)
+    return tables
+
+
+def engine_results(engine):
+    tables = dict(engine.category_tables())
+    tables["Overall"] = engine.candidate_table()
+    tables["By Party"] = engine.party_table()
+    tables["By Category"] = engine.category_totals()
+    return tables
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dict-loop vs vectorized results benchmark")
+    parser.add_argument("--boxes", type=int, default=10000)
+    parser.add_argument("--candidates", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    candidates, vote_counts = synthetic_election(args.boxes, args.candidates, args.categories)
+    catalog = CandidateCatalog(candidates)
+    print(f"{args.boxes} boxes x {args.candidates} candidates "
+          f"({args.boxes * (args.candidates + 1):,} counts)")
+
+    loop_time, loop_tables = timed(lambda: dict_loop_results(candidates, vote_counts), args.repeat)
+    print(f"dict loops + row DataFrames:   {loop_time * 1000:9.1f} ms per rerun")
+
+    build_time, engine = timed(lambda: ResultsEngine(catalog, vote_counts.keys(), vote_counts), 1)
+    print(f"engine build (once per epoch): {build_time * 1000:9.1f} ms")
+
+    query_time, engine_tables = timed(lambda: engine_results(engine), args.repeat)
+    print(f"engine tables:                 {query_time * 1000:9.1f} ms per rerun")
+
+    box_time, _ = timed(lambda: engine.box_table({}), args.repeat)
+    print(f"engine per-box table:          {box_time * 1000:9.1f} ms")
+
+    # Same totals either way
+    loop_total = sum(int(table["Votes"].sum()) for name, table in loop_tables.items() if name != "By Box")
+    engine_total = int(engine_tables["Overall"]["Votes"].sum()) - int(engine_tables["Overall"]["Votes"].iloc[-1])
+    assert loop_total == engine_total, (loop_total, engine_total)
+
+    box_id = next(iter(vote_counts))
+    apply_time, _ = timed(lambda: engine.apply(box_id, {"cand-0": 1, "cand-1": 1}), args.repeat)
+    print(f"engine apply one ballot:       {apply_time * 1e6:9.1f} us")
+
+    print(f"speedup per rerun: {loop_time / query_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# End-to-end scale benchmark
+#
+# Builds a synthetic election (synthetic.py) in a fresh data directory, then
+# drives the real app headlessly: live record_single_vote calls, an offline
+# backlog through sync_offline_votes, repeated get_total_votes /
+# get_counting_progress reads, and the admin, counter and public pages run
+# through Streamlit's AppTest. Each phase reports throughput or latency and
+# peak memory (RSS, plus Python allocations with --tracemalloc).
+#
+# Results can be saved as a baseline and later runs compared against it;
+# a phase that is more than --tolerance slower (or bigger) than its
+# baseline fails the run. Baselines are recorded locally, per machine, in
+# benchmarks/baselines.json, which is not committed: none ships with the
+# repository, so record one on the hardware the election will run on before
+# comparing. A run without a baseline only reports its numbers; it is not a
+# pass. Run from the repository root:
+#
+#   python benchmarks/scale_bench.py --scenario small --save-baseline
+#   python benchmarks/scale_bench.py --scenario small   # compare
+#   python benchmarks/scale_bench.py --boxes 5000 --ballots 500000 --backend sqlite
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from synthetic import generate, make_ballot
+
+BASELINE_FILE = os.path.join(BENCH_DIR, "baselines.json")
+
+SCENARIOS = {
+    "small": {"boxes": 20, "candidates": 12, "categories": 3, "ballots": 2_000, "offline": 500, "live": 200},
+    "medium": {"boxes": 500, "candidates": 60, "categories": 4, "ballots": 50_000, "offline": 5_000, "live": 500},
+    "large": {"boxes": 5_000, "candidates": 300, "categories": 6, "ballots": 500_000, "offline": 20_000, "live": 1_000},
+}
+
+# Result keys where a bigger number is better; everything else is a cost
+HIGHER_IS_BETTER = ("per_second",)
+# Absolute differences below these are timer / allocator noise, not regressions
+NOISE_FLOOR = {"seconds": 0.05, "p50_ms": 1.0, "p95_ms": 2.0, "peak_rss_mb": 20.0, "python_peak_mb": 5.0}
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Phase:
+    def __init__(self, results, name, trace_memory):
+        self.results = results
+        self.name = name
+        self.trace_memory = trace_memory
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            return False
+        result = self.results.setdefault(self.name, {})
+        result["seconds"] = time.perf_counter() - self.start
+        result["peak_rss_mb"] = peak_rss_mb()
+        if self.trace_memory:
+            result["python_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        return False
+
+
+# Page functions for AppTest; each imports the already loaded app module
+def admin_page():
+    import app
+    app.admin_dashboard()
+
+
+def counter_page():
+    import app
+    app.counter_dashboard("counter0")
+
+
+def public_page():
+    import app
+    app.public_dashboard()
+
+
+def run(config, trace_memory):
+    os.environ["ELECTION_STORAGE"] = config["backend"]
+    # Bare-mode calls outside a script run warn on every st.* call
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    workdir = tempfile.mkdtemp(prefix="election-bench-")
+    os.chdir(workdir)
+    if trace_memory:
+        tracemalloc.start()
+
+    import app
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    with Phase(results, "generate", trace_memory):
+        box_ids, by_category = generate(
+            app, config["boxes"], config["candidates"], config["categories"],
+            config["ballots"], config["offline"], seed=config["seed"]
+        )
+
+    # Fold every seeded ballot into the tally, as the first read after a
+    # restart would (get_total_votes may serve a tally up to
+    # LIVE_REFRESH_SECONDS old)
+    with Phase(results, "cold_tally", trace_memory):
+        app.tally.sync()
+
+    rng = random.Random(config["seed"] + 1)
+    live = [(rng.choice(box_ids), make_ballot(rng, by_category)) for _ in range(config["live"])]
+    latencies = []
+    with Phase(results, "record_single_vote", trace_memory):
+        for box_id, selection in live:
+            start = time.perf_counter()
+            app.record_single_vote(box_id, selection, "bench")
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    results["record_single_vote"]["per_second"] = config["live"] / results["record_single_vote"]["seconds"]
+    results["record_single_vote"]["p50_ms"] = latencies[len(latencies) // 2] * 1000
+    results["record_single_vote"]["p95_ms"] = latencies[int(len(latencies) * 0.95)] * 1000
+
+    # With write-behind on, record_single_vote only journals the ballot;
+    # this is how long the writer takes to get the rest into the store
+    with Phase(results, "write_behind_flush", trace_memory):
+        app.write_queue.flush()
+
+    with Phase(results, "sync_offline_votes", trace_memory):
+        synced = app.sync_offline_votes()
+    results["sync_offline_votes"]["per_second"] = synced / results["sync_offline_votes"]["seconds"]
+
+    reads = 200
+    with Phase(results, "warm_reads", trace_memory):
+        for _ in range(reads):
+            app.get_total_votes()
+            app.get_counting_progress()
+    results["warm_reads"]["per_second"] = reads / results["warm_reads"]["seconds"]
+
+    for name, page in (("admin_page", admin_page), ("counter_page", counter_page), ("public_page", public_page)):
+        test = AppTest.from_function(page, default_timeout=600)
+        with Phase(results, f"{name}_first", trace_memory):
+            test.run()
+        if test.exception:
+            raise RuntimeError(f"{name} raised: {test.exception[0].value}")
+        with Phase(results, f"{name}_rerun", trace_memory):
+            test.run()
+
+    # Sanity check: every ballot made it into the totals
+    expected = config["ballots"] + config["live"] + config["offline"]
+    stored = sum(len(box_votes) for box_votes in app.load_data(app.VOTES_FILE).values())
+    if stored != expected:
+        raise RuntimeError(f"{stored} ballots stored, expected {expected}")
+
+    return results, workdir
+
+
+# Phases worse than baseline by more than `tolerance`, as readable lines
+def compare(results, baseline, tolerance):
+    regressions = []
+    for phase, values in results.items():
+        for key, value in values.items():
+            reference = baseline.get(phase, {}).get(key)
+            if not reference:
+                continue
+            if key in HIGHER_IS_BETTER:
+                worse = value < reference * (1 - tolerance)
+            else:
+                worse = value > reference * (1 + tolerance) and value - reference > NOISE_FLOOR.get(key, 0)
+            if worse:
+                regressions.append(f"{phase}.{key}: {value:.3f} vs baseline {reference:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic election scale benchmark")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="small")
+    for key in ("boxes", "candidates", "categories", "ballots", "offline", "live"):
+        parser.add_argument(f"--{key}", type=int, help=f"override the scenario's {key}")
+    parser.add_argument("--backend", choices=["json", "sqlite", "sharded"], default="json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace Python allocations (slower)")
+    parser.add_argument("--baseline", default=BASELINE_FILE,
+                        help="this machine's baselines file (recorded locally, not committed)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="record this run as the local baseline for its scenario and backend")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    config = dict(SCENARIOS[args.scenario])
+    for key in config:
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    config["backend"] = args.backend
+    config["seed"] = args.seed
+    # Baselines are kept per scenario, backend and size; tracing slows
+    # everything down, so traced runs only compare with traced baselines
+    name = f"{args.scenario}-{args.backend}-" + "-".join(str(config[key]) for key in sorted(SCENARIOS["small"]))
+    if args.tracemalloc:
+        name += "-traced"
+
+    results, workdir = run(config, args.tracemalloc)
+
+    print(f"{name} ({workdir})")
+    for phase, values in results.items():
+        line = f"  {phase:<24} {values['seconds'] * 1000:10.1f} ms  rss {values['peak_rss_mb']:7.1f} MB"
+        if "python_peak_mb" in values:
+            line += f"  py {values['python_peak_mb']:7.1f} MB"
+        if "per_second" in values:
+            line += f"  {values['per_second']:10.1f}/s"
+        print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"name": name, "config": config, "results": results}, f, indent=2)
+
+    try:
+        with open(args.baseline, "r") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    if args.save_baseline:
+        baselines[name] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline {name} to {args.baseline}")
+    elif name in baselines:
+        regressions = compare(results, baselines[name], args.tolerance)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"OK: within {args.tolerance:.0%} of baseline {name}")
+    else:
+        print(f"No local baseline for {name} in {args.baseline}; nothing was compared. "
+              "Run with --save-baseline on this machine to record one")
+
+
+if __name__ == "__main__":
+    main()
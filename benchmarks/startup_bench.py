@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Import-time and cold-start benchmark
+#
+# Every measurement runs in a fresh Python process, since imports and
+# st.cache_resource objects are per process:
+#
+#   - import_streamlit: `import streamlit` alone, the floor nothing in the
+#     app can go below
+#   - import_app: `import app` on top of that (module-level setup included)
+#   - fresh_import / fresh_publish: `import app` on an empty data directory,
+#     and the time until the process, as the aggregator, has published the
+#     first results snapshot; the heavy modules listed are those loaded once
+#     it has, which should be none (snapshots are built without pandas)
+#   - <page>_first: the first AppTest run of a page in a new process, i.e.
+#     what the first visitor after a restart waits for; <page>_rerun is the
+#     run after it. Set ELECTION_COUNTER_RESULTS=0 to measure the counter
+#     page without its results panels.
+#
+# Each is repeated --repeat times and the median kept. For every page the
+# heavy modules it loaded (pandas, plotly.express) are listed as well, so a
+# stray top-level import shows up even when timings are noisy. Baselines
+# are recorded locally per machine in baselines.json, next to
+# scale_bench.py's, and are not committed. Run from the repository root:
+#
+#   python benchmarks/startup_bench.py --save-baseline
+#   python benchmarks/startup_bench.py   # compare
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from scale_bench import BASELINE_FILE, compare
+
+HEAVY_MODULES = ("pandas", "plotly.express")
+PAGES = ("counter", "admin", "public")
+
+
+def child_env(backend):
+    env = dict(os.environ)
+    env.update({
+        "ELECTION_STORAGE": backend,
+        "STREAMLIT_LOGGER_LEVEL": "error",
+        "PYTHONPATH": os.pathsep.join([REPO_ROOT, BENCH_DIR, env.get("PYTHONPATH", "")]),
+    })
+    return env
+
+
+# Run `--child phase` in a new process in `workdir`; returns its JSON result
+def run_child(phase, workdir, backend):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", phase],
+        cwd=workdir, env=child_env(backend), capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def loaded_heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+# Page functions for AppTest, as in scale_bench.py
+def counter_page():
+    import app
+    app.counter_dashboard("counter0")
+
+
+def admin_page():
+    import app
+    app.admin_dashboard()
+
+
+def public_page():
+    import app
+    app.public_dashboard()
+
+
+def child(phase):
+    if phase == "setup":
+        import app
+        from synthetic import generate
+        generate(app, boxes=50, candidates=24, categories=3, ballots=5_000, offline=0)
+        app.write_queue.flush()
+        # Published results in place, as on a server being restarted
+        app.snapshot_publisher.publish()
+        return {}
+
+    start = time.perf_counter()
+    import streamlit
+    import_streamlit = time.perf_counter() - start
+    if phase == "fresh":
+        start = time.perf_counter()
+        import app
+        import_app = time.perf_counter() - start
+        latest = os.path.join(app.SNAPSHOT_DIR, "latest.json")
+        while not os.path.exists(latest):
+            if time.perf_counter() - start > 60:
+                raise RuntimeError("no snapshot published within 60s")
+            time.sleep(0.01)
+        return {
+            "fresh_import": import_app,
+            "fresh_publish": time.perf_counter() - start,
+            "modules": loaded_heavy_modules(),
+        }
+    if phase == "import":
+        start = time.perf_counter()
+        import app
+        return {
+            "import_streamlit": import_streamlit,
+            "import_app": time.perf_counter() - start,
+            "modules": loaded_heavy_modules(),
+        }
+
+    from streamlit.testing.v1 import AppTest
+    test = AppTest.from_function(globals()[f"{phase}_page"], default_timeout=120)
+    start = time.perf_counter()
+    test.run()
+    first = time.perf_counter() - start
+    if test.exception:
+        raise RuntimeError(f"{phase} page raised: {test.exception[0].value}")
+    modules = loaded_heavy_modules()
+    start = time.perf_counter()
+    test.run()
+    return {"first": first, "rerun": time.perf_counter() - start, "modules": modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and cold-start benchmark")
+    parser.add_argument("--backend", choices=["json", "sqlite", "sharded"], default="json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_FILE,
+                        help="this machine's baselines file (recorded locally, not committed)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="record this run as the local baseline for its backend")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="election-startup-")
+    run_child("setup", workdir, args.backend)
+
+    samples, modules = {}, {}
+    for _ in range(args.repeat):
+        result = run_child("fresh", tempfile.mkdtemp(prefix="election-fresh-"), args.backend)
+        for key in ("fresh_import", "fresh_publish"):
+            samples.setdefault(key, []).append(result[key])
+        modules["fresh_publish"] = result["modules"]
+        result = run_child("import", workdir, args.backend)
+        for key in ("import_streamlit", "import_app"):
+            samples.setdefault(key, []).append(result[key])
+        modules["import_app"] = result["modules"]
+        for page in PAGES:
+            result = run_child(page, workdir, args.backend)
+            samples.setdefault(f"{page}_first", []).append(result["first"])
+            samples.setdefault(f"{page}_rerun", []).append(result["rerun"])
+            modules[f"{page}_first"] = result["modules"]
+    results = {phase: {"seconds": statistics.median(values)} for phase, values in samples.items()}
+
+    name = f"startup-{args.backend}"
+    if os.environ.get("ELECTION_COUNTER_RESULTS", "1") != "1":
+        name += "-counter-results-off"
+    print(f"{name} ({workdir}, median of {args.repeat})")
+    for phase, values in results.items():
+        loaded = ", ".join(modules.get(phase, [])) or "-"
+        print(f"  {phase:<20} {values['seconds'] * 1000:10.1f} ms  heavy modules: {loaded}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"name": name, "results": results, "modules": modules}, f, indent=2)
+
+    try:
+        with open(args.baseline, "r") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    if args.save_baseline:
+        baselines[name] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baseline {name} to {args.baseline}")
+    elif name in baselines:
+        regressions = compare(results, baselines[name], args.tolerance)
+        if regressions:
+            print("REGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"OK: within {args.tolerance:.0%} of baseline {name}")
+    else:
+        print(f"No local baseline for {name} in {args.baseline}; nothing was compared. "
+              "Run with --save-baseline on this machine to record one")
+
+
+if __name__ == "__main__":
+    main()
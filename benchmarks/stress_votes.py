@@ -0,0 +1,137 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Stress test for concurrent vote recording
+#
+# Starts N threads or processes that all call record_single_vote against one
+# fresh data directory, then checks that every ballot and every count made it
+# to the store. Run from the repository root:
+#
+#   python benchmarks/stress_votes.py --workers 8 --votes 200 --mode processes
+#   python benchmarks/stress_votes.py --offline   # stress the offline log
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+# Ballots a worker will record: deterministic so the parent can add them up
+def worker_ballots(worker, votes, box_ids, candidate_ids):
+    rng = random.Random(worker)
+    ballots = []
+    for _ in range(votes):
+        box_id = rng.choice(box_ids)
+        selection = rng.sample(candidate_ids, rng.randint(1, min(3, len(candidate_ids))))
+        ballots.append((box_id, selection))
+    return ballots
+
+
+def run_worker(worker, votes, box_ids, candidate_ids, offline_mode, barrier):
+    import app
+
+    ballots = worker_ballots(worker, votes, box_ids, candidate_ids)
+    # Start everyone together so the timing excludes process start-up
+    barrier.wait()
+    for box_id, selection in ballots:
+        app.record_single_vote(box_id, selection, f"counter{worker}", offline_mode)
+    # Queued ballots are committed by a daemon thread; let it finish
+    app.write_queue.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent record_single_vote stress test")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--votes", type=int, default=100, help="ballots per worker")
+    parser.add_argument("--mode", choices=["threads", "processes"], default="threads")
+    parser.add_argument("--boxes", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=6)
+    parser.add_argument("--offline", action="store_true", help="record in offline mode, then sync")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="election-stress-")
+    os.chdir(workdir)
+
+    import app
+
+    app.initialize_data_files()
+    for i in range(args.candidates):
+        app.add_candidate(f"Candidate {i}", f"Party {i % 3}", f"Category {i % 2}")
+    for i in range(args.boxes):
+        app.add_electoral_box(f"Box {i}", f"Location {i}", 1000)
+
+    box_ids = list(app.load_data(app.ELECTORAL_BOXES_FILE))
+    candidate_ids = list(app.load_data(app.CANDIDATES_FILE))
+
+    if args.mode == "threads":
+        barrier = threading.Barrier(args.workers + 1)
+    else:
+        context = multiprocessing.get_context("spawn")
+        barrier = context.Barrier(args.workers + 1)
+
+    worker_args = [
+        (worker, args.votes, box_ids, candidate_ids, args.offline, barrier)
+        for worker in range(args.workers)
+    ]
+
+    if args.mode == "threads":
+        threads = [threading.Thread(target=run_worker, args=a) for a in worker_args]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+    else:
+        processes = [context.Process(target=run_worker, args=a) for a in worker_args]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for process in processes:
+            process.join()
+            if process.exitcode != 0:
+                sys.exit(f"worker exited with code {process.exitcode}")
+    elapsed = time.perf_counter() - start
+
+    total_ballots = args.workers * args.votes
+    print(f"{args.mode}: {args.workers} workers x {args.votes} ballots in {elapsed:.2f}s "
+          f"({total_ballots / elapsed:.0f} ballots/s)")
+
+    if args.offline:
+        pending = sum(app.pending_offline_counts().values())
+        print(f"offline ballots stored: {pending} / {total_ballots}")
+        if pending != total_ballots:
+            sys.exit("FAIL: offline ballots were lost")
+        app.sync_offline_votes()
+
+    expected = {candidate_id: 0 for candidate_id in candidate_ids}
+    for worker, votes, *_ in worker_args:
+        for _, selection in worker_ballots(worker, votes, box_ids, candidate_ids):
+            for candidate_id in selection:
+                expected[candidate_id] += 1
+
+    votes = app.load_data(app.VOTES_FILE)
+    stored_ballots = sum(len(box_votes) for box_votes in votes.values())
+    totals = app.get_total_votes()
+
+    failed = False
+    if stored_ballots != total_ballots:
+        print(f"FAIL: {stored_ballots} ballots stored, expected {total_ballots}")
+        failed = True
+    for candidate_id, count in expected.items():
+        if totals.get(candidate_id, 0) != count:
+            print(f"FAIL: {candidate_id} has {totals.get(candidate_id, 0)} votes, expected {count}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print(f"OK: {stored_ballots} ballots, totals exact ({workdir})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import threading
+
+# Candidate lookups shared across sessions
+#
+# CandidateCatalog indexes candidates.json once: by ID, by category (sorted
+# by name, categories in the order they first appear) and by party.
+# CatalogCache rebuilds it only when the candidates dataset's version
+# changes, so reruns get the same immutable catalog back. Callers must not
+# modify the lists and dicts it hands out.
+
+
+class CandidateCatalog:
+    def __init__(self, candidates):
+        self.by_id = {}
+        self.by_category = {}
+        self.by_party = {}
+
+        for cid, details in candidates.items():
+            category = details.get("category", "Uncategorized")
+            candidate = {
+                "id": cid,
+                "name": details["name"],
+                "party": details["party"],
+                "category": category
+            }
+            self.by_id[cid] = candidate
+            self.by_category.setdefault(category, []).append(candidate)
+            self.by_party.setdefault(candidate["party"], []).append(candidate)
+
+        # Sort candidates by name within each category and party
+        for grouping in (self.by_category, self.by_party):
+            for key in grouping:
+                grouping[key] = sorted(grouping[key], key=lambda x: x["name"])
+
+        self.categories = list(self.by_category.keys())
+
+    def __len__(self):
+        return len(self.by_id)
+
+    # "Name (Party) - Category" for a candidate ID, as shown in selections
+    def describe(self, candidate_id):
+        candidate = self.by_id.get(candidate_id)
+        if candidate is None:
+            return None
+        return f"{candidate['name']} ({candidate['party']}) - {candidate['category']}"
+
+
+class CatalogCache:
+    def __init__(self, storage, candidates_file):
+        self.storage = storage
+        self.candidates_file = candidates_file
+        self._lock = threading.Lock()
+        self._version = None
+        self._catalog = None
+
+    def get(self):
+        version = self.storage.version(self.candidates_file)
+        with self._lock:
+            if self._catalog is None or version != self._version:
+                self._version, candidates = self.storage.load_versioned(self.candidates_file)
+                self._catalog = CandidateCatalog(candidates)
+            return self._catalog
@@ -0,0 +1,45 @@
+# Live results subscriptions
+#
+# The tally's change log is the feed: every ballot folded into it gets the
+# next sequence number (tally.generation) and carries its per-box deltas.
+# A Subscription remembers the last position one viewer has seen and poll()
+# tells it which boxes and candidates changed since then. Polls share the
+# tally's sync, so with max_age hundreds of viewers cost one check of the
+# store per interval and the rest is in-memory. If a viewer falls behind the
+# change log, or the tally is rebuilt, the update comes back with `reset`
+# set and everything must be redrawn.
+
+
+class FeedUpdate:
+    def __init__(self, sequence, boxes, candidates, reset=False):
+        self.sequence = sequence
+        self.boxes = boxes
+        self.candidates = candidates
+        self.reset = reset
+
+    @property
+    def changed(self):
+        return self.reset or bool(self.boxes)
+
+
+class Subscription:
+    def __init__(self, tally):
+        self.tally = tally
+        self.epoch = None
+        self.sequence = None
+
+    def poll(self, max_age=0):
+        changes = None
+        if self.epoch is not None:
+            changes = self.tally.changes_since(self.epoch, self.sequence, max_age)
+        if changes is None:
+            self.epoch, self.sequence = self.tally.position(max_age)
+            return FeedUpdate(self.sequence, set(), set(), reset=True)
+
+        self.epoch, self.sequence, deltas = changes
+        boxes = set()
+        candidates = set()
+        for _, box_id, box_deltas in deltas:
+            boxes.add(box_id)
+            candidates.update(candidate_id for candidate_id, count in box_deltas.items() if count)
+        return FeedUpdate(self.sequence, boxes, candidates)
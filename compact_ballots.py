@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# Compact columnar ballot format
+#
+# A directory of NumPy .npy columns plus meta.json, so every column can be
+# memory-mapped and scanned without building a Python object per ballot.
+# Candidates, boxes and users are interned: meta.json holds each table once
+# and the columns hold small integer codes into it.
+#
+#   box.npy                uint32 box code per ballot
+#   user.npy               uint32 user code per ballot
+#   recorded_at.npy        int64 microseconds since 1970-01-01, -1 if missing
+#   vote_id.npy            (n, 16) uint8 UUID bytes
+#   selection_offsets.npy  int64, n + 1: ballot i's candidates are
+#   selection.npy          selection[offsets[i]:offsets[i + 1]] (uint16 codes,
+#                          uint32 past 65535 candidates)
+#
+# Optional columns, written only when some ballot needs them:
+#
+#   weights.npy            int32 per selection entry; tally sheets ("counts"
+#                          records) store each candidate's count here, plain
+#                          ballots are weight 1 when the column is absent
+#   tally_sheet.npy        bool per ballot, True for "counts" records
+#   vote_id_ref.npy        int32 per ballot, index into meta "vote_ids" for
+#                          IDs that aren't canonical UUIDs, else -1
+#
+# encode() can also store caller metadata (e.g. the candidate and box
+# datasets at export time) in meta.json, exposed as CompactBallots.metadata.
+#
+# Timestamps are the naive local ISO strings the app writes; aware ones are
+# kept as UTC. encode()/CompactBallots.records() and encode_votes()/
+# decode_votes() convert to and from the journal record and votes.json
+# layouts.
+
+FORMAT = 1
+META_FILE = "meta.json"
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+# Small integer codes for repeated values, in first-seen order
+class Interner:
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+# Microseconds since the epoch for an ISO timestamp, -1 for None
+def timestamp(value):
+    if value is None:
+        return -1
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+# Inverse of timestamp()
+def isoformat(value):
+    if value < 0:
+        return None
+    return (_EPOCH + timedelta(microseconds=int(value))).isoformat()
+
+
+# 16 UUID bytes for a canonical UUID string, else None
+def vote_key(vote_id):
+    try:
+        key = uuid.UUID(vote_id)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return key.bytes if str(key) == vote_id else None
+
+
+# Write journal-style records ({"box_id", "vote_id", "candidates" or
+# "counts", "recorded_by", "recorded_at"}) to `path`, replacing it
+def encode(records, path, metadata=None):
+    candidates, boxes, users, extra_ids = Interner(), Interner(), Interner(), Interner()
+    box, user, recorded_at, vote_keys, vote_refs = [], [], [], [], []
+    offsets, selection, weights, tally_sheet = [0], [], [], []
+
+    for record in records:
+        box.append(boxes.code(record["box_id"]))
+        user.append(users.code(record.get("recorded_by")))
+        recorded_at.append(timestamp(record.get("recorded_at")))
+
+        key = vote_key(record["vote_id"])
+        vote_keys.append(key or bytes(16))
+        vote_refs.append(-1 if key else extra_ids.code(record["vote_id"]))
+
+        if "counts" in record:
+            entries = record["counts"].items()
+            tally_sheet.append(True)
+        else:
+            entries = ((candidate_id, 1) for candidate_id in record["candidates"])
+            tally_sheet.append(False)
+        for candidate_id, count in entries:
+            selection.append(candidates.code(candidate_id))
+            weights.append(count)
+        offsets.append(len(selection))
+
+    selection_type = np.uint16 if len(candidates.values) <= 0xFFFF else np.uint32
+    columns = {
+        "box": np.array(box, dtype=np.uint32),
+        "user": np.array(user, dtype=np.uint32),
+        "recorded_at": np.array(recorded_at, dtype=np.int64),
+        "vote_id": np.frombuffer(b"".join(vote_keys), dtype=np.uint8).reshape(-1, 16),
+        "selection_offsets": np.array(offsets, dtype=np.int64),
+        "selection": np.array(selection, dtype=selection_type),
+    }
+    if any(tally_sheet):
+        columns["weights"] = np.array(weights, dtype=np.int32)
+        columns["tally_sheet"] = np.array(tally_sheet, dtype=bool)
+    if extra_ids.values:
+        columns["vote_id_ref"] = np.array(vote_refs, dtype=np.int32)
+
+    meta = {
+        "format": FORMAT,
+        "ballots": len(box),
+        "candidates": candidates.values,
+        "boxes": boxes.values,
+        "users": users.values,
+        "vote_ids": extra_ids.values,
+        "columns": sorted(columns),
+        "metadata": metadata or {},
+    }
+
+    # Build next to the target and swap it in, so readers never see a
+    # half-written directory
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".tmp-ballots-")
+    try:
+        for name, array in columns.items():
+            np.save(os.path.join(staging, f"{name}.npy"), array)
+        with open(os.path.join(staging, META_FILE), "w") as f:
+            json.dump(meta, f)
+        if os.path.exists(path):
+            retired = staging + ".old"
+            os.replace(path, retired)
+            os.replace(staging, path)
+            shutil.rmtree(retired)
+        else:
+            os.replace(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return meta["ballots"]
+
+
+# votes.json layout (box -> vote_id -> ballot) to the compact format
+def encode_votes(votes, path, metadata=None):
+    return encode(
+        (
+            {"box_id": box_id, "vote_id": vote_id, **ballot}
+            for box_id, box_votes in votes.items()
+            for vote_id, ballot in box_votes.items()
+        ),
+        path,
+        metadata
+    )
+
+
+class CompactBallots:
+    def __init__(self, path, mmap=True):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        if meta["format"] != FORMAT:
+            raise ValueError(f"{path}: unsupported ballot format {meta['format']}")
+        self.candidates = meta["candidates"]
+        self.boxes = meta["boxes"]
+        self.users = meta["users"]
+        self.vote_ids = meta["vote_ids"]
+        self.metadata = meta.get("metadata", {})
+        mmap_mode = "r" if mmap else None
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in meta["columns"]
+        }
+
+    def __len__(self):
+        return len(self.columns["box"])
+
+    # Box code of every selection entry, aligned with the selection column
+    def selection_boxes(self):
+        return np.repeat(self.columns["box"], np.diff(self.columns["selection_offsets"]))
+
+    def weights(self):
+        weights = self.columns.get("weights")
+        if weights is None:
+            return np.ones(len(self.columns["selection"]), dtype=np.int32)
+        return weights
+
+    # box code x candidate code vote counts
+    def count_matrix(self):
+        shape = (len(self.boxes), len(self.candidates))
+        flat = self.selection_boxes().astype(np.int64) * shape[1] + self.columns["selection"]
+        counts = np.bincount(flat, weights=self.weights(), minlength=shape[0] * shape[1])
+        return counts.astype(np.int64).reshape(shape)
+
+    # vote_counts.json layout, computed column-wise
+    def counts_by_box(self):
+        matrix = self.count_matrix()
+        result = {}
+        for box_code, candidate_code in zip(*np.nonzero(matrix)):
+            result.setdefault(self.boxes[box_code], {})[self.candidates[candidate_code]] = int(
+                matrix[box_code, candidate_code]
+            )
+        return result
+
+    def vote_id(self, index):
+        refs = self.columns.get("vote_id_ref")
+        if refs is not None and refs[index] >= 0:
+            return self.vote_ids[refs[index]]
+        return str(uuid.UUID(bytes=self.columns["vote_id"][index].tobytes()))
+
+    # Journal-style records, in the order they were encoded
+    def records(self):
+        columns = self.columns
+        offsets = columns["selection_offsets"]
+        selection = columns["selection"]
+        weights = columns.get("weights")
+        tally_sheet = columns.get("tally_sheet")
+        for i in range(len(self)):
+            start, stop = offsets[i], offsets[i + 1]
+            record = {"box_id": self.boxes[columns["box"][i]], "vote_id": self.vote_id(i)}
+            if tally_sheet is not None and tally_sheet[i]:
+                record["counts"] = {
+                    self.candidates[code]: int(count)
+                    for code, count in zip(selection[start:stop], weights[start:stop])
+                }
+            else:
+                record["candidates"] = [self.candidates[code] for code in selection[start:stop]]
+            record["recorded_by"] = self.users[columns["user"][i]]
+            recorded_at = isoformat(columns["recorded_at"][i])
+            if recorded_at is not None:
+                record["recorded_at"] = recorded_at
+            yield record
+
+
+# Compact format back to the votes.json layout
+def decode_votes(path):
+    votes = {}
+    for record in CompactBallots(path).records():
+        box_id = record.pop("box_id")
+        votes.setdefault(box_id, {})[record.pop("vote_id")] = record
+    return votes
+
+
+def _size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+if __name__ == "__main__":
+    from storage import JsonStorage
+    from vote_journal import VoteJournal
+
+    parser = argparse.ArgumentParser(description="Compact ballot format converters")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    encode_command = subcommands.add_parser("encode", help="votes.json plus journal -> compact directory")
+    encode_command.add_argument("--data-dir", default="data")
+    encode_command.add_argument("--out", default="data/ballots")
+
+    decode_command = subcommands.add_parser("decode", help="compact directory -> votes.json layout")
+    decode_command.add_argument("--in", dest="source", default="data/ballots")
+    decode_command.add_argument("--out", required=True)
+
+    args = parser.parse_args()
+    if args.command == "encode":
+        votes_file = os.path.join(args.data_dir, "votes.json")
+        source = JsonStorage(
+            votes_file,
+            os.path.join(args.data_dir, "vote_counts.json"),
+            VoteJournal(os.path.join(args.data_dir, "journal"))
+        )
+        ballots = encode_votes(source.load(votes_file), args.out)
+        print(f"ballots: {ballots}")
+        print(f"bytes: {_size(args.out)}")
+    elif args.command == "decode":
+        with open(args.out, "w") as f:
+            json.dump(decode_votes(args.source), f)
+        print(f"ballots: {len(CompactBallots(args.source))}")
@@ -0,0 +1,88 @@
+import argparse
+import os
+
+from vote_journal import ballot_deltas
+
+# Ballot store compaction and count verification
+#
+# Storage.compact() asks the backend to checkpoint its per-box counts at the
+# current ballot position and archive what later loads no longer replay:
+#
+#   - json: checkpoint.json in the journal directory holds the counts and the
+#     journal position they include; loading the counts starts from it and
+#     replays only the newer records. Older journal segments move, gzipped,
+#     to journal/archive/, where the ballot dataset still reads them.
+#   - sharded: every shard's counts.json is brought up to its head and its
+#     older segments archived the same way.
+#   - sqlite: counts are kept in the ballot transaction already; compacting
+#     folds the WAL back into the database file.
+#
+# verify_counts() recounts every box from the ballots, streaming them one at
+# a time from the backend, and compares the result with the stored counts
+# read at the same point, so it needs memory for the counts only, however
+# many ballots there are.
+
+
+# Rows where the recount disagrees with the stored counts: box_id,
+# candidate_id, recounted, stored; plus the number of ballots read
+def verify_counts(storage):
+    stored, cursor = storage.load_counts_with_cursor()
+    recounted = {}
+    ballots = 0
+    for record in storage.iter_ballots(cursor):
+        box_counts = recounted.setdefault(record["box_id"], {})
+        for candidate_id, count in ballot_deltas(record):
+            box_counts[candidate_id] = box_counts.get(candidate_id, 0) + count
+        ballots += 1
+
+    drift = []
+    for box_id in sorted(set(recounted) | set(stored)):
+        recounted_box, stored_box = recounted.get(box_id, {}), stored.get(box_id, {})
+        for candidate_id in sorted(set(recounted_box) | set(stored_box)):
+            if recounted_box.get(candidate_id, 0) != stored_box.get(candidate_id, 0):
+                drift.append({
+                    "box_id": box_id,
+                    "candidate_id": candidate_id,
+                    "recounted": recounted_box.get(candidate_id, 0),
+                    "stored": stored_box.get(candidate_id, 0),
+                })
+    return ballots, drift
+
+
+def open_storage(backend, data_dir, db_path):
+    votes_file = os.path.join(data_dir, "votes.json")
+    vote_counts_file = os.path.join(data_dir, "vote_counts.json")
+    if backend == "sqlite":
+        from storage import SqliteStorage
+        return SqliteStorage(db_path or os.path.join(data_dir, "election.db"))
+    if backend == "sharded":
+        from sharded_storage import ShardedStorage
+        return ShardedStorage(votes_file, vote_counts_file, os.path.join(data_dir, "shards"))
+    from storage import JsonStorage
+    from vote_journal import VoteJournal
+    return JsonStorage(votes_file, vote_counts_file, VoteJournal(os.path.join(data_dir, "journal")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ballot store compaction and verification")
+    parser.add_argument("command", choices=["compact", "verify"])
+    parser.add_argument("--storage", choices=["json", "sqlite", "sharded"], default="json")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--db", help="SQLite database (default: <data-dir>/election.db)")
+
+    args = parser.parse_args()
+    storage = open_storage(args.storage, args.data_dir, args.db)
+    if args.command == "compact":
+        for key, value in storage.compact().items():
+            print(f"{key}: {value}")
+    else:
+        ballots, drift = verify_counts(storage)
+        print(f"ballots: {ballots}")
+        if not drift:
+            print("OK: stored counts match the ballots")
+        else:
+            print(f"DRIFT in {len(drift)} counts:")
+            for row in drift:
+                print(f"  box {row['box_id']} candidate {row['candidate_id']}: "
+                      f"stored {row['stored']}, recounted {row['recounted']}")
+            raise SystemExit(1)
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Reusable Plotly bar charts
+#
+# A chart is identified by a caller-chosen key (e.g. ("box", box_id,
+# category)). Its structure - the bars, their colour groups and the title -
+# decides whether an existing figure can be reused; the values decide
+# whether it must change. Same structure and values: the cached figure is
+# returned as is. Same structure, new values: the cached figure is copied
+# and the copy's y arrays patched, which skips px.bar's grouping and layout
+# work. Anything else builds a new figure.
+#
+# Returned figures are shared between sessions and threads that may be
+# serializing them, so a figure is never modified once handed out; a patch
+# swaps in the new copy instead. Callers must not modify them either.
+#
+# plotly.express is imported on the first build, not with the module.
+
+
+class _CachedFigure:
+    def __init__(self, fig, structure, values, trace_rows):
+        self.fig = fig
+        self.structure = structure
+        self.values = values
+        self.trace_rows = trace_rows
+
+
+class FigureCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.patches = 0
+        self.builds = 0
+
+    def bar(self, key, df, x, y, color, title):
+        if color is None:
+            colors = np.full(len(df), "", dtype=object)
+        else:
+            colors = df[color].astype(str).to_numpy()
+        structure = (tuple(df[x].astype(str)), tuple(colors), title)
+        values = df[y].to_numpy()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.structure == structure:
+                self._entries.move_to_end(key)
+                if np.array_equal(entry.values, values):
+                    self.hits += 1
+                    return entry.fig
+
+                # Only counts moved: patch each colour group's bars on a copy
+                import plotly.graph_objects as go
+
+                fig = go.Figure(entry.fig)
+                with fig.batch_update():
+                    for trace, rows in zip(fig.data, entry.trace_rows):
+                        trace.y = values[rows]
+                entry.fig = fig
+                entry.values = values
+                self.patches += 1
+                return fig
+
+            import plotly.express as px
+
+            fig = px.bar(df, x=x, y=y, color=color, title=title)
+            # px.bar makes one trace per colour, keeping row order within each
+            trace_rows = [np.flatnonzero(colors == str(trace.name)) for trace in fig.data]
+            self._entries[key] = _CachedFigure(fig, structure, values, trace_rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.builds += 1
+            return fig
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "patches": self.patches, "builds": self.builds}
@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import threading
+
+from metrics import count_bytes
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Per-file locking and atomic writes
+#
+# file_lock(path) serialises writers of one file across the threads of this
+# process (Streamlit sessions) and, through flock on a sidecar "<path>.lock",
+# across processes. The lock is re-entrant within a thread so a helper that
+# takes it can be called from code that already holds it.
+
+_registry_lock = threading.Lock()
+_file_locks = {}
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.lock_path = path + ".lock"
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+        return False
+
+
+# Exclusive lock for a file path (the file itself need not exist)
+def file_lock(path):
+    key = os.path.abspath(path)
+    with _registry_lock:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = _file_locks[key] = _FileLock(path)
+        return lock
+
+
+def fsync_dir(directory):
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Write JSON to a temp file next to the target, fsync it, then rename over the
+# target so readers see either the old or the new file, never a partial one
+def atomic_write_json(data, file_path):
+    directory = os.path.dirname(file_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            count_bytes(written=f.tell())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    fsync_dir(directory)
@@ -0,0 +1,175 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Lightweight timings and I/O counters
+#
+# timer(name) / @timed(name) record how long an operation took; percentiles
+# come from the last SAMPLE_SIZE durations of each operation, counts and
+# sums from all of them. Storage code reports bytes with count_bytes(), and
+# the bytes are charged to every operation running on the calling thread, so
+# record_single_vote includes the writes of the save it makes. One registry
+# per process; export it with to_prometheus() / to_json(), or write it to a
+# file periodically with start_file_exporter().
+
+SAMPLE_SIZE = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Operation:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._local = threading.local()
+
+    def _operation(self, name):
+        operation = self._operations.get(name)
+        if operation is None:
+            operation = self._operations.setdefault(name, _Operation())
+        return operation
+
+    def _active(self):
+        active = getattr(self._local, "active", None)
+        if active is None:
+            active = self._local.active = []
+        return active
+
+    def observe(self, name, seconds):
+        with self._lock:
+            operation = self._operation(name)
+            operation.count += 1
+            operation.total += seconds
+            operation.samples.append(seconds)
+
+    def count_bytes(self, read=0, written=0):
+        active = self._active()
+        if not active:
+            return
+        with self._lock:
+            for name in set(active):
+                operation = self._operation(name)
+                operation.bytes_read += read
+                operation.bytes_written += written
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+
+    # {name: {count, total_seconds, p50, p95, p99, bytes_read, bytes_written}}
+    def snapshot(self):
+        with self._lock:
+            operations = {
+                name: (operation.count, operation.total, list(operation.samples),
+                       operation.bytes_read, operation.bytes_written)
+                for name, operation in self._operations.items()
+            }
+        result = {}
+        for name, (count, total, samples, bytes_read, bytes_written) in sorted(operations.items()):
+            quantiles = np.quantile(samples, QUANTILES) if samples else [0.0] * len(QUANTILES)
+            result[name] = {
+                "count": count,
+                "total_seconds": total,
+                "p50": float(quantiles[0]),
+                "p95": float(quantiles[1]),
+                "p99": float(quantiles[2]),
+                "bytes_read": bytes_read,
+                "bytes_written": bytes_written,
+            }
+        return result
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # Prometheus text exposition format (summary + byte counters)
+    def to_prometheus(self, prefix="election"):
+        lines = [
+            f"# HELP {prefix}_operation_seconds Time spent per operation",
+            f"# TYPE {prefix}_operation_seconds summary",
+        ]
+        snapshot = self.snapshot()
+        for name, values in snapshot.items():
+            for quantile in QUANTILES:
+                key = f"p{int(quantile * 100)}"
+                lines.append(f'{prefix}_operation_seconds{{operation="{name}",quantile="{quantile}"}} {values[key]}')
+            lines.append(f'{prefix}_operation_seconds_sum{{operation="{name}"}} {values["total_seconds"]}')
+            lines.append(f'{prefix}_operation_seconds_count{{operation="{name}"}} {values["count"]}')
+        for direction in ("read", "written"):
+            lines.append(f"# HELP {prefix}_bytes_{direction}_total Bytes {direction} during each operation")
+            lines.append(f"# TYPE {prefix}_bytes_{direction}_total counter")
+            for name, values in snapshot.items():
+                lines.append(f'{prefix}_bytes_{direction}_total{{operation="{name}"}} {values[f"bytes_{direction}"]}')
+        return "\n".join(lines) + "\n"
+
+    # Write the metrics to `path` every `interval` seconds from a daemon
+    # thread; JSON if the path ends in .json, Prometheus text otherwise
+    def start_file_exporter(self, path, interval=15):
+        def export():
+            while True:
+                text = self.to_json() if path.endswith(".json") else self.to_prometheus()
+                try:
+                    with open(path + ".tmp", "w") as f:
+                        f.write(text)
+                    os.replace(path + ".tmp", path)
+                except OSError:
+                    pass  # e.g. the directory went away; try again next time
+                time.sleep(interval)
+
+        thread = threading.Thread(target=export, name="metrics-exporter", daemon=True)
+        thread.start()
+        return thread
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics._active().append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.metrics._active().pop()
+        self.metrics.observe(self.name, elapsed)
+        return False
+
+
+registry = Metrics()
+
+
+def timer(name):
+    return registry.timer(name)
+
+
+def count_bytes(read=0, written=0):
+    registry.count_bytes(read=read, written=written)
+
+
+# Decorator form of timer(name)
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with registry.timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+import numpy as np
+
+from compact_ballots import Interner, isoformat, timestamp, vote_key
+from locking import atomic_write_json, file_lock
+from vote_journal import VoteJournal, ballot_deltas
+
+try:
+    import zstandard
+except ImportError:  # zlib only
+    zstandard = None
+
+# Offline ballot log and sync payloads
+#
+# OfflineLog keeps ballots recorded in offline mode in an append-only
+# journal (one fsync'd append per ballot instead of rewriting
+# offline_votes.json), plus "synced.json", the position up to which they
+# have reached the main store.
+#
+# Backlogs travel to the main store as sync payloads: one compressed,
+# checksummed blob holding
+#
+#   - per-box delta counts ({box: {candidate: votes}}), checked against the
+#     ballots on arrival,
+#   - each distinct selection once, as a bitset over the payload's candidate
+#     table, and
+#   - per ballot only codes: box, selection, user, time and the 16-byte
+#     vote ID.
+#
+# Layout: a fixed header (magic, format, codec, SHA-256 of the compressed
+# body, body length), then the zlib (or zstd, when installed) body: a JSON
+# meta block followed by the raw columns it lists. Records a bitset can't
+# hold exactly (tally sheets, repeated candidates) ride along in the meta
+# block as-is. Candidate order within a ballot isn't kept.
+
+FORMAT = 1
+MAGIC = b"EVSP"
+CODECS = {"zlib": 0, "zstd": 1}
+_HEADER = struct.Struct("<4sBB32sQ")
+_META_LENGTH = struct.Struct("<I")
+
+
+class PayloadError(ValueError):
+    pass
+
+
+def _compress(body, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise PayloadError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=10).compress(body)
+    return zlib.compress(body, 9)
+
+
+def _decompress(body, codec, length):
+    if codec == CODECS["zstd"]:
+        if zstandard is None:
+            raise PayloadError("Payload is zstd-compressed; install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(body, max_output_size=length)
+    return zlib.decompress(body)
+
+
+# Journal-style records -> payload bytes
+def build_payload(records, codec="zlib"):
+    candidates, boxes, users, extra_ids = Interner(), Interner(), Interner(), Interner()
+    patterns = Interner()
+    box, pattern, user, recorded_at, vote_keys, vote_refs = [], [], [], [], [], []
+    raw_records = []
+    counts = {}
+
+    for record in records:
+        box_code = boxes.code(record["box_id"])
+        box_counts = counts.setdefault(box_code, {})
+        for candidate_id, count in ballot_deltas(record):
+            code = candidates.code(candidate_id)
+            box_counts[code] = box_counts.get(code, 0) + count
+
+        selection = record.get("candidates")
+        if selection is None or len(set(selection)) != len(selection):
+            raw_records.append(record)
+            continue
+
+        box.append(box_code)
+        pattern.append(patterns.code(frozenset(candidates.code(candidate_id) for candidate_id in selection)))
+        user.append(users.code(record.get("recorded_by")))
+        recorded_at.append(timestamp(record.get("recorded_at")))
+        key = vote_key(record["vote_id"])
+        vote_keys.append(key or bytes(16))
+        vote_refs.append(-1 if key else extra_ids.code(record["vote_id"]))
+
+    # One bit per candidate code, little-endian within each row
+    width = (len(candidates.values) + 7) // 8
+    bitsets = np.zeros((len(patterns.values), width * 8), dtype=bool)
+    for row, codes in enumerate(patterns.values):
+        bitsets[row, list(codes)] = True
+
+    columns = {
+        "box": np.array(box, dtype=np.uint32),
+        "pattern": np.array(pattern, dtype=np.uint32),
+        "user": np.array(user, dtype=np.uint32),
+        "recorded_at": np.array(recorded_at, dtype=np.int64),
+        "vote_id": np.frombuffer(b"".join(vote_keys), dtype=np.uint8).reshape(-1, 16),
+        "patterns": np.packbits(bitsets, axis=1, bitorder="little"),
+    }
+    if extra_ids.values:
+        columns["vote_id_ref"] = np.array(vote_refs, dtype=np.int32)
+
+    meta = {
+        "format": FORMAT,
+        "ballots": len(box) + len(raw_records),
+        "candidates": candidates.values,
+        "boxes": boxes.values,
+        "users": users.values,
+        "vote_ids": extra_ids.values,
+        "counts": {str(b): {str(c): n for c, n in box_counts.items()} for b, box_counts in counts.items()},
+        "records": raw_records,
+        "columns": [[name, column.dtype.str, list(column.shape)] for name, column in columns.items()],
+    }
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    body = b"".join(
+        [_META_LENGTH.pack(len(meta_bytes)), meta_bytes]
+        + [np.ascontiguousarray(column).tobytes() for column in columns.values()]
+    )
+    compressed = _compress(body, codec)
+    header = _HEADER.pack(MAGIC, FORMAT, CODECS[codec], hashlib.sha256(compressed).digest(), len(body))
+    return header + compressed
+
+
+class SyncPayload:
+    def __init__(self, records, box_counts):
+        self.records = records
+        self.box_counts = box_counts
+
+    def __len__(self):
+        return len(self.records)
+
+
+# Payload bytes -> SyncPayload; raises PayloadError if it is damaged
+def read_payload(data):
+    if len(data) < _HEADER.size:
+        raise PayloadError("Payload is truncated")
+    magic, version, codec, checksum, length = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise PayloadError("Not a sync payload")
+    if version != FORMAT:
+        raise PayloadError(f"Unsupported sync payload format {version}")
+    compressed = data[_HEADER.size:]
+    if hashlib.sha256(compressed).digest() != checksum:
+        raise PayloadError("Payload checksum mismatch")
+    try:
+        body = _decompress(compressed, codec, length)
+    except (zlib.error, ValueError) as e:
+        raise PayloadError(f"Payload does not decompress: {e}")
+    if len(body) != length:
+        raise PayloadError("Payload length mismatch")
+
+    (meta_length,) = _META_LENGTH.unpack_from(body)
+    meta = json.loads(body[_META_LENGTH.size:_META_LENGTH.size + meta_length])
+    columns = {}
+    offset = _META_LENGTH.size + meta_length
+    for name, dtype, shape in meta["columns"]:
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        columns[name] = np.frombuffer(body, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        offset += size
+
+    candidates, boxes, users = meta["candidates"], meta["boxes"], meta["users"]
+    bits = np.unpackbits(columns["patterns"], axis=1, bitorder="little")
+    selections = [[candidates[code] for code in np.flatnonzero(row)] for row in bits]
+    vote_refs = columns.get("vote_id_ref")
+
+    records = []
+    for i in range(len(columns["box"])):
+        if vote_refs is not None and vote_refs[i] >= 0:
+            vote_id = meta["vote_ids"][vote_refs[i]]
+        else:
+            vote_id = str(uuid.UUID(bytes=columns["vote_id"][i].tobytes()))
+        records.append({
+            "box_id": boxes[columns["box"][i]],
+            "vote_id": vote_id,
+            "candidates": list(selections[columns["pattern"][i]]),
+            "recorded_by": users[columns["user"][i]],
+            "recorded_at": isoformat(columns["recorded_at"][i]),
+        })
+    records.extend(meta["records"])
+
+    box_counts = {
+        boxes[int(box_code)]: {candidates[int(code)]: count for code, count in box_counts.items()}
+        for box_code, box_counts in meta["counts"].items()
+    }
+    # The delta counts must add up to the ballots they came with
+    recounted = {}
+    for record in records:
+        recounted_box = recounted.setdefault(record["box_id"], {})
+        for candidate_id, count in ballot_deltas(record):
+            recounted_box[candidate_id] = recounted_box.get(candidate_id, 0) + count
+    if recounted != box_counts:
+        raise PayloadError("Payload counts don't match its ballots")
+    return SyncPayload(records, box_counts)
+
+
+class OfflineLog:
+    def __init__(self, directory):
+        self.directory = directory
+        self.journal = VoteJournal(directory)
+        self._synced_file = os.path.join(directory, "synced.json")
+        self._sync_lock = file_lock(os.path.join(directory, "sync"))
+        self._lock = threading.Lock()
+        self._counted = None  # (synced, position, {box_id: ballots})
+
+    def append(self, records):
+        return self.journal.append(records)
+
+    def synced(self):
+        try:
+            with open(self._synced_file, "r") as f:
+                return json.load(f)["position"]
+        except FileNotFoundError:
+            return 0
+
+    # Held while a backlog is read, sent and marked synced, so two syncs
+    # never send the same ballots
+    def sync_lock(self):
+        return self._sync_lock
+
+    # Ballots appended but not synced yet
+    def backlog(self):
+        return max(0, self.journal.position() - self.synced())
+
+    # (end, records) for up to `limit` unsynced ballots
+    def read_pending(self, limit=None):
+        start = self.synced()
+        end = self.journal.position()
+        if limit is not None:
+            end = min(end, start + limit)
+        return end, [record for _, record in self.journal.read(start, end)]
+
+    def mark_synced(self, position):
+        atomic_write_json({"position": position}, self._synced_file)
+        self.journal.discard_before(position)
+
+    # Unsynced ballots per box, read incrementally as the log grows
+    def pending_by_box(self):
+        while True:
+            synced = self.synced()
+            position = self.journal.position()
+            with self._lock:
+                if self._counted is None or self._counted[0] != synced:
+                    self._counted = (synced, synced, {})
+                _, counted_to, counts = self._counted
+                if position > counted_to:
+                    counts = dict(counts)
+                    try:
+                        for _, record in self.journal.read(counted_to, position):
+                            counts[record["box_id"]] = counts.get(record["box_id"], 0) + 1
+                    except FileNotFoundError:
+                        continue  # a sync just discarded those segments; start over
+                    self._counted = (synced, position, counts)
+                return dict(self._counted[2])
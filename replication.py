@@ -0,0 +1,78 @@
+import logging
+import os
+import socket
+import threading
+import time
+
+# Leader election for app replicas sharing one store
+#
+# Several Streamlit processes on one host can run against the same SQLite
+# database and data directory. They must share a local disk: SQLite's WAL
+# relies on shared memory, and the JSON backend's file locks and leases on
+# flock, and neither works between hosts over a network filesystem, so
+# replicas are not supported across hosts. Ballots
+# go straight to the shared store from every replica, but only one of them,
+# the aggregator, publishes the results snapshots every replica's results
+# pages read, so all replicas show the same published state and the full
+# results are computed once instead of once per replica.
+#
+# The aggregator holds a lease in the store and renews it every ttl / 3
+# seconds. If it dies or stalls, the lease runs out and another replica takes
+# over within about one ttl. A node only acts as leader until its own lease
+# would have expired, counted on its monotonic clock from before it asked for
+# the lease, so a paused leader steps down before anyone else can take over.
+# Snapshot versions are assigned under the snapshot directory's lock, so even
+# an overlap during failover can't publish the same version twice.
+
+LEASE_NAME = "aggregator"
+LEASE_TTL = 10.0
+
+log = logging.getLogger(__name__)
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Aggregator:
+    def __init__(self, storage, node_id=None, ttl=LEASE_TTL, on_elected=None):
+        self.storage = storage
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        self.on_elected = on_elected
+        self._lock = threading.Lock()
+        self._valid_until = 0.0
+        self._thread = None
+
+    def is_leader(self):
+        with self._lock:
+            return time.monotonic() < self._valid_until
+
+    # (node_id, expires_at) of the current aggregator, or None
+    def leader(self):
+        return self.storage.lease_holder(LEASE_NAME)
+
+    def renew(self):
+        asked_at = time.monotonic()
+        held = self.storage.acquire_lease(LEASE_NAME, self.node_id, self.ttl)
+        with self._lock:
+            elected = held and asked_at >= self._valid_until
+            self._valid_until = asked_at + self.ttl if held else 0.0
+        if elected:
+            log.info("%s is now the aggregator", self.node_id)
+            if self.on_elected:
+                self.on_elected()
+        return held
+
+    def _run(self):
+        while True:
+            try:
+                self.renew()
+            except Exception:
+                log.exception("Renewing the aggregator lease failed")
+            time.sleep(self.ttl / 3)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="aggregator-lease", daemon=True)
+            self._thread.start()
@@ -0,0 +1,198 @@
+import copy
+import threading
+
+import numpy as np
+
+from tally import INVALID
+
+# Vectorized results
+#
+# Vote counts are held as a dense box x candidate matrix (invalid votes are
+# the last column) next to a candidate metadata frame with categorical
+# Category/Party columns. Overall, per-box, per-category and per-party
+# tables are then column sums and groupbys instead of Python loops over
+# nested dicts. The invalid-votes column has no category or party (missing
+# values, which groupbys skip), so it can't be confused with a user-created
+# "Invalid" category or "N/A" party; candidate_table labels it for display.
+#
+# ResultsEngineCache keeps one engine per process in step with the tally.
+# Engines it has handed out are never modified: new ballots go into a copy of
+# the matrix that then replaces the shared engine, so every table a render
+# builds from one engine reflects the same ballots.
+#
+# pandas is imported when the first engine is built, not with the module, so
+# processes that never render results don't pay for it.
+
+
+class ResultsEngine:
+    def __init__(self, catalog, box_ids, box_counts):
+        import pandas as pd
+
+        candidates = [
+            candidate
+            for category in catalog.categories
+            for candidate in catalog.by_category[category]
+        ]
+        self.candidate_ids = [candidate["id"] for candidate in candidates] + [INVALID]
+        self._columns = {cid: i for i, cid in enumerate(self.candidate_ids)}
+
+        party_labels = [candidate["party"] for candidate in candidates]
+        category_labels = [candidate["category"] for candidate in candidates]
+        self.candidates = pd.DataFrame({
+            "Candidate": [candidate["name"] for candidate in candidates] + ["Invalid Votes"],
+            "Party": pd.Categorical(party_labels + [None], categories=list(catalog.by_party)),
+            "Category": pd.Categorical(category_labels + [None], categories=catalog.categories),
+        })
+        # Plain labels for display, the invalid row included
+        self._display_labels = {
+            "Party": np.array(party_labels + ["N/A"], dtype=object),
+            "Category": np.array(category_labels + ["Invalid"], dtype=object),
+        }
+
+        # Matrix columns of every party's candidates, from the catalog's index
+        self._party_columns = {
+            party: np.array([self._columns[candidate["id"]] for candidate in party_candidates], dtype=np.intp)
+            for party, party_candidates in catalog.by_party.items()
+        }
+
+        self.box_ids = list(dict.fromkeys(list(box_ids) + list(box_counts)))
+        self._rows = {box_id: i for i, box_id in enumerate(self.box_ids)}
+        self.matrix = np.zeros((len(self.box_ids), len(self.candidate_ids)), dtype=np.int32)
+
+        rows, columns, values = [], [], []
+        for box_id, counts in box_counts.items():
+            row = self._rows[box_id]
+            for candidate_id, count in counts.items():
+                column = self._columns.get(candidate_id)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+                    values.append(count)
+        # (box, candidate) pairs are unique, so plain fancy assignment is enough
+        self.matrix[np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)] = values
+
+    # Same engine with a matrix of its own, to apply changes to
+    def copy(self):
+        engine = copy.copy(self)
+        engine.matrix = self.matrix.copy()
+        return engine
+
+    # Add {candidate_id: delta} for one box; False if the box isn't in the matrix
+    def apply(self, box_id, deltas):
+        row = self._rows.get(box_id)
+        if row is None:
+            return False
+        for candidate_id, count in deltas.items():
+            column = self._columns.get(candidate_id)
+            if column is not None:
+                self.matrix[row, column] += count
+        return True
+
+    def _votes(self, box_id=None):
+        if box_id is None:
+            return self.matrix.sum(axis=0, dtype=np.int64)
+        row = self._rows.get(box_id)
+        if row is None:
+            return np.zeros(len(self.candidate_ids), dtype=np.int64)
+        return self.matrix[row].astype(np.int64)
+
+    def invalid_votes(self, box_id=None):
+        return int(self._votes(box_id)[-1])
+
+    # Candidate, Party, Category, Votes for every candidate plus invalid votes,
+    # labelled for display
+    def candidate_table(self, box_id=None):
+        return self.candidates.assign(Votes=self._votes(box_id), **self._display_labels)
+
+    # {category: candidate table rows of that category}, in catalog order
+    def category_tables(self, box_id=None):
+        table = self.candidates.assign(Votes=self._votes(box_id))
+        return {
+            category: group.reset_index(drop=True)
+            for category, group in table.groupby("Category", observed=True, sort=False)
+        }
+
+    # Valid votes per category
+    def category_totals(self, box_id=None):
+        table = self.candidates.assign(Votes=self._votes(box_id))
+        return table.groupby("Category", observed=True, sort=False)["Votes"].sum()
+
+    # Votes per party, most first
+    def party_table(self, box_id=None):
+        import pandas as pd
+
+        votes = self._votes(box_id)
+        return (
+            pd.DataFrame({
+                "Party": list(self._party_columns),
+                "Votes": [int(votes[columns].sum()) for columns in self._party_columns.values()],
+            })
+            .sort_values("Votes", ascending=False, kind="stable")
+            .reset_index(drop=True)
+        )
+
+    # One row per box: valid, invalid and total votes
+    def box_table(self, boxes):
+        import pandas as pd
+
+        invalid = self.matrix[:, -1].astype(np.int64)
+        total = self.matrix.sum(axis=1, dtype=np.int64)
+        return pd.DataFrame({
+            "Electoral Box": [
+                boxes[box_id]["name"] if box_id in boxes else f"Unknown Box ({box_id})"
+                for box_id in self.box_ids
+            ],
+            "Location": [boxes.get(box_id, {}).get("location", "") for box_id in self.box_ids],
+            "Valid Votes": total - invalid,
+            "Invalid Votes": invalid,
+            "Total Votes": total,
+        })
+
+
+class ResultsEngineCache:
+    def __init__(self, tally, catalog_cache, storage, boxes_file):
+        self.tally = tally
+        self.catalog_cache = catalog_cache
+        self.storage = storage
+        self.boxes_file = boxes_file
+        self._lock = threading.Lock()
+        self._engine = None
+        self._catalog = None
+        self._boxes_version = None
+        self._epoch = None
+        self._generation = None
+
+    def _rebuild(self, catalog, boxes_version):
+        epoch, generation, box_counts = self.tally.snapshot()
+        boxes = self.storage.load(self.boxes_file)
+        self._engine = ResultsEngine(catalog, boxes.keys(), box_counts)
+        self._catalog = catalog
+        self._boxes_version = boxes_version
+        self._epoch = epoch
+        self._generation = generation
+
+    # Engine reflecting the latest tally (at most max_age seconds behind
+    # other processes); the returned engine is shared
+    def get(self, max_age=0):
+        catalog = self.catalog_cache.get()
+        boxes_version = self.storage.version(self.boxes_file)
+        with self._lock:
+            if self._catalog is not catalog or self._boxes_version != boxes_version:
+                self._rebuild(catalog, boxes_version)
+                return self._engine
+
+            changes = self.tally.changes_since(self._epoch, self._generation, max_age)
+            if changes is None:
+                self._rebuild(catalog, boxes_version)
+                return self._engine
+
+            _, generation, deltas = changes
+            if deltas:
+                engine = self._engine.copy()
+                for _, box_id, box_deltas in deltas:
+                    if not engine.apply(box_id, box_deltas):
+                        self._rebuild(catalog, boxes_version)
+                        return self._engine
+                self._engine = engine
+            self._generation = generation
+            return self._engine
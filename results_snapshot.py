@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from locking import atomic_write_json, file_lock
+from tally import INVALID
+
+# Published results snapshots
+#
+# SnapshotPublisher materializes the results tables (totals, per-category,
+# per-party and per-box, as the results engine lays them out) into an
+# immutable JSON file,
+# results-<version>.json, and then points latest.json at it. Public viewers
+# read only these files through SnapshotReader, which re-parses a snapshot
+# only when latest.json changes, so read load never reaches the vote store,
+# the tally or the write path.
+#
+# A snapshot is published once `every_ballots` ballot records (a tally sheet
+# counts as one) have arrived since the last one, and otherwise at least
+# every `interval` seconds while there is anything new. Tables are stored
+# column-wise ({column: [values]}) so they load straight into DataFrames.
+# With a `leader` (replication.Aggregator), only the replica holding the
+# aggregator lease publishes; the others just read. latest.json also records
+# the storage versions the snapshot was built from, so a restarted publisher
+# doesn't rebuild the results just to publish them again.
+#
+# Snapshots are built from the tally's per-box counts with plain dicts and
+# lists, not the results engine, so publishing (which starts right after
+# startup) never imports pandas; only rendering a results table does.
+
+SNAPSHOT_FORMAT = 1
+LATEST_FILE = "latest.json"
+
+log = logging.getLogger(__name__)
+
+
+# Column-wise tables from per-box counts, laid out like ResultsEngine's
+# category_tables(), party_table() and box_table(); votes for candidates not
+# in the catalog are left out, as in the engine. Returns (categories,
+# parties, boxes, valid, invalid).
+def _tables(catalog, boxes, box_counts):
+    candidate_totals = {}
+    for counts in box_counts.values():
+        for candidate_id, count in counts.items():
+            candidate_totals[candidate_id] = candidate_totals.get(candidate_id, 0) + count
+
+    categories = {}
+    for category in catalog.categories:
+        candidates = catalog.by_category[category]
+        categories[category] = {
+            "Candidate": [candidate["name"] for candidate in candidates],
+            "Party": [candidate["party"] for candidate in candidates],
+            "Category": [category] * len(candidates),
+            "Votes": [candidate_totals.get(candidate["id"], 0) for candidate in candidates],
+        }
+    parties = sorted(
+        (
+            (party, sum(candidate_totals.get(candidate["id"], 0) for candidate in candidates))
+            for party, candidates in catalog.by_party.items()
+        ),
+        key=lambda item: -item[1]
+    )
+
+    known = {candidate["id"] for category in catalog.categories for candidate in catalog.by_category[category]}
+    box_ids = list(dict.fromkeys(list(boxes) + list(box_counts)))
+    invalid = [box_counts.get(box_id, {}).get(INVALID, 0) for box_id in box_ids]
+    valid = [
+        sum(count for candidate_id, count in box_counts.get(box_id, {}).items() if candidate_id in known)
+        for box_id in box_ids
+    ]
+    box_table = {
+        "Electoral Box": [
+            boxes[box_id]["name"] if box_id in boxes else f"Unknown Box ({box_id})" for box_id in box_ids
+        ],
+        "Location": [boxes.get(box_id, {}).get("location", "") for box_id in box_ids],
+        "Valid Votes": valid,
+        "Invalid Votes": invalid,
+        "Total Votes": [v + i for v, i in zip(valid, invalid)],
+    }
+    return (
+        categories,
+        {"Party": [party for party, _ in parties], "Votes": [votes for _, votes in parties]},
+        box_table,
+        sum(valid),
+        sum(invalid),
+        candidate_totals,
+    )
+
+
+def _read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class SnapshotPublisher:
+    def __init__(self, directory, tally, catalog_cache, storage, boxes_file,
+                 interval=10, every_ballots=0, keep=20, leader=None):
+        self.directory = directory
+        self.tally = tally
+        self.catalog_cache = catalog_cache
+        self.storage = storage
+        self.boxes_file = boxes_file
+        self.interval = interval
+        self.every_ballots = every_ballots
+        self.keep = keep
+        self.leader = leader
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._published = None
+        self._published_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    # Every field comes from one tally snapshot, so the totals, the tables
+    # and the recorded position all describe the same ballots
+    def _build(self, version):
+        epoch, generation, box_counts = self.tally.snapshot()
+        boxes = self.storage.load(self.boxes_file)
+        categories, parties, box_table, valid, invalid, candidate_totals = _tables(
+            self.catalog_cache.get(), boxes, box_counts
+        )
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "version": version,
+            "sequence": [epoch, generation],
+            "published_at": datetime.now().isoformat(),
+            "totals": {
+                "valid": valid,
+                "invalid": invalid,
+                "boxes": len(boxes),
+                "counted_boxes": sum(1 for counts in box_counts.values() if any(counts.values())),
+            },
+            "candidate_totals": candidate_totals,
+            "categories": categories,
+            "parties": parties,
+            "boxes": box_table,
+        }
+
+    def _prune(self, version):
+        for name in os.listdir(self.directory):
+            if not (name.startswith("results-") and name.endswith(".json")):
+                continue
+            try:
+                old_version = int(name[len("results-"):-len(".json")])
+            except ValueError:
+                continue
+            if old_version <= version - self.keep:
+                os.unlink(os.path.join(self.directory, name))
+
+    # Versions of the ballots, candidates and boxes, comparable across
+    # processes (JSON-normalized, as stored in latest.json)
+    def _source(self):
+        return json.loads(json.dumps([
+            self.tally.cursor(),
+            self.storage.version(self.tally.candidates_file),
+            self.storage.version(self.boxes_file)
+        ]))
+
+    # Publish a new snapshot now and return its version
+    def publish(self):
+        latest_path = os.path.join(self.directory, LATEST_FILE)
+        # Publishers in other processes share the directory; versions are
+        # assigned under its lock
+        with file_lock(latest_path):
+            try:
+                version = _read_json(latest_path)["version"] + 1
+            except FileNotFoundError:
+                version = 1
+            # Taken before the snapshot, so it never claims newer data than
+            # the snapshot holds
+            source = self._source()
+            snapshot = self._build(version)
+            position = tuple(snapshot["sequence"])
+            file_name = f"results-{version:08d}.json"
+            atomic_write_json(snapshot, os.path.join(self.directory, file_name))
+            atomic_write_json(
+                {"version": version, "file": file_name, "published_at": snapshot["published_at"], "source": source},
+                latest_path
+            )
+            self._prune(version)
+        with self._lock:
+            self._published = position
+            self._published_at = time.monotonic()
+        return version
+
+    # Publish if enough ballots or time have gone by; returns the new
+    # version or None
+    def maybe_publish(self):
+        if self.leader is not None and not self.leader.is_leader():
+            return None
+        position = self.tally.position(self.interval)
+        with self._lock:
+            first = self._published is None
+        if first:
+            # The latest snapshot may already show the current data, e.g.
+            # after a restart
+            try:
+                current = _read_json(os.path.join(self.directory, LATEST_FILE)).get("source")
+            except FileNotFoundError:
+                current = None
+            if current is not None and current == self._source():
+                with self._lock:
+                    self._published = position
+                    self._published_at = time.monotonic()
+                return None
+        with self._lock:
+            if position == self._published:
+                return None
+            if self._published is not None and position[0] == self._published[0]:
+                pending = position[1] - self._published[1]
+                waited = time.monotonic() - self._published_at
+                if not (self.every_ballots and pending >= self.every_ballots) and waited < self.interval:
+                    return None
+        return self.publish()
+
+    # Tell the publisher new ballots were recorded; it checks from its own
+    # thread so the write path never waits for a snapshot
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.maybe_publish()
+            except Exception:
+                log.exception("Publishing results snapshot failed")
+
+    def start(self):
+        if self._thread is None:
+            # First check right away so viewers get results without waiting
+            self._wake.set()
+            self._thread = threading.Thread(target=self._run, name="snapshot-publisher", daemon=True)
+            self._thread.start()
+
+
+class ResultsSnapshot:
+    def __init__(self, data):
+        self.version = data["version"]
+        self.sequence = tuple(data["sequence"])
+        self.published_at = data["published_at"]
+        self.totals = data["totals"]
+        # {candidate_id: votes}, "invalid" included; older snapshots lack it
+        self.candidate_totals = data.get("candidate_totals", {})
+        self._data = data
+        self._frames = None
+
+    # Tables become DataFrames on first use, so pages that only read the
+    # totals never import pandas
+    def _tables(self):
+        if self._frames is None:
+            import pandas as pd
+
+            data = self._data
+            self._frames = (
+                {category: pd.DataFrame(columns) for category, columns in data["categories"].items()},
+                pd.DataFrame(data["parties"]),
+                pd.DataFrame(data["boxes"])
+            )
+        return self._frames
+
+    @property
+    def categories(self):
+        return self._tables()[0]
+
+    @property
+    def parties(self):
+        return self._tables()[1]
+
+    @property
+    def boxes(self):
+        return self._tables()[2]
+
+
+class SnapshotReader:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._snapshot = None
+
+    # Latest published snapshot (shared, read-only), or None before the first
+    # one; costs a stat unless a new version was published
+    def latest(self):
+        latest_path = os.path.join(self.directory, LATEST_FILE)
+        try:
+            stat = os.stat(latest_path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            if stamp == self._stamp:
+                return self._snapshot
+
+            pointer = _read_json(latest_path)
+            if self._snapshot is None or pointer["version"] != self._snapshot.version:
+                try:
+                    data = _read_json(os.path.join(self.directory, pointer["file"]))
+                except FileNotFoundError:
+                    # Pruned by a newer publish; keep serving what we have
+                    return self._snapshot
+                self._snapshot = ResultsSnapshot(data)
+            self._stamp = stamp
+            return self._snapshot
@@ -0,0 +1,435 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from locking import atomic_write_json, file_lock
+from storage import JsonStorage
+from vote_journal import VoteJournal, ballot_deltas
+
+# Per-box sharded ballot storage
+#
+# Every electoral box gets its own shard directory holding a ballot journal
+# (see vote_journal.py) and a counts.json checkpoint, so counters on
+# different boxes never take the same lock or write the same file. The
+# layout under the shards directory is:
+#
+#   manifest.json            {"epoch", "root", "boxes": {box_id: shard number}}
+#   gen-000001/heads.bin     (shard, journal position) after every append
+#   gen-000001/box-000000/   one box: votes-*.jsonl + .idx, counts.json
+#
+# heads.bin is the only file shared by all boxes: each append adds one
+# 16-byte record with a single O_APPEND write, no lock. It tells readers
+# which shards moved, so versions and "ballots since" cost a stat and a
+# short read instead of a scan of every shard. Reading the heads up to some
+# offset gives every shard's position at that point (the "frontier"), which
+# is what a consistent load reads each shard up to.
+#
+# counts.json is rewritten every COUNTS_CHECKPOINT_RECORDS journal records,
+# so loading a box's counts replays at most that many ballots. Loading all
+# boxes reads the shards on a process pool once there are
+# PARALLEL_MERGE_MIN_SHARDS of them. compact() brings every counts.json up to
+# its shard's head and archives the journal segments before it.
+#
+# Other datasets (users, candidates, ...) stay plain JSON files, handled as
+# in JsonStorage. Saving the votes dataset wholesale (migration, restore)
+# writes a new generation directory and switches the manifest to it; the old
+# one is left in place. Vote counts are derived from the ballots and can't be
+# saved on their own; a migration seeds every shard's counts.json with the
+# counts it carries over, and later ballots add to those.
+
+SHARDS_DIR = "data/shards"
+MANIFEST_FILE = "manifest.json"
+HEADS_FILE = "heads.bin"
+COUNTS_FILE = "counts.json"
+COUNTS_CHECKPOINT_RECORDS = 256
+PARALLEL_MERGE_MIN_SHARDS = 4000
+FRONTIER_CACHE_SIZE = 16
+
+_HEAD = struct.Struct("<QQ")
+
+
+def _read_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+# Counts of one shard up to journal position `stop`, from its checkpoint plus
+# the records after it; module level so pool workers can run it
+def shard_counts(directory, stop):
+    checkpoint = _read_json(os.path.join(directory, COUNTS_FILE), {"position": 0, "counts": {}})
+    if checkpoint["position"] <= stop:
+        position, counts = checkpoint["position"], dict(checkpoint["counts"])
+    else:
+        # Checkpoint written after the frontier was taken; replay from scratch
+        position, counts = 0, {}
+    for _, record in VoteJournal(directory).read(position, stop):
+        for candidate_id, count in ballot_deltas(record):
+            counts[candidate_id] = counts.get(candidate_id, 0) + count
+    return counts
+
+
+# {vote_id: ballot} of one shard up to journal position `stop`
+def shard_votes(directory, stop):
+    votes = {}
+    for _, record in VoteJournal(directory).read(0, stop):
+        votes[record["vote_id"]] = {
+            key: value for key, value in record.items() if key not in ("box_id", "vote_id")
+        }
+    return votes
+
+
+# Run `function(directory, stop)` for every job, on a process pool when there
+# are enough shards to make it pay for the worker start-up
+def map_shards(function, jobs, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) < PARALLEL_MERGE_MIN_SHARDS or workers < 2:
+        return [function(directory, stop) for directory, stop in jobs]
+    # spawn, not fork: Streamlit's server threads may be holding locks
+    context = multiprocessing.get_context("spawn")
+    chunksize = math.ceil(len(jobs) / (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        directories = [directory for directory, _ in jobs]
+        stops = [stop for _, stop in jobs]
+        return list(pool.map(function, directories, stops, chunksize=chunksize))
+
+
+class ShardedStorage(JsonStorage):
+    def __init__(self, votes_file, vote_counts_file, shards_dir=SHARDS_DIR, workers=None):
+        super().__init__(votes_file, vote_counts_file, journal=None)
+        self.shards_dir = shards_dir
+        self.workers = workers
+        self._manifest_path = os.path.join(shards_dir, MANIFEST_FILE)
+        self._manifest_lock = file_lock(self._manifest_path)
+        self._lock = threading.Lock()
+        self._manifest_stamp = None
+        self._manifest_data = None
+        self._journals = {}
+        self._checkpoints = {}
+        self._frontiers = OrderedDict()
+        os.makedirs(shards_dir, exist_ok=True)
+
+    # Manifest
+
+    def _manifest(self):
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            with self._manifest_lock:
+                if not os.path.exists(self._manifest_path):
+                    os.makedirs(os.path.join(self.shards_dir, "gen-000001"), exist_ok=True)
+                    atomic_write_json(
+                        {"format": 1, "epoch": 1, "root": "gen-000001", "boxes": {}},
+                        self._manifest_path
+                    )
+            return self._manifest()
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._manifest_stamp:
+                manifest = _read_json(self._manifest_path, None)
+                manifest["shards"] = {shard: box_id for box_id, shard in manifest["boxes"].items()}
+                self._manifest_data = manifest
+                self._manifest_stamp = stamp
+            return self._manifest_data
+
+    def _shard_dir(self, manifest, shard):
+        return os.path.join(self.shards_dir, manifest["root"], f"box-{shard:06d}")
+
+    # Shard number for a box, registering the box on its first ballot
+    def _shard_for(self, box_id):
+        manifest = self._manifest()
+        shard = manifest["boxes"].get(box_id)
+        if shard is not None:
+            return manifest, shard
+        with self._manifest_lock:
+            manifest = _read_json(self._manifest_path, None)
+            shard = manifest["boxes"].get(box_id)
+            if shard is None:
+                shard = len(manifest["boxes"])
+                manifest["boxes"][box_id] = shard
+                os.makedirs(self._shard_dir(manifest, shard), exist_ok=True)
+                atomic_write_json(manifest, self._manifest_path)
+        return self._manifest(), shard
+
+    def _journal(self, directory):
+        with self._lock:
+            journal = self._journals.get(directory)
+            if journal is None:
+                journal = self._journals[directory] = VoteJournal(directory)
+            return journal
+
+    # Heads and frontiers
+
+    def _heads_path(self, manifest):
+        return os.path.join(self.shards_dir, manifest["root"], HEADS_FILE)
+
+    def _heads_size(self, manifest):
+        try:
+            size = os.path.getsize(self._heads_path(manifest))
+        except FileNotFoundError:
+            return 0
+        return size - size % _HEAD.size
+
+    def _read_heads(self, manifest, start, stop):
+        if stop <= start:
+            return []
+        with open(self._heads_path(manifest), "rb") as f:
+            f.seek(start)
+            raw = f.read(stop - start)
+        return list(_HEAD.iter_unpack(raw[:len(raw) - len(raw) % _HEAD.size]))
+
+    # {shard: journal position} as of heads offset `offset`, built on the
+    # nearest cached frontier at or before it
+    def _frontier(self, manifest, offset):
+        epoch = manifest["epoch"]
+        with self._lock:
+            base_offset, base = 0, {}
+            for (cached_epoch, cached_offset), frontier in self._frontiers.items():
+                if cached_epoch == epoch and base_offset <= cached_offset <= offset:
+                    base_offset, base = cached_offset, frontier
+        if base_offset == offset:
+            return base
+
+        frontier = dict(base)
+        for shard, position in self._read_heads(manifest, base_offset, offset):
+            # A shard written empty (position 0) still belongs to the frontier
+            if shard not in frontier or position > frontier[shard]:
+                frontier[shard] = position
+        with self._lock:
+            self._frontiers[(epoch, offset)] = frontier
+            while len(self._frontiers) > FRONTIER_CACHE_SIZE:
+                self._frontiers.popitem(last=False)
+        return frontier
+
+    # Ballots appended between two heads offsets of the same epoch
+    def _records_between(self, manifest, start, stop):
+        frontier = self._frontier(manifest, start)
+        ranges = {}
+        for shard, position in self._read_heads(manifest, start, stop):
+            begin, end = ranges.get(shard, (frontier.get(shard, 0), 0))
+            ranges[shard] = (begin, max(end, position))
+
+        records = []
+        for shard, (begin, end) in ranges.items():
+            if begin < end:
+                journal = self._journal(self._shard_dir(manifest, shard))
+                records.extend(record for _, record in journal.read(begin, end))
+        return records
+
+    def _publish_head(self, manifest, shard, position):
+        fd = os.open(self._heads_path(manifest), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, _HEAD.pack(shard, position))
+        finally:
+            os.close(fd)
+
+    # Storage interface
+
+    # Manifest plus the (epoch, heads offset) version of the ballot datasets
+    def _ballot_version(self):
+        manifest = self._manifest()
+        return manifest, (manifest["epoch"], self._heads_size(manifest))
+
+    def version(self, file_path):
+        if not self._is_journaled(file_path):
+            return super().version(file_path)
+        return self._ballot_version()[1]
+
+    def _load_ballot_dataset(self, file_path, manifest, offset):
+        frontier = self._frontier(manifest, offset)
+        if any(shard not in manifest["shards"] for shard in frontier):
+            # Boxes registered after the manifest was read; boxes only get added
+            manifest = self._manifest()
+        box_ids = [manifest["shards"][shard] for shard in frontier]
+        jobs = [(self._shard_dir(manifest, shard), stop) for shard, stop in frontier.items()]
+        read = shard_votes if file_path == self.votes_file else shard_counts
+        return dict(zip(box_ids, map_shards(read, jobs, self.workers)))
+
+    def load_versioned(self, file_path):
+        if not self._is_journaled(file_path):
+            return super().load_versioned(file_path)
+        manifest, version = self._ballot_version()
+        return version, self._load_ballot_dataset(file_path, manifest, version[1])
+
+    def refresh(self, file_path, version, data):
+        if not self._is_journaled(file_path):
+            return super().refresh(file_path, version, data)
+        manifest, current = self._ballot_version()
+        if current == version:
+            return version, data
+        if current[0] != version[0]:
+            return None
+
+        records = self._records_between(manifest, version[1], current[1])
+        data = dict(data)
+        for box_id in {record["box_id"] for record in records}:
+            data[box_id] = dict(data.get(box_id, {}))
+        self._apply(file_path, data, records)
+        return current, data
+
+    def save(self, data, file_path):
+        if not self._is_journaled(file_path):
+            return super().save(data, file_path)
+        if file_path == self.vote_counts_file:
+            raise ValueError("Vote counts are derived from the ballot shards; save the votes instead")
+
+        self.restore(data)
+
+    # Write `votes` as a complete new generation, then switch the manifest to
+    # it. Each shard's counts checkpoint is `counts[box_id]` when given (a
+    # migration carrying published counts across), else recounted from the
+    # ballots; boxes with counts but no ballots get an empty shard.
+    def restore(self, votes, counts=None):
+        box_ids = list(votes)
+        if counts is not None:
+            box_ids.extend(box_id for box_id in counts if box_id not in votes)
+        with self._manifest_lock:
+            current = self._manifest()
+            epoch = current["epoch"] + 1
+            manifest = {"format": 1, "epoch": epoch, "root": f"gen-{epoch:06d}", "boxes": {}}
+            os.makedirs(os.path.join(self.shards_dir, manifest["root"]), exist_ok=True)
+            for shard, box_id in enumerate(box_ids):
+                manifest["boxes"][box_id] = shard
+                directory = self._shard_dir(manifest, shard)
+                records = [
+                    {"box_id": box_id, "vote_id": vote_id, **ballot}
+                    for vote_id, ballot in votes.get(box_id, {}).items()
+                ]
+                journal = VoteJournal(directory)
+                position = journal.append(records)
+                if counts is None:
+                    box_counts = shard_counts(directory, position)
+                else:
+                    box_counts = dict(counts.get(box_id, {}))
+                atomic_write_json(
+                    {"position": position, "counts": box_counts},
+                    os.path.join(directory, COUNTS_FILE)
+                )
+                self._publish_head(manifest, shard, position)
+            atomic_write_json(manifest, self._manifest_path)
+
+    # Each box's ballots are one append to its own shard; boxes don't share
+    # a lock, so a batch spanning several boxes is atomic per box only
+    def record_ballots(self, records):
+        by_box = {}
+        for record in records:
+            by_box.setdefault(record["box_id"], []).append(record)
+
+        for box_id, box_records in by_box.items():
+            manifest, shard = self._shard_for(box_id)
+            directory = self._shard_dir(manifest, shard)
+            journal = self._journal(directory)
+            with file_lock(os.path.join(directory, "append")):
+                position = journal.append(box_records)
+                self._publish_head(manifest, shard, position)
+
+                checkpoint = self._checkpoints.get(directory)
+                if checkpoint is None:
+                    checkpoint = _read_json(os.path.join(directory, COUNTS_FILE), {"position": 0})["position"]
+                if position - checkpoint >= COUNTS_CHECKPOINT_RECORDS:
+                    atomic_write_json(
+                        {"position": position, "counts": shard_counts(directory, position)},
+                        os.path.join(directory, COUNTS_FILE)
+                    )
+                    checkpoint = position
+                self._checkpoints[directory] = checkpoint
+
+    def existing_vote_ids(self, vote_ids):
+        manifest, current = self._ballot_version()
+        if self._vote_ids is None or current[0] != self._vote_ids_version[0]:
+            version, votes = self.load_versioned(self.votes_file)
+            self._vote_ids = {vote_id for box_votes in votes.values() for vote_id in box_votes}
+            self._vote_ids_version = version
+        elif current != self._vote_ids_version:
+            for record in self._records_between(manifest, self._vote_ids_version[1], current[1]):
+                self._vote_ids.add(record["vote_id"])
+            self._vote_ids_version = current
+        return {vote_id for vote_id in vote_ids if vote_id in self._vote_ids}
+
+    def ballots_since(self, cursor):
+        manifest, current = self._ballot_version()
+        if current[0] != cursor[0]:
+            return None
+        return current, self._records_between(manifest, cursor[1], current[1])
+
+    def iter_ballots(self, cursor):
+        manifest = self._manifest()
+        if manifest["epoch"] != cursor[0]:
+            raise ValueError("The ballot store was replaced since the counts were read")
+        for shard, stop in self._frontier(manifest, cursor[1]).items():
+            for _, record in self._journal(self._shard_dir(manifest, shard)).read(0, stop):
+                yield record
+
+    # Checkpoint every shard's counts at its current position and archive
+    # the journal segments before it
+    def compact(self):
+        manifest = self._manifest()
+        archived = 0
+        for shard in manifest["shards"]:
+            directory = self._shard_dir(manifest, shard)
+            journal = self._journal(directory)
+            with file_lock(os.path.join(directory, "append")):
+                position = journal.position()
+                atomic_write_json(
+                    {"position": position, "counts": shard_counts(directory, position)},
+                    os.path.join(directory, COUNTS_FILE)
+                )
+                self._checkpoints[directory] = position
+                archived += journal.archive_before(position)
+        return {"shards": len(manifest["shards"]), "archived_segments": archived}
+
+
+# Copy the ballots of the JSON layout (votes.json plus journal) into shards.
+# The stored vote counts are carried across as they are, so migrating never
+# changes published results, even where they disagree with the ballots (see
+# compaction.verify_counts). Returns (boxes, ballots).
+def migrate_json_to_sharded(data_dir, shards_dir):
+    source = JsonStorage(
+        os.path.join(data_dir, "votes.json"),
+        os.path.join(data_dir, "vote_counts.json"),
+        VoteJournal(os.path.join(data_dir, "journal"))
+    )
+    votes_file = os.path.join(data_dir, "votes.json")
+    target = ShardedStorage(votes_file, os.path.join(data_dir, "vote_counts.json"), shards_dir)
+    # Ballots and counts as of the same journal position
+    while True:
+        version = source.version(votes_file)
+        counts, _ = source.load_counts_with_cursor()
+        votes = source.load(votes_file)
+        if source.version(votes_file) == version:
+            break
+    target.restore(votes, counts)
+    return len(set(votes) | set(counts)), sum(len(box_votes) for box_votes in votes.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded ballot storage tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subcommands.add_parser("migrate", help="Copy data/votes.json and the journal into shards")
+    migrate.add_argument("--data-dir", default="data")
+    migrate.add_argument("--shards", default=SHARDS_DIR)
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        boxes, ballots = migrate_json_to_sharded(args.data_dir, args.shards)
+        print(f"boxes: {boxes}")
+        print(f"ballots: {ballots}")
+
+        from compaction import verify_counts
+
+        storage = ShardedStorage(
+            os.path.join(args.data_dir, "votes.json"), os.path.join(args.data_dir, "vote_counts.json"), args.shards
+        )
+        _, drift = verify_counts(storage)
+        if drift:
+            print(f"Note: the stored counts, carried over unchanged, differ from a recount "
+                  f"of the ballots in {len(drift)} places (python compaction.py verify)")
@@ -0,0 +1,838 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from types import MappingProxyType
+
+from locking import atomic_write_json, file_lock
+from metrics import count_bytes
+from vote_journal import VoteJournal, apply_to_votes, apply_to_counts, ballot_deltas
+
+# Storage backends
+#
+# The app talks to persistence through load/save of whole datasets (named
+# after the original JSON files) plus record_ballots for the vote hot path.
+# JsonStorage keeps the original data/*.json layout; SqliteStorage keeps the
+# same datasets in indexed tables so each ballot is one short transaction.
+#
+# Code that reads a dataset, changes it and saves it back must hold
+# lock(file_path) for the whole read-modify-write so concurrent sessions
+# don't lose each other's updates.
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+# Dataset name for a file path, e.g. "data/vote_counts.json" -> "vote_counts"
+def dataset_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+class Storage(ABC):
+    def __init__(self):
+        self._leases = {}
+        self._leases_lock = threading.Lock()
+
+    def load(self, file_path):
+        return self.load_versioned(file_path)[1]
+
+    # Cheap token that changes whenever the dataset changes
+    @abstractmethod
+    def version(self, file_path):
+        pass
+
+    # (version, data) read consistently with each other
+    @abstractmethod
+    def load_versioned(self, file_path):
+        pass
+
+    # Bring previously loaded data up to date without a full reload where
+    # possible; returns (version, data), or None if a full reload is needed.
+    # `data` is never modified, changed parts are copied.
+    def refresh(self, file_path, version, data):
+        if self.version(file_path) == version:
+            return version, data
+        return None
+
+    @abstractmethod
+    def save(self, data, file_path):
+        pass
+
+    # Exclusive lock for read-modify-write of one dataset
+    @abstractmethod
+    def lock(self, file_path):
+        pass
+
+    # Persist ballots given as {"box_id", "vote_id", ...ballot fields}
+    @abstractmethod
+    def record_ballots(self, records):
+        pass
+
+    # Which of these vote IDs are already recorded in the main store
+    @abstractmethod
+    def existing_vote_ids(self, vote_ids):
+        pass
+
+    # Vote counts plus a cursor marking the last ballot they include
+    @abstractmethod
+    def load_counts_with_cursor(self):
+        pass
+
+    # (cursor, ballots recorded after `cursor`), or None if the counts were
+    # replaced wholesale and must be reloaded
+    @abstractmethod
+    def ballots_since(self, cursor):
+        pass
+
+    # Take or renew the named lease for `ttl` seconds; True if `holder` has
+    # it. Expiry is wall-clock time; leases only coordinate processes on one
+    # host, since the store's locking doesn't hold across hosts. By default
+    # leases are kept in this object, i.e. for this process only; backends
+    # whose store is shared override both lease methods.
+    def acquire_lease(self, name, holder, ttl):
+        now = time.time()
+        with self._leases_lock:
+            lease = self._leases.get(name)
+            if lease is not None and lease[0] != holder and lease[1] > now:
+                return False
+            self._leases[name] = (holder, now + ttl)
+            return True
+
+    # (holder, expires_at) of the named lease, or None if nobody holds it
+    def lease_holder(self, name):
+        with self._leases_lock:
+            lease = self._leases.get(name)
+        if lease is None or lease[1] <= time.time():
+            return None
+        return lease
+
+    # Checkpoint the counts and archive what later loads no longer need to
+    # replay; returns a summary dict. Nothing to do by default.
+    def compact(self):
+        return {}
+
+
+# Storage that can stream back every ballot, for recounts (compaction,
+# audit); the built-in backends all can
+class BallotScan(ABC):
+    # Every ballot included in the counts returned with `cursor` by
+    # load_counts_with_cursor(), read one at a time
+    @abstractmethod
+    def iter_ballots(self, cursor):
+        pass
+
+
+# (box_id, vote_id, ballot) from a votes.json file without loading it whole;
+# memory stays at one chunk plus one ballot
+def iter_votes_file(path, chunk_size=1 << 20):
+    decoder = json.JSONDecoder()
+    try:
+        f = open(path, "r")
+    except FileNotFoundError:
+        return
+    with f:
+        buffer, pos = "", 0
+
+        # Position of the next non-blank character, reading more as needed
+        def skip_blank():
+            nonlocal buffer, pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return None
+                buffer, pos = buffer[pos:] + chunk, 0
+
+        def expect(chars):
+            nonlocal pos
+            char = skip_blank()
+            if char is None or char not in chars:
+                raise ValueError(f"{path} is corrupt: expected {chars!r}, found {char!r}")
+            pos += 1
+            return char
+
+        def value():
+            nonlocal buffer, pos
+            skip_blank()
+            while True:
+                try:
+                    result, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        raise ValueError(f"{path} is corrupt: truncated value")
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                pos = end
+                return result
+
+        # Empty file, as load_versioned treats it
+        if skip_blank() is None:
+            return
+        expect("{")
+        if skip_blank() == "}":
+            return
+        while True:
+            box_id = value()
+            expect(":")
+            expect("{")
+            if skip_blank() == "}":
+                pos += 1
+            else:
+                while True:
+                    vote_id = value()
+                    expect(":")
+                    yield box_id, vote_id, value()
+                    if expect(",}") == "}":
+                        break
+            if expect(",}") == "}":
+                return
+
+
+class JsonStorage(Storage, BallotScan):
+    def __init__(self, votes_file, vote_counts_file, journal):
+        super().__init__()
+        self.votes_file = votes_file
+        self.vote_counts_file = vote_counts_file
+        self.journal = journal
+        self._vote_ids = None
+        self._vote_ids_version = None
+
+    def _is_journaled(self, file_path):
+        return file_path == self.votes_file or file_path == self.vote_counts_file
+
+    def _apply(self, file_path, data, records):
+        apply = apply_to_votes if file_path == self.votes_file else apply_to_counts
+        for record in records:
+            apply(data, record)
+
+    # File identity plus, for votes and vote counts, the journal position
+    def version(self, file_path):
+        try:
+            stat = os.stat(file_path)
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if self._is_journaled(file_path):
+            return stamp, self.journal.position()
+        return stamp, None
+
+    def _read_file(self, file_path):
+        try:
+            with open(file_path, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = ""
+        count_bytes(read=len(content))
+
+        # A file that doesn't parse is an error, not an empty dataset: treating
+        # it as {} would let the next save wipe everything it held
+        try:
+            return json.loads(content) if content.strip() else {}
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{file_path} is corrupt: {e}") from e
+
+    def _checkpoint_path(self):
+        return os.path.join(self.journal.directory, CHECKPOINT_FILE)
+
+    # Counts checkpoint written by compact(), if it was taken on top of this
+    # exact vote_counts.json (a replaced file makes it stale)
+    def _checkpoint(self, stamp):
+        try:
+            with open(self._checkpoint_path(), "r") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        if checkpoint["base"] != (list(stamp) if stamp else None):
+            return None
+        return checkpoint
+
+    def load_versioned(self, file_path):
+        version = self.version(file_path)
+        start, data = 0, None
+        if file_path == self.vote_counts_file:
+            checkpoint = self._checkpoint(version[0])
+            if checkpoint is not None and checkpoint["position"] <= version[1]:
+                start, data = checkpoint["position"], checkpoint["counts"]
+        if data is None:
+            data = self._read_file(file_path)
+
+        # Replay journaled ballots on top of the snapshot (or checkpoint),
+        # stopping at the position the version was taken at
+        if self._is_journaled(file_path):
+            self._apply(file_path, data, (record for _, record in self.journal.read(start, version[1])))
+
+        return version, data
+
+    # Only new journal records are read when the snapshot itself is unchanged
+    def refresh(self, file_path, version, data):
+        current = self.version(file_path)
+        if current == version:
+            return version, data
+        if not self._is_journaled(file_path) or current[0] != version[0]:
+            return None
+
+        records = [record for _, record in self.journal.read(version[1], current[1])]
+        data = dict(data)
+        for box_id in {record["box_id"] for record in records}:
+            data[box_id] = dict(data.get(box_id, {}))
+        self._apply(file_path, data, records)
+        return current, data
+
+    def save(self, data, file_path):
+        with file_lock(file_path):
+            atomic_write_json(data, file_path)
+
+    def lock(self, file_path):
+        return file_lock(file_path)
+
+    def record_ballots(self, records):
+        self.journal.append(records)
+
+    def load_counts_with_cursor(self):
+        version, data = self.load_versioned(self.vote_counts_file)
+        return data, version
+
+    # Kept as a set that only reads new journal records between calls
+    def existing_vote_ids(self, vote_ids):
+        current = self.version(self.votes_file)
+        if self._vote_ids is None or current[0] != self._vote_ids_version[0]:
+            version, votes = self.load_versioned(self.votes_file)
+            self._vote_ids = {vote_id for box_votes in votes.values() for vote_id in box_votes}
+            self._vote_ids_version = version
+        elif current != self._vote_ids_version:
+            for _, record in self.journal.read(self._vote_ids_version[1], current[1]):
+                self._vote_ids.add(record["vote_id"])
+            self._vote_ids_version = current
+        return {vote_id for vote_id in vote_ids if vote_id in self._vote_ids}
+
+    def ballots_since(self, cursor):
+        current = self.version(self.vote_counts_file)
+        if current[0] != cursor[0]:
+            return None
+        return current, [record for _, record in self.journal.read(cursor[1], current[1])]
+
+    def iter_ballots(self, cursor):
+        for box_id, vote_id, ballot in iter_votes_file(self.votes_file):
+            yield {"box_id": box_id, "vote_id": vote_id, **ballot}
+        for _, record in self.journal.read(0, cursor[1]):
+            yield record
+
+    # Counts checkpoint at the current journal position, so loading the
+    # counts replays only what comes after it, then archive the segments
+    # before it
+    def compact(self):
+        with file_lock(self._checkpoint_path()):
+            (stamp, position), counts = self.load_versioned(self.vote_counts_file)
+            atomic_write_json({
+                "base": list(stamp) if stamp else None,
+                "position": position,
+                "counts": counts,
+                "written_at": datetime.now().isoformat()
+            }, self._checkpoint_path())
+            archived = self.journal.archive_before(position)
+        return {"checkpoint_position": position, "boxes": len(counts), "archived_segments": archived}
+
+    # Leases live in small files next to votes.json
+    def _lease_file(self, name):
+        return os.path.join(os.path.dirname(self.votes_file) or ".", f"lease-{name}.json")
+
+    def _read_lease(self, path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def acquire_lease(self, name, holder, ttl):
+        path = self._lease_file(name)
+        with file_lock(path):
+            now = time.time()
+            lease = self._read_lease(path)
+            if lease is not None and lease["holder"] != holder and lease["expires_at"] > now:
+                return False
+            atomic_write_json({"holder": holder, "expires_at": now + ttl}, path)
+            return True
+
+    def lease_holder(self, name):
+        lease = self._read_lease(self._lease_file(name))
+        if lease is None or lease["expires_at"] <= time.time():
+            return None
+        return lease["holder"], lease["expires_at"]
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    party TEXT,
+    category TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS candidates_category ON candidates (category);
+CREATE TABLE IF NOT EXISTS electoral_boxes (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    location TEXT,
+    registered_voters INTEGER,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS electoral_boxes_name ON electoral_boxes (name);
+CREATE TABLE IF NOT EXISTS ballots (
+    vote_id TEXT PRIMARY KEY,
+    box_id TEXT NOT NULL,
+    candidates TEXT,
+    counts TEXT,
+    recorded_by TEXT,
+    recorded_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ballots_box ON ballots (box_id);
+CREATE TABLE IF NOT EXISTS offline_votes (
+    vote_id TEXT PRIMARY KEY,
+    box_id TEXT NOT NULL,
+    candidates TEXT,
+    counts TEXT,
+    recorded_by TEXT,
+    recorded_at TEXT
+);
+CREATE TABLE IF NOT EXISTS dataset_versions (
+    name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS box_counts (
+    box_id TEXT NOT NULL,
+    candidate_id TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (box_id, candidate_id)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Column layout of the keyed record tables, key column first
+_RECORD_TABLES = {
+    "users": ("username", "password", "role", "created_at"),
+    "candidates": ("id", "name", "party", "category", "created_at"),
+    "electoral_boxes": ("id", "name", "location", "registered_voters", "created_at"),
+}
+
+# Tables holding ballots in the votes.json layout (box -> vote_id -> ballot)
+_BALLOT_TABLES = {
+    "votes": "ballots",
+    "offline_votes": "offline_votes",
+}
+
+
+# ballots row (vote_id, box_id, candidates, counts, recorded_by, recorded_at)
+# -> journal-style record
+def _ballot_record(row):
+    vote_id, box_id, candidates, counts, recorded_by, recorded_at = row
+    record = {"box_id": box_id, "vote_id": vote_id}
+    if candidates is not None:
+        record["candidates"] = json.loads(candidates)
+    if counts is not None:
+        record["counts"] = json.loads(counts)
+    record["recorded_by"] = recorded_by
+    record["recorded_at"] = recorded_at
+    return record
+
+
+def _ballot_row(box_id, vote_id, ballot):
+    candidates = ballot.get("candidates")
+    counts = ballot.get("counts")
+    return (
+        vote_id,
+        box_id,
+        json.dumps(candidates) if candidates is not None else None,
+        json.dumps(counts) if counts is not None else None,
+        ballot.get("recorded_by"),
+        ballot.get("recorded_at"),
+    )
+
+
+class SqliteStorage(Storage, BallotScan):
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    # One connection per thread; Streamlit runs each session on its own thread
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            # WAL needs every connection on the same host (shared memory index)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _connect(self, write=True):
+        return _Transaction(self._connection(), "BEGIN IMMEDIATE" if write else "BEGIN")
+
+    def _version(self, conn, name):
+        row = conn.execute(
+            "SELECT generation FROM dataset_versions WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _bump_versions(self, conn, *names):
+        conn.executemany(
+            "INSERT INTO dataset_versions (name, generation) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET generation = generation + 1",
+            [(name,) for name in names]
+        )
+
+    # Generation counter bumped in the same transaction as every write
+    def version(self, file_path):
+        with self._connect(write=False) as conn:
+            return self._version(conn, dataset_name(file_path))
+
+    def load_versioned(self, file_path):
+        name = dataset_name(file_path)
+        with self._connect(write=False) as conn:
+            return self._version(conn, name), self._load(conn, name)
+
+    def _load(self, conn, name):
+        if name in _RECORD_TABLES:
+            columns = _RECORD_TABLES[name]
+            data = {}
+            for row in conn.execute(f"SELECT {', '.join(columns)} FROM {name}"):
+                data[row[0]] = {
+                    column: value
+                    for column, value in zip(columns[1:], row[1:])
+                    if value is not None
+                }
+            return data
+
+        if name in _BALLOT_TABLES:
+            data = {}
+            rows = conn.execute(
+                "SELECT vote_id, box_id, candidates, counts, recorded_by, recorded_at "
+                f"FROM {_BALLOT_TABLES[name]} ORDER BY rowid"
+            )
+            for vote_id, box_id, candidates, counts, recorded_by, recorded_at in rows:
+                ballot = {}
+                if candidates is not None:
+                    ballot["candidates"] = json.loads(candidates)
+                if counts is not None:
+                    ballot["counts"] = json.loads(counts)
+                ballot["recorded_by"] = recorded_by
+                ballot["recorded_at"] = recorded_at
+                data.setdefault(box_id, {})[vote_id] = ballot
+            return data
+
+        if name == "vote_counts":
+            data = {}
+            for box_id, candidate_id, count in conn.execute(
+                "SELECT box_id, candidate_id, count FROM box_counts"
+            ):
+                data.setdefault(box_id, {})[candidate_id] = count
+            return data
+
+        raise ValueError(f"Unknown dataset: {name}")
+
+    def lock(self, file_path):
+        return file_lock(f"{self.db_path}.{dataset_name(file_path)}")
+
+    def save(self, data, file_path):
+        name = dataset_name(file_path)
+        with self._connect() as conn:
+            if name in _RECORD_TABLES:
+                columns = _RECORD_TABLES[name]
+                conn.execute(f"DELETE FROM {name}")
+                conn.executemany(
+                    f"INSERT INTO {name} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)})",
+                    [
+                        (key,) + tuple(details.get(column) for column in columns[1:])
+                        for key, details in data.items()
+                    ]
+                )
+            elif name in _BALLOT_TABLES:
+                table = _BALLOT_TABLES[name]
+                conn.execute(f"DELETE FROM {table}")
+                conn.executemany(
+                    f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        _ballot_row(box_id, vote_id, ballot)
+                        for box_id, box_votes in data.items()
+                        for vote_id, ballot in box_votes.items()
+                    ]
+                )
+            elif name == "vote_counts":
+                conn.execute("DELETE FROM box_counts")
+                conn.executemany(
+                    "INSERT INTO box_counts VALUES (?, ?, ?)",
+                    [
+                        (box_id, candidate_id, count)
+                        for box_id, box_counts in data.items()
+                        for candidate_id, count in box_counts.items()
+                    ]
+                )
+            else:
+                raise ValueError(f"Unknown dataset: {file_path}")
+            self._bump_versions(conn, name)
+            if name in ("votes", "vote_counts"):
+                # Ballot cursors taken before this point no longer line up
+                self._bump_versions(conn, "ballot_epoch")
+
+    # Insert the ballots and upsert their per-box counts in one transaction
+    def record_ballots(self, records):
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO ballots VALUES (?, ?, ?, ?, ?, ?)",
+                [_ballot_row(record["box_id"], record["vote_id"], record) for record in records]
+            )
+            conn.executemany(
+                "INSERT INTO box_counts (box_id, candidate_id, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (box_id, candidate_id) DO UPDATE SET count = count + excluded.count",
+                [
+                    (record["box_id"], candidate_id, count)
+                    for record in records
+                    for candidate_id, count in ballot_deltas(record)
+                ]
+            )
+            self._bump_versions(conn, "votes", "vote_counts")
+
+    def existing_vote_ids(self, vote_ids):
+        vote_ids = list(vote_ids)
+        existing = set()
+        with self._connect(write=False) as conn:
+            for start in range(0, len(vote_ids), 500):
+                batch = vote_ids[start:start + 500]
+                existing.update(
+                    vote_id for (vote_id,) in conn.execute(
+                        f"SELECT vote_id FROM ballots WHERE vote_id IN ({', '.join('?' for _ in batch)})",
+                        batch
+                    )
+                )
+        return existing
+
+    # Cursor is (epoch, last ballot rowid); writers serialise, so rowids
+    # become visible in order
+    def load_counts_with_cursor(self):
+        with self._connect(write=False) as conn:
+            epoch = self._version(conn, "ballot_epoch")
+            last_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM ballots").fetchone()[0]
+            return self._load(conn, "vote_counts"), (epoch, last_rowid)
+
+    def ballots_since(self, cursor):
+        with self._connect(write=False) as conn:
+            epoch = self._version(conn, "ballot_epoch")
+            if epoch != cursor[0]:
+                return None
+            last_rowid = cursor[1]
+            records = []
+            for row in conn.execute(
+                "SELECT rowid, vote_id, box_id, candidates, counts, recorded_by, recorded_at "
+                "FROM ballots WHERE rowid > ? ORDER BY rowid",
+                (cursor[1],)
+            ):
+                records.append(_ballot_record(row[1:]))
+                last_rowid = row[0]
+            return (epoch, last_rowid), records
+
+    # On a connection of its own, so the caller can keep using the storage
+    # while the generator is open
+    def iter_ballots(self, cursor):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            for row in conn.execute(
+                "SELECT vote_id, box_id, candidates, counts, recorded_by, recorded_at "
+                "FROM ballots WHERE rowid <= ? ORDER BY rowid",
+                (cursor[1],)
+            ):
+                yield _ballot_record(row)
+        finally:
+            conn.close()
+
+    # Counts are kept in the same transaction as every ballot, so there is
+    # nothing to replay; fold the WAL back into the database file instead
+    def compact(self):
+        busy, wal_pages, checkpointed = self._connection().execute(
+            "PRAGMA wal_checkpoint(TRUNCATE)"
+        ).fetchone()
+        return {"wal_pages": wal_pages, "checkpointed_pages": checkpointed, "busy": bool(busy)}
+
+    # Taken or renewed in one write transaction, so two nodes never both win
+    def acquire_lease(self, name, holder, ttl):
+        with self._connect() as conn:
+            now = time.time()
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != holder and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at",
+                (name, holder, now + ttl)
+            )
+            return True
+
+    def lease_holder(self, name):
+        with self._connect(write=False) as conn:
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0], row[1]
+
+
+# BEGIN ... COMMIT around a block, rolled back on error
+class _Transaction:
+    def __init__(self, conn, begin):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self):
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+# Process-wide cache in front of a backend
+#
+# Each dataset is parsed once per version; later loads only check the
+# version (a stat or one indexed query) and, for the ballot journal, read the
+# new records. Loaded data is shared between sessions, so it is handed out as
+# a read-only mapping; callers that change a dataset copy it first
+# (dict(...), under lock) and save the copy.
+class CachedStorage(Storage, BallotScan):
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.misses = 0
+
+    def version(self, file_path):
+        return self.backend.version(file_path)
+
+    def load_versioned(self, file_path):
+        entry = self._entries.get(file_path)
+        if entry is not None:
+            refreshed = self.backend.refresh(file_path, *entry)
+            if refreshed is not None:
+                with self._lock:
+                    if refreshed[0] == entry[0]:
+                        self.hits += 1
+                    else:
+                        self.refreshes += 1
+                        self._entries[file_path] = refreshed
+                return refreshed[0], MappingProxyType(refreshed[1])
+
+        version, data = self.backend.load_versioned(file_path)
+        with self._lock:
+            self.misses += 1
+            self._entries[file_path] = (version, data)
+        return version, MappingProxyType(data)
+
+    # Writes replace the cached copy instead of invalidating it
+    def save(self, data, file_path):
+        with self.backend.lock(file_path):
+            try:
+                self.backend.save(data, file_path)
+            except BaseException:
+                self._entries.pop(file_path, None)
+                raise
+            version = self.backend.version(file_path)
+        with self._lock:
+            self._entries[file_path] = (version, data)
+
+    def lock(self, file_path):
+        return self.backend.lock(file_path)
+
+    def record_ballots(self, records):
+        self.backend.record_ballots(records)
+
+    def existing_vote_ids(self, vote_ids):
+        return self.backend.existing_vote_ids(vote_ids)
+
+    def load_counts_with_cursor(self):
+        return self.backend.load_counts_with_cursor()
+
+    def ballots_since(self, cursor):
+        return self.backend.ballots_since(cursor)
+
+    def acquire_lease(self, name, holder, ttl):
+        return self.backend.acquire_lease(name, holder, ttl)
+
+    def lease_holder(self, name):
+        return self.backend.lease_holder(name)
+
+    def iter_ballots(self, cursor):
+        return self.backend.iter_ballots(cursor)
+
+    def compact(self):
+        return self.backend.compact()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "refreshes": self.refreshes,
+                "misses": self.misses,
+                "cached_datasets": len(self._entries),
+            }
+
+
+DATASETS = ("users", "candidates", "electoral_boxes", "votes", "vote_counts", "offline_votes")
+
+
+# Copy every dataset from the JSON layout into a SQLite database
+def migrate_json_to_sqlite(data_dir, db_path):
+    source = JsonStorage(
+        os.path.join(data_dir, "votes.json"),
+        os.path.join(data_dir, "vote_counts.json"),
+        VoteJournal(os.path.join(data_dir, "journal"))
+    )
+    target = SqliteStorage(db_path)
+
+    migrated = {}
+    for name in DATASETS:
+        file_path = os.path.join(data_dir, f"{name}.json")
+        data = source.load(file_path)
+        target.save(data, file_path)
+        if name in _BALLOT_TABLES or name == "vote_counts":
+            migrated[name] = sum(len(entries) for entries in data.values())
+        else:
+            migrated[name] = len(data)
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Election data storage tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subcommands.add_parser("migrate", help="Copy data/*.json into a SQLite database")
+    migrate.add_argument("--data-dir", default="data")
+    migrate.add_argument("--db", default="data/election.db")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        for name, count in migrate_json_to_sqlite(args.data_dir, args.db).items():
+            print(f"{name}: {count}")
@@ -0,0 +1,108 @@
+import bisect
+import threading
+
+# Indexed, paged views of keyed datasets (users, candidates, boxes)
+#
+# TableIndex turns a dataset ({key: details}) into display rows once and
+# indexes them:
+#
+#   - for every sortable column, the keys in that column's order, so an
+#     unfiltered page is a slice of a list, and
+#   - the words of the searchable columns as one sorted list of
+#     (word, key), so each search word is a prefix range found by bisection
+#     and a query is the intersection of its words' matches.
+#
+# Callers ask for one page of rows at a time and look rows up by key in
+# batches. TableIndexCache rebuilds the index only when the dataset's
+# version changes, like CatalogCache. The rows it hands out are shared and
+# must not be modified.
+
+
+def _sort_value(value):
+    # None sorts last; text case-insensitively
+    if value is None:
+        return (1, "")
+    if isinstance(value, str):
+        return (0, value.lower())
+    return (0, value)
+
+
+class TableIndex:
+    def __init__(self, data, row, sortable, searchable):
+        self.rows = {key: row(key, details) for key, details in data.items()}
+        self.sortable = list(sortable)
+        self._order = {
+            column: sorted(self.rows, key=lambda key: (_sort_value(self.rows[key][column]), key))
+            for column in self.sortable
+        }
+        self._ranks = {}
+        self._words = sorted({
+            (word, key)
+            for key, values in self.rows.items()
+            for column in searchable
+            for word in str(values[column] or "").lower().split()
+        })
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _rank(self, column):
+        rank = self._ranks.get(column)
+        if rank is None:
+            rank = self._ranks[column] = {key: i for i, key in enumerate(self._order[column])}
+        return rank
+
+    # Keys with a word starting with `prefix`
+    def _prefixed(self, prefix):
+        keys = set()
+        i = bisect.bisect_left(self._words, (prefix,))
+        while i < len(self._words) and self._words[i][0].startswith(prefix):
+            keys.add(self._words[i][1])
+            i += 1
+        return keys
+
+    # Keys matching every word of `query` by prefix, in ascending `sort`
+    # order; the unfiltered order is shared, don't modify it
+    def search(self, query, sort):
+        words = query.lower().split()
+        if not words:
+            return self._order[sort]
+        matches = self._prefixed(words[0])
+        for word in words[1:]:
+            if not matches:
+                break
+            matches &= self._prefixed(word)
+        return sorted(matches, key=self._rank(sort).__getitem__)
+
+    # Rows of `keys` (as returned by search) from `offset`, at most `limit`
+    def page(self, keys, offset, limit, descending=False):
+        if descending:
+            end = max(0, len(keys) - offset)
+            selected = keys[max(0, end - limit):end][::-1]
+        else:
+            selected = keys[offset:offset + limit]
+        return [self.rows[key] for key in selected]
+
+    # {key: row} for the keys that exist, in one call
+    def lookup(self, keys):
+        return {key: self.rows[key] for key in keys if key in self.rows}
+
+
+class TableIndexCache:
+    def __init__(self, storage, file_path, row, sortable, searchable):
+        self.storage = storage
+        self.file_path = file_path
+        self.row = row
+        self.sortable = sortable
+        self.searchable = searchable
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = None
+
+    def get(self):
+        version = self.storage.version(self.file_path)
+        with self._lock:
+            if self._index is None or version != self._version:
+                self._version, data = self.storage.load_versioned(self.file_path)
+                self._index = TableIndex(data, self.row, self.sortable, self.searchable)
+            return self._index
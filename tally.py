@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+
+from vote_journal import ballot_deltas
+
+# Running vote aggregates
+#
+# Built once from the stored vote counts, then kept current by folding in
+# only the ballots recorded since (storage.ballots_since), so reading totals
+# costs the same however many boxes or ballots exist. Ballots recorded by
+# other sessions or processes are picked up the same way on the next read.
+#
+# Every folded ballot bumps `generation` - a sequence number that only ever
+# grows - and is kept in a short change log, so derived views (the results
+# engine, live results subscriptions) can patch themselves instead of
+# rebuilding; `epoch` is bumped whenever the tally itself is rebuilt.
+#
+# sync(max_age) lets many readers share one check of the store per interval;
+# writers in this process call sync() right after writing, so their ballots
+# reach the change log immediately.
+
+INVALID = "invalid"
+CHANGE_LOG_SIZE = 10000
+
+
+class Tally:
+    def __init__(self, storage, candidates_file):
+        self.storage = storage
+        self.candidates_file = candidates_file
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._candidates_version = None
+        self._category_of = {}
+        self.box_counts = {}
+        self.candidate_totals = {}
+        self.category_totals = {}
+        self.counted_boxes = set()
+        self.epoch = 0
+        self.generation = 0
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._synced_at = None
+
+    def _add(self, box_id, candidate_id, count):
+        box_counts = self.box_counts.setdefault(box_id, {})
+        box_counts[candidate_id] = box_counts.get(candidate_id, 0) + count
+        self.candidate_totals[candidate_id] = self.candidate_totals.get(candidate_id, 0) + count
+        category = self._category_of.get(candidate_id)
+        if category is not None:
+            self.category_totals[category] = self.category_totals.get(category, 0) + count
+        if count:
+            self.counted_boxes.add(box_id)
+
+    def _rebuild_categories(self):
+        self.category_totals = {}
+        for candidate_id, count in self.candidate_totals.items():
+            category = self._category_of.get(candidate_id)
+            if category is not None:
+                self.category_totals[category] = self.category_totals.get(category, 0) + count
+
+    def _rebuild(self):
+        vote_counts, self._cursor = self.storage.load_counts_with_cursor()
+        self.epoch += 1
+        self._changes.clear()
+        self.box_counts = {}
+        self.candidate_totals = {}
+        self.category_totals = {}
+        self.counted_boxes = set()
+        for box_id, box_counts in vote_counts.items():
+            self.box_counts.setdefault(box_id, {})
+            for candidate_id, count in box_counts.items():
+                self._add(box_id, candidate_id, count)
+
+    # Bring the aggregates up to date; cheap when nothing changed. With
+    # max_age, skip the check if one ran less than max_age seconds ago
+    def sync(self, max_age=0):
+        with self._lock:
+            now = time.monotonic()
+            if max_age and self._synced_at is not None and now - self._synced_at < max_age:
+                return
+            self._synced_at = now
+
+            candidates_version = self.storage.version(self.candidates_file)
+            if candidates_version != self._candidates_version:
+                candidates = self.storage.load(self.candidates_file)
+                self._category_of = {
+                    candidate_id: details.get("category", "Uncategorized")
+                    for candidate_id, details in candidates.items()
+                }
+                self._candidates_version = candidates_version
+                self._rebuild_categories()
+
+            changes = self.storage.ballots_since(self._cursor) if self._cursor is not None else None
+            if changes is None:
+                self._rebuild()
+                return
+
+            self._cursor, records = changes
+            for record in records:
+                deltas = dict(ballot_deltas(record))
+                for candidate_id, count in deltas.items():
+                    self._add(record["box_id"], candidate_id, count)
+                self.generation += 1
+                self._changes.append((self.generation, record["box_id"], deltas))
+
+    # Consistent copy of the per-box counts with the (epoch, generation) it reflects
+    def snapshot(self, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            box_counts = {box_id: dict(counts) for box_id, counts in self.box_counts.items()}
+            return self.epoch, self.generation, box_counts
+
+    # (epoch, generation, [(generation, box_id, {candidate_id: delta})]) for
+    # ballots folded after `generation`, or None if the caller must re-snapshot
+    def changes_since(self, epoch, generation, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            if epoch != self.epoch:
+                return None
+            if generation < self.generation and (
+                not self._changes or self._changes[0][0] > generation + 1
+            ):
+                return None
+            changes = [change for change in self._changes if change[0] > generation]
+            return self.epoch, self.generation, changes
+
+    # Storage cursor of the latest folded ballot; unlike (epoch, generation)
+    # it means the same in every process
+    def cursor(self, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            return self._cursor
+
+    # (epoch, generation) of the latest folded ballot
+    def position(self, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            return self.epoch, self.generation
+
+    def totals(self, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            return dict(self.candidate_totals)
+
+    # Valid votes per category; invalid votes have no category
+    def totals_by_category(self, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            return dict(self.category_totals)
+
+    def box(self, box_id, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            return dict(self.box_counts.get(box_id, {}))
+
+    def counted_box_count(self, max_age=0):
+        self.sync(max_age)
+        with self._lock:
+            return len(self.counted_boxes)
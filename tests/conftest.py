@@ -0,0 +1,25 @@
+import importlib
+import os
+
+import pytest
+
+
+# The app module on a data directory of its own, imported once per test run
+# (its storage and tally are process-wide); ballots are committed straight
+# away instead of through the write-behind queue
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    os.environ["ELECTION_DATA_DIR"] = str(tmp_path_factory.mktemp("data"))
+    os.environ["ELECTION_STORAGE"] = "json"
+    os.environ["ELECTION_WRITE_BEHIND"] = "0"
+    # Bare-mode calls outside a script run warn on every st.* call
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    return importlib.import_module("app")
+
+
+# {name: candidate ID} for candidates added to the app's catalog
+@pytest.fixture(scope="session")
+def candidate_ids(app):
+    for name, party in [("Ana", "Party 1"), ("Ben", "Party 2")]:
+        app.add_candidate(name, party, "Mayor")
+    return {details["name"]: cid for cid, details in app.load_data(app.CANDIDATES_FILE).items()}
@@ -0,0 +1,79 @@
+import pytest
+
+from audit import co_vote_matrix, compare_counts, export_archive, open_archive, recount
+from storage import JsonStorage
+from vote_journal import VoteJournal
+
+
+def ballot(box_id, vote_id, *candidates):
+    return {"box_id": box_id, "vote_id": vote_id, "candidates": list(candidates)}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JsonStorage(
+        str(tmp_path / "votes.json"),
+        str(tmp_path / "vote_counts.json"),
+        VoteJournal(str(tmp_path / "journal"))
+    )
+    storage.save({
+        "m1": {"name": "Ana", "category": "Mayor"},
+        "m2": {"name": "Ben", "category": "Mayor"},
+        "g1": {"name": "Cruz", "category": "Governor"},
+    }, str(tmp_path / "candidates.json"))
+    storage.save({"box1": {"name": "Box 1"}, "box2": {"name": "Box 2"}}, str(tmp_path / "electoral_boxes.json"))
+    storage.record_ballots([
+        ballot("box1", "v1", "m1", "g1"),
+        ballot("box1", "v2", "m2", "g1"),
+        ballot("box2", "v3", "m1"),
+        ballot("box2", "v4", "invalid"),
+        ballot("box1", "v5", "m1", "g1"),
+        {"box_id": "box2", "vote_id": "v6", "counts": {"m2": 4, "g1": 2}},
+    ])
+    return storage
+
+
+@pytest.fixture
+def archive(storage, tmp_path):
+    path = str(tmp_path / "audit")
+    export_archive(
+        storage, storage.votes_file,
+        str(tmp_path / "candidates.json"), str(tmp_path / "electoral_boxes.json"),
+        path
+    )
+    return open_archive(path)
+
+
+def as_counts(table):
+    return {
+        box_id: {candidate_id: int(count) for candidate_id, count in row.items() if count}
+        for box_id, row in table.iterrows()
+    }
+
+
+@pytest.mark.parametrize("chunk_ballots", [1, 4, 1000])
+def test_recount_matches_stored_counts(storage, archive, chunk_ballots):
+    recounted = recount(archive, chunk_ballots=chunk_ballots)
+
+    assert as_counts(recounted) == storage.load(storage.vote_counts_file)
+    assert compare_counts(recounted, storage.load(storage.vote_counts_file)).empty
+
+
+def test_compare_counts_reports_drift(storage, archive):
+    stored = storage.load(storage.vote_counts_file)
+    stored["box1"]["m1"] += 1
+    stored["box3"] = {"m2": 2}
+
+    drift = compare_counts(recount(archive), stored)
+
+    assert sorted(drift.itertuples(index=False, name=None)) == [
+        ("box1", "m1", 2, 3),
+        ("box3", "m2", 0, 2),
+    ]
+
+
+def test_co_vote_matrix_skips_tally_sheets(archive):
+    matrix = co_vote_matrix(archive, "Mayor", "Governor", chunk_ballots=2)
+
+    assert matrix.loc["Ana", "Cruz"] == 2
+    assert matrix.loc["Ben", "Cruz"] == 1
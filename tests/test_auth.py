@@ -0,0 +1,66 @@
+import hashlib
+
+import pytest
+
+from auth import KdfSettings, PasswordHasher, hash_password, verify_password
+
+# Cheap settings; the cost parameters don't change what is tested
+SCRYPT = KdfSettings("scrypt", n=2 ** 4)
+PBKDF2 = KdfSettings("pbkdf2_sha256", iterations=1000)
+
+
+@pytest.mark.parametrize("settings", [SCRYPT, PBKDF2])
+def test_hash_round_trip(settings):
+    stored = hash_password("secret", settings)
+
+    assert stored.startswith(settings.algorithm + "$")
+    assert verify_password("secret", stored, settings) == (True, False)
+    assert verify_password("wrong", stored, settings) == (False, False)
+    # Salted: the same password never hashes the same twice
+    assert hash_password("secret", settings) != stored
+
+
+def test_legacy_sha256_needs_upgrade():
+    stored = hashlib.sha256(b"secret").hexdigest()
+
+    assert verify_password("secret", stored, SCRYPT) == (True, True)
+    assert verify_password("wrong", stored, SCRYPT)[0] is False
+
+
+def test_other_settings_need_upgrade():
+    stored = hash_password("secret", PBKDF2)
+
+    assert verify_password("secret", stored, SCRYPT) == (True, True)
+    assert verify_password("secret", stored, KdfSettings("pbkdf2_sha256", iterations=2000)) == (True, True)
+
+
+@pytest.mark.parametrize("stored", ["scrypt$16$8$1$zz$00", "md5$00$00"])
+def test_malformed_hash_never_matches(stored):
+    assert verify_password("secret", stored, SCRYPT) == (False, False)
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(ValueError):
+        KdfSettings("md5")
+
+
+def test_unknown_user_costs_a_verify():
+    hasher = PasswordHasher(SCRYPT)
+    assert hasher.verify_unknown_user("secret") == (False, False)
+
+
+def test_login_upgrades_legacy_hash(app):
+    with app.storage.lock(app.USERS_FILE):
+        users = dict(app.load_data(app.USERS_FILE))
+        users["legacy"] = {"password": hashlib.sha256(b"secret").hexdigest(), "role": "counter"}
+        app.save_data(users, app.USERS_FILE)
+    app.user_index.invalidate()
+
+    assert app.authenticate("legacy", "wrong") is None
+    assert app.authenticate("legacy", "secret") == "counter"
+
+    upgraded = app.load_data(app.USERS_FILE)["legacy"]["password"]
+    assert upgraded.startswith(app.PASSWORD_KDF.algorithm + "$")
+    assert verify_password("secret", upgraded, app.PASSWORD_KDF) == (True, False)
+    assert app.authenticate("legacy", "secret") == "counter"
+    assert app.authenticate("nobody", "secret") is None
@@ -0,0 +1,69 @@
+import uuid
+
+from compact_ballots import CompactBallots, decode_votes, encode, encode_votes
+
+
+def records():
+    return [
+        {
+            "box_id": "box1",
+            "vote_id": str(uuid.UUID(int=1)),
+            "candidates": ["c2", "c1"],
+            "recorded_by": "counter1",
+            "recorded_at": "2026-05-01T08:30:00.250000",
+        },
+        {
+            "box_id": "box2",
+            "vote_id": "legacy-id",
+            "candidates": ["invalid"],
+            "recorded_by": "counter2",
+            "recorded_at": "2026-05-01T09:00:00",
+        },
+        {
+            "box_id": "box1",
+            "vote_id": str(uuid.UUID(int=3)),
+            "counts": {"c1": 4, "c3": 2},
+            "recorded_by": "counter1",
+            "recorded_at": "2026-05-01T10:00:00",
+        },
+        {
+            "box_id": "box2",
+            "vote_id": str(uuid.UUID(int=4)),
+            "candidates": ["c3"],
+            "recorded_by": "counter2",
+        },
+    ]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "ballots")
+    encode(records(), path, metadata={"note": "test"})
+
+    ballots = CompactBallots(path)
+    assert len(ballots) == 4
+    assert list(ballots.records()) == records()
+    assert ballots.metadata == {"note": "test"}
+    assert ballots.counts_by_box() == {
+        "box1": {"c1": 5, "c2": 1, "c3": 2},
+        "box2": {"invalid": 1, "c3": 1},
+    }
+
+
+def test_aware_timestamps_are_kept_as_utc(tmp_path):
+    path = str(tmp_path / "ballots")
+    record = {**records()[0], "recorded_at": "2026-05-01T10:30:00+02:00"}
+    encode([record], path)
+
+    decoded, = CompactBallots(path).records()
+    assert decoded["recorded_at"] == "2026-05-01T08:30:00"
+
+
+def test_votes_layout_round_trip(tmp_path):
+    path = str(tmp_path / "ballots")
+    votes = {}
+    for record in records():
+        record = dict(record)
+        votes.setdefault(record.pop("box_id"), {})[record.pop("vote_id")] = record
+
+    encode_votes(votes, path)
+    assert decode_votes(path) == votes
@@ -0,0 +1,60 @@
+import pytest
+
+from compaction import open_storage, verify_counts
+from storage import JsonStorage
+from vote_journal import VoteJournal
+
+
+def ballots(start, stop):
+    return [
+        {"box_id": f"box{i % 3}", "vote_id": f"v{i}", "candidates": [f"c{i % 4}"]}
+        for i in range(start, stop)
+    ]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "sharded"])
+def test_counts_verify_before_and_after_compaction(tmp_path, backend):
+    storage = open_storage(backend, str(tmp_path), None)
+    for start in range(0, 30, 10):
+        storage.record_ballots(ballots(start, start + 10))
+    assert verify_counts(storage) == (30, [])
+
+    storage.compact()
+    storage.record_ballots(ballots(30, 35) + [{"box_id": "box0", "vote_id": "sheet", "counts": {"c1": 7}}])
+    assert verify_counts(storage) == (36, [])
+    assert storage.load_counts_with_cursor()[0]["box0"]["c1"] == 7 + 3
+
+
+def test_archived_ballots_are_recounted(tmp_path):
+    storage = JsonStorage(
+        str(tmp_path / "votes.json"),
+        str(tmp_path / "vote_counts.json"),
+        VoteJournal(str(tmp_path / "journal"), segment_max_bytes=200)
+    )
+    storage.save({"box9": {"old": {"candidates": ["c1"]}}}, storage.votes_file)
+    storage.save({"box9": {"c1": 1}}, storage.vote_counts_file)
+    for start in range(0, 20, 2):
+        storage.record_ballots(ballots(start, start + 2))
+
+    assert storage.compact()["archived_segments"] > 0
+    assert verify_counts(storage) == (21, [])
+
+
+# Counts can only be saved wholesale on these two; sharded ones are derived
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_drift_is_reported(tmp_path, backend):
+    storage = open_storage(backend, str(tmp_path), None)
+    votes, counts = {}, {}
+    for record in ballots(0, 8):
+        votes.setdefault(record["box_id"], {})[record["vote_id"]] = {"candidates": record["candidates"]}
+        box_counts = counts.setdefault(record["box_id"], {})
+        box_counts[record["candidates"][0]] = box_counts.get(record["candidates"][0], 0) + 1
+    counts["box1"]["c1"] += 2
+    counts["box5"] = {"c3": 1}
+    storage.save(votes, str(tmp_path / "votes.json"))
+    storage.save(counts, str(tmp_path / "vote_counts.json"))
+
+    assert verify_counts(storage) == (8, [
+        {"box_id": "box1", "candidate_id": "c1", "recounted": 1, "stored": 3},
+        {"box_id": "box5", "candidate_id": "c3", "recounted": 0, "stored": 1},
+    ])
@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+
+import pytest
+
+from locking import atomic_write_json, fcntl, file_lock
+
+
+def test_file_lock_is_reentrant(tmp_path):
+    path = str(tmp_path / "data.json")
+    with file_lock(path):
+        with file_lock(path):
+            pass
+        # Still held by the outer block
+        assert file_lock(path)._depth == 1
+    assert file_lock(path)._depth == 0
+
+
+def test_file_lock_excludes_other_threads(tmp_path):
+    path = str(tmp_path / "data.json")
+    acquired = threading.Event()
+
+    def other():
+        with file_lock(path):
+            acquired.set()
+
+    with file_lock(path):
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert not acquired.wait(0.2)
+    assert acquired.wait(5)
+    thread.join()
+
+
+@pytest.mark.skipif(fcntl is None, reason="no flock on this platform")
+def test_file_lock_excludes_other_processes(tmp_path):
+    path = str(tmp_path / "data.json")
+    # Another open file description stands in for another process
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT)
+    try:
+        with file_lock(path):
+            with file_lock(path):
+                with pytest.raises(BlockingIOError):
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def test_atomic_write_json_replaces_file(tmp_path):
+    path = str(tmp_path / "data.json")
+    atomic_write_json({"a": 1}, path)
+    atomic_write_json({"b": 2}, path)
+
+    with open(path) as f:
+        assert json.load(f) == {"b": 2}
+    assert os.listdir(tmp_path) == ["data.json"]
+
+
+def test_failed_atomic_write_keeps_old_file(tmp_path):
+    path = str(tmp_path / "data.json")
+    atomic_write_json({"a": 1}, path)
+
+    with pytest.raises(TypeError):
+        atomic_write_json({"a": object()}, path)
+
+    with open(path) as f:
+        assert json.load(f) == {"a": 1}
+    assert os.listdir(tmp_path) == ["data.json"]
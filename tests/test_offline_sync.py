@@ -0,0 +1,75 @@
+import uuid
+
+import pytest
+
+from offline_sync import PayloadError, build_payload, read_payload
+
+
+def records():
+    return [
+        {
+            "box_id": "box1",
+            "vote_id": str(uuid.UUID(int=1)),
+            "candidates": ["c1", "c2"],
+            "recorded_by": "counter1",
+            "recorded_at": "2026-05-01T08:30:00.250000",
+        },
+        {
+            "box_id": "box2",
+            "vote_id": "legacy-id",
+            "candidates": ["c3"],
+            "recorded_by": "counter2",
+            "recorded_at": "2026-05-01T09:00:00",
+        },
+        # Tally sheets and ballots with repeated candidates are kept as is
+        {
+            "box_id": "box1",
+            "vote_id": str(uuid.UUID(int=3)),
+            "counts": {"c1": 4, "invalid": 1},
+            "recorded_by": "counter1",
+            "recorded_at": "2026-05-01T10:00:00",
+        },
+        {
+            "box_id": "box2",
+            "vote_id": str(uuid.UUID(int=4)),
+            "candidates": ["c3", "c3"],
+            "recorded_by": "counter2",
+            "recorded_at": "2026-05-01T10:30:00",
+        },
+    ]
+
+
+def normalized(record):
+    if "candidates" in record:
+        record = {**record, "candidates": sorted(record["candidates"])}
+    return record
+
+
+def test_round_trip():
+    payload = read_payload(build_payload(records()))
+
+    assert len(payload) == 4
+    assert sorted(map(normalized, payload.records), key=lambda record: record["vote_id"]) == sorted(
+        map(normalized, records()), key=lambda record: record["vote_id"]
+    )
+    assert payload.box_counts == {
+        "box1": {"c1": 5, "c2": 1, "invalid": 1},
+        "box2": {"c3": 3},
+    }
+
+
+def test_empty_payload():
+    payload = read_payload(build_payload([]))
+    assert len(payload) == 0
+    assert payload.box_counts == {}
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:10],
+    lambda data: b"XXXX" + data[4:],
+    lambda data: data[:-1] + bytes([data[-1] ^ 0xFF]),
+    lambda data: data[:len(data) // 2],
+])
+def test_damaged_payload_is_rejected(damage):
+    with pytest.raises(PayloadError):
+        read_payload(damage(build_payload(records())))
@@ -0,0 +1,62 @@
+import uuid
+
+
+def new_box():
+    return str(uuid.uuid4())
+
+
+def record_offline(app, box_id, candidate_id, ballots):
+    for _ in range(ballots):
+        app.record_single_vote(box_id, [candidate_id], "counter1", offline_mode=True)
+
+
+def test_sync_is_idempotent(app, candidate_ids):
+    box_id = new_box()
+    ana = candidate_ids["Ana"]
+    record_offline(app, box_id, ana, 3)
+    assert app.pending_offline_counts()[box_id] == 3
+
+    assert app.sync_offline_votes() == 3
+    assert app.tally.box(box_id) == {ana: 3}
+    assert box_id not in app.pending_offline_counts()
+
+    assert app.sync_offline_votes() == 0
+    assert app.tally.box(box_id) == {ana: 3}
+
+
+def test_interrupted_sync_does_not_count_twice(app, candidate_ids):
+    box_id = new_box()
+    ana = candidate_ids["Ana"]
+    record_offline(app, box_id, ana, 2)
+
+    # The ballots reached the store but the log wasn't marked synced
+    payload, ballots = app.export_offline_payload()
+    assert ballots == 2
+    assert app.apply_sync_payload(payload) == (2, 0)
+    assert app.apply_sync_payload(payload) == (0, 2)
+
+    assert app.sync_offline_votes() == 0
+    assert app.tally.box(box_id) == {ana: 2}
+    assert box_id not in app.pending_offline_counts()
+
+
+def test_legacy_offline_votes_are_synced_once(app, candidate_ids):
+    box_id = new_box()
+    ana, ben = candidate_ids["Ana"], candidate_ids["Ben"]
+    legacy = {
+        box_id: {
+            str(uuid.uuid4()): {"candidates": [ana], "recorded_by": "counter1", "recorded_at": "2026-05-01T08:30:00"},
+            str(uuid.uuid4()): {"candidates": [ben], "recorded_by": "counter1", "recorded_at": "2026-05-01T08:40:00"},
+        }
+    }
+    app.save_data(legacy, app.OFFLINE_VOTES_FILE)
+
+    progress = []
+    assert app.sync_offline_votes(chunk_size=1, progress=lambda done, total, _: progress.append((done, total))) == 2
+    assert progress == [(1, 2), (2, 2)]
+    assert app.load_data(app.OFFLINE_VOTES_FILE) == {}
+
+    # Restored by a crash before offline_votes.json was cleared
+    app.save_data(legacy, app.OFFLINE_VOTES_FILE)
+    assert app.sync_offline_votes() == 0
+    assert app.tally.box(box_id) == {ana: 1, ben: 1}
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+import sharded_storage
+from sharded_storage import ShardedStorage, migrate_json_to_sharded
+from storage import JsonStorage
+from vote_journal import VoteJournal
+
+
+def ballot(box_id, vote_id, *candidates):
+    return {"box_id": box_id, "vote_id": vote_id, "candidates": list(candidates)}
+
+
+def open_sharded(data_dir):
+    return ShardedStorage(
+        os.path.join(data_dir, "votes.json"),
+        os.path.join(data_dir, "vote_counts.json"),
+        os.path.join(data_dir, "shards")
+    )
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path)
+
+
+def test_ballots_are_shared_between_instances(data_dir):
+    storage = open_sharded(data_dir)
+    empty = storage.version(storage.votes_file)
+    storage.record_ballots([ballot("box1", "v1", "c1"), ballot("box2", "v2", "c2"), ballot("box1", "v3", "c1", "c2")])
+
+    other = open_sharded(data_dir)
+    assert other.version(other.votes_file) != empty
+    assert other.load(other.vote_counts_file) == {"box1": {"c1": 2, "c2": 1}, "box2": {"c2": 1}}
+    assert {box_id: list(votes) for box_id, votes in other.load(other.votes_file).items()} == {
+        "box1": ["v1", "v3"],
+        "box2": ["v2"],
+    }
+    assert other.existing_vote_ids(["v1", "v2", "v4"]) == {"v1", "v2"}
+
+
+def test_refresh_reads_only_new_ballots(data_dir):
+    storage = open_sharded(data_dir)
+    storage.record_ballots([ballot("box1", "v1", "c1")])
+    version, counts = storage.load_versioned(storage.vote_counts_file)
+
+    open_sharded(data_dir).record_ballots([ballot("box1", "v2", "c2"), ballot("box2", "v3", "c1")])
+    current, refreshed = storage.refresh(storage.vote_counts_file, version, counts)
+
+    assert refreshed == {"box1": {"c1": 1, "c2": 1}, "box2": {"c1": 1}}
+    assert counts == {"box1": {"c1": 1}}
+    assert storage.refresh(storage.vote_counts_file, current, refreshed) == (current, refreshed)
+
+
+def test_ballots_since_cursor(data_dir):
+    storage = open_sharded(data_dir)
+    storage.record_ballots([ballot("box1", "v1", "c1")])
+    counts, cursor = storage.load_counts_with_cursor()
+    assert counts == {"box1": {"c1": 1}}
+
+    open_sharded(data_dir).record_ballots([ballot("box2", "v2", "c2"), ballot("box1", "v3", "c2")])
+    cursor, records = storage.ballots_since(cursor)
+    assert sorted(records, key=lambda record: record["vote_id"]) == [
+        ballot("box2", "v2", "c2"),
+        ballot("box1", "v3", "c2"),
+    ]
+    assert storage.ballots_since(cursor) == (cursor, [])
+
+    # A restored store is a new epoch; earlier cursors no longer apply
+    storage.save({"box3": {"v4": {"candidates": ["c1"]}}}, storage.votes_file)
+    assert storage.ballots_since(cursor) is None
+    assert storage.load_counts_with_cursor()[0] == {"box3": {"c1": 1}}
+
+
+def test_counts_checkpoints_and_compaction(data_dir, monkeypatch):
+    monkeypatch.setattr(sharded_storage, "COUNTS_CHECKPOINT_RECORDS", 4)
+    storage = open_sharded(data_dir)
+    for i in range(10):
+        storage.record_ballots([ballot("box1", f"v{i}", f"c{i % 2}")])
+
+    assert storage.load(storage.vote_counts_file) == {"box1": {"c0": 5, "c1": 5}}
+    assert storage.compact() == {"shards": 1, "archived_segments": 0}
+
+    storage.record_ballots([ballot("box1", "v10", "c0")])
+    assert open_sharded(data_dir).load(storage.vote_counts_file) == {"box1": {"c0": 6, "c1": 5}}
+    assert len(list(storage.iter_ballots(storage.load_counts_with_cursor()[1]))) == 11
+
+
+def test_counts_cannot_be_saved_on_their_own(data_dir):
+    storage = open_sharded(data_dir)
+    with pytest.raises(ValueError):
+        storage.save({"box1": {"c1": 1}}, storage.vote_counts_file)
+
+
+def test_migration_carries_stored_counts(data_dir):
+    source = JsonStorage(
+        os.path.join(data_dir, "votes.json"),
+        os.path.join(data_dir, "vote_counts.json"),
+        VoteJournal(os.path.join(data_dir, "journal"))
+    )
+    source.save({"box1": {"v1": {"candidates": ["c1"]}}}, source.votes_file)
+    # Stored counts that disagree with the ballots, and a box with counts only
+    source.save({"box1": {"c1": 5}, "box2": {"c2": 3}}, source.vote_counts_file)
+    source.record_ballots([ballot("box1", "v2", "c2"), ballot("box3", "v3", "c1")])
+
+    assert migrate_json_to_sharded(data_dir, os.path.join(data_dir, "shards")) == (3, 3)
+
+    target = open_sharded(data_dir)
+    assert target.load(target.vote_counts_file) == source.load(source.vote_counts_file)
+    # box2 has a shard of its own, with no ballots in it
+    votes = target.load(target.votes_file)
+    assert votes.pop("box2") == {}
+    assert votes == source.load(source.votes_file)
+
+    target.record_ballots([ballot("box2", "v4", "c2")])
+    assert target.load(target.vote_counts_file) == {
+        "box1": {"c1": 5, "c2": 1},
+        "box2": {"c2": 4},
+        "box3": {"c1": 1},
+    }
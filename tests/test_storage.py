@@ -0,0 +1,138 @@
+import os
+
+import pytest
+
+from storage import CachedStorage, JsonStorage, SqliteStorage, migrate_json_to_sqlite
+from vote_journal import VoteJournal
+
+
+def ballot(box_id, vote_id, *candidates):
+    return {
+        "box_id": box_id,
+        "vote_id": vote_id,
+        "candidates": list(candidates),
+        "recorded_by": "counter1",
+        "recorded_at": "2026-05-01T08:30:00",
+    }
+
+
+def datasets():
+    return {
+        "users": {"admin": {"password": "hash", "role": "admin", "created_at": "2026-05-01T08:00:00"}},
+        "candidates": {
+            "c1": {"name": "Ana", "party": "Party 1", "category": "Mayor", "created_at": "2026-05-01T08:00:00"},
+            "c2": {"name": "Ben", "party": "Party 2", "category": "Mayor", "created_at": "2026-05-01T08:00:00"},
+        },
+        "electoral_boxes": {
+            "box1": {"name": "Box 1", "location": "School", "registered_voters": 100, "created_at": "2026-05-01T08:00:00"},
+        },
+        "votes": {
+            "box1": {
+                "v1": {"candidates": ["c1"], "recorded_by": "counter1", "recorded_at": "2026-05-01T08:30:00"},
+                "v2": {"counts": {"c1": 2, "c2": 3}, "recorded_by": "counter1", "recorded_at": "2026-05-01T08:40:00"},
+            },
+        },
+        "vote_counts": {"box1": {"c1": 3, "c2": 3}},
+    }
+
+
+def json_storage(data_dir):
+    return JsonStorage(
+        os.path.join(data_dir, "votes.json"),
+        os.path.join(data_dir, "vote_counts.json"),
+        VoteJournal(os.path.join(data_dir, "journal"))
+    )
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    return SqliteStorage(str(tmp_path / "election.db"))
+
+
+def test_sqlite_round_trip(tmp_path, sqlite_storage):
+    for name, data in datasets().items():
+        sqlite_storage.save(data, str(tmp_path / f"{name}.json"))
+
+    reopened = SqliteStorage(sqlite_storage.db_path)
+    for name, data in datasets().items():
+        assert reopened.load(str(tmp_path / f"{name}.json")) == data
+
+
+def test_sqlite_ballots_since_cursor(tmp_path, sqlite_storage):
+    counts, cursor = sqlite_storage.load_counts_with_cursor()
+    assert counts == {}
+
+    sqlite_storage.record_ballots([ballot("box1", "v1", "c1"), ballot("box1", "v2", "c1", "c2")])
+    cursor, records = sqlite_storage.ballots_since(cursor)
+    assert records == [ballot("box1", "v1", "c1"), ballot("box1", "v2", "c1", "c2")]
+    assert sqlite_storage.ballots_since(cursor) == (cursor, [])
+
+    sqlite_storage.record_ballots([ballot("box2", "v3", "c2")])
+    later, records = sqlite_storage.ballots_since(cursor)
+    assert records == [ballot("box2", "v3", "c2")]
+
+    counts, counts_cursor = sqlite_storage.load_counts_with_cursor()
+    assert counts == {"box1": {"c1": 2, "c2": 1}, "box2": {"c2": 1}}
+    assert counts_cursor == later
+
+    # Counts replaced wholesale invalidate every earlier cursor
+    sqlite_storage.save({}, str(tmp_path / "vote_counts.json"))
+    assert sqlite_storage.ballots_since(later) is None
+
+
+def test_cached_storage_refreshes_on_new_version(tmp_path):
+    backend = json_storage(str(tmp_path))
+    cached = CachedStorage(backend)
+    votes_file = backend.votes_file
+
+    version, votes = cached.load_versioned(votes_file)
+    assert votes == {}
+    assert cached.load_versioned(votes_file) == (version, votes)
+    assert cached.stats()["hits"] == 1
+
+    # Ballots recorded by another process are read from the journal
+    json_storage(str(tmp_path)).record_ballots([ballot("box1", "v1", "c1")])
+    version, votes = cached.load_versioned(votes_file)
+    assert list(votes["box1"]) == ["v1"]
+    assert cached.stats()["refreshes"] == 1
+
+    # A file replaced on disk is loaded again in full
+    json_storage(str(tmp_path)).save({"box2": {}}, votes_file)
+    assert cached.load(votes_file) == backend.load(votes_file)
+    assert cached.stats()["misses"] == 2
+
+
+def test_cached_storage_hands_out_read_only_data(tmp_path):
+    cached = CachedStorage(json_storage(str(tmp_path)))
+    users_file = str(tmp_path / "users.json")
+    cached.save({"admin": {"role": "admin"}}, users_file)
+
+    users = cached.load(users_file)
+    with pytest.raises(TypeError):
+        users["counter"] = {"role": "counter"}
+
+    users = dict(users)
+    users["counter"] = {"role": "counter"}
+    cached.save(users, users_file)
+    assert set(cached.load(users_file)) == {"admin", "counter"}
+    assert set(json_storage(str(tmp_path)).load(users_file)) == {"admin", "counter"}
+
+
+def test_migration_matches_json_backend(tmp_path):
+    data_dir = str(tmp_path / "data")
+    os.makedirs(data_dir)
+    source = json_storage(data_dir)
+    for name, data in datasets().items():
+        source.save(data, os.path.join(data_dir, f"{name}.json"))
+    # Ballots still in the journal are migrated too
+    source.record_ballots([ballot("box1", "v3", "c2"), ballot("box2", "v4", "c1")])
+
+    db_path = str(tmp_path / "election.db")
+    migrated = migrate_json_to_sqlite(data_dir, db_path)
+    assert migrated["votes"] == 4
+
+    target = SqliteStorage(db_path)
+    for name in ("users", "candidates", "electoral_boxes", "votes", "vote_counts", "offline_votes"):
+        file_path = os.path.join(data_dir, f"{name}.json")
+        assert target.load(file_path) == source.load(file_path)
+    assert target.load_counts_with_cursor()[0] == {"box1": {"c1": 3, "c2": 4}, "box2": {"c1": 1}}
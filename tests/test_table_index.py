@@ -0,0 +1,75 @@
+import pytest
+
+from storage import JsonStorage
+from table_index import TableIndex, TableIndexCache
+from vote_journal import VoteJournal
+
+
+def box_row(box_id, details):
+    return {
+        "ID": box_id,
+        "Name": details["name"],
+        "Location": details.get("location"),
+        "Voters": details.get("registered_voters"),
+    }
+
+
+def boxes():
+    return {
+        "b1": {"name": "North School", "location": "Main Street", "registered_voters": 300},
+        "b2": {"name": "south school", "location": "River Road", "registered_voters": 120},
+        "b3": {"name": "Town Hall", "location": None, "registered_voters": 450},
+        "b4": {"name": "Northgate Library", "location": "Main Square", "registered_voters": None},
+    }
+
+
+@pytest.fixture
+def index():
+    return TableIndex(boxes(), box_row, sortable=["Name", "Voters"], searchable=["Name", "Location"])
+
+
+def test_sort_order(index):
+    # Text ignores case; missing values sort last
+    assert index.search("", "Name") == ["b1", "b4", "b2", "b3"]
+    assert index.search("", "Voters") == ["b2", "b1", "b3", "b4"]
+
+
+def test_prefix_search(index):
+    assert index.search("north", "Name") == ["b1", "b4"]
+    assert index.search("SCHOOL", "Voters") == ["b2", "b1"]
+    assert index.search("main nor", "Name") == ["b1", "b4"]
+    assert index.search("main school", "Name") == ["b1"]
+    assert index.search("road hall", "Name") == []
+    assert index.search("x", "Name") == []
+
+
+def test_paging(index):
+    keys = index.search("", "Name")
+
+    assert [row["ID"] for row in index.page(keys, 0, 3)] == ["b1", "b4", "b2"]
+    assert [row["ID"] for row in index.page(keys, 3, 3)] == ["b3"]
+    assert [row["ID"] for row in index.page(keys, 0, 3, descending=True)] == ["b3", "b2", "b4"]
+    assert [row["ID"] for row in index.page(keys, 3, 3, descending=True)] == ["b1"]
+    assert index.page(keys, 4, 3) == index.page(keys, 4, 3, descending=True) == []
+
+
+def test_lookup(index):
+    assert index.lookup(["b3", "missing"]) == {"b3": box_row("b3", boxes()["b3"])}
+
+
+def test_cache_rebuilds_on_change(tmp_path):
+    storage = JsonStorage(
+        str(tmp_path / "votes.json"),
+        str(tmp_path / "vote_counts.json"),
+        VoteJournal(str(tmp_path / "journal"))
+    )
+    boxes_file = str(tmp_path / "electoral_boxes.json")
+    storage.save(boxes(), boxes_file)
+    cache = TableIndexCache(storage, boxes_file, box_row, ["Name"], ["Name"])
+
+    index = cache.get()
+    assert cache.get() is index
+
+    storage.save({**boxes(), "b5": {"name": "Airport"}}, boxes_file)
+    assert cache.get() is not index
+    assert cache.get().search("air", "Name") == ["b5"]
@@ -0,0 +1,101 @@
+import pytest
+
+import tally as tally_module
+from storage import JsonStorage
+from tally import Tally
+from vote_journal import VoteJournal
+
+
+def ballot(box_id, vote_id, *candidates):
+    return {"box_id": box_id, "vote_id": vote_id, "candidates": list(candidates)}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JsonStorage(
+        str(tmp_path / "votes.json"),
+        str(tmp_path / "vote_counts.json"),
+        VoteJournal(str(tmp_path / "journal"))
+    )
+    storage.save({
+        "c1": {"name": "Ana", "party": "Party 1", "category": "Mayor"},
+        "c2": {"name": "Ben", "party": "Party 2", "category": "Council"},
+    }, str(tmp_path / "candidates.json"))
+    storage.save({"box1": {"c1": 2}}, storage.vote_counts_file)
+    return storage
+
+
+@pytest.fixture
+def tally(storage, tmp_path):
+    return Tally(storage, str(tmp_path / "candidates.json"))
+
+
+def test_sync_folds_in_new_ballots(storage, tally):
+    assert tally.totals() == {"c1": 2}
+    epoch, generation = tally.position()
+
+    storage.record_ballots([ballot("box1", "v1", "c1", "c2"), ballot("box2", "v2", "invalid")])
+    tally.sync()
+
+    assert tally.position() == (epoch, generation + 2)
+    assert tally.box("box1") == {"c1": 3, "c2": 1}
+    assert tally.box("box2") == {"invalid": 1}
+    assert tally.totals() == {"c1": 3, "c2": 1, "invalid": 1}
+    # Invalid votes have no category
+    assert tally.totals_by_category() == {"Mayor": 3, "Council": 1}
+    assert tally.counted_box_count() == 2
+
+
+def test_sync_with_max_age_shares_one_check(storage, tally):
+    tally.sync()
+    storage.record_ballots([ballot("box1", "v1", "c2")])
+
+    tally.sync(max_age=60)
+    assert tally.box("box1", max_age=60) == {"c1": 2}
+    tally.sync()
+    assert tally.box("box1", max_age=60) == {"c1": 2, "c2": 1}
+
+
+def test_changes_since(storage, tally):
+    epoch, generation, box_counts = tally.snapshot()
+    assert box_counts == {"box1": {"c1": 2}}
+
+    storage.record_ballots([ballot("box1", "v1", "c2"), ballot("box2", "v2", "c1", "c2")])
+    assert tally.changes_since(epoch, generation) == (epoch, generation + 2, [
+        (generation + 1, "box1", {"c2": 1}),
+        (generation + 2, "box2", {"c1": 1, "c2": 1}),
+    ])
+    assert tally.changes_since(epoch, generation + 1)[2] == [(generation + 2, "box2", {"c1": 1, "c2": 1})]
+    assert tally.changes_since(epoch, generation + 2) == (epoch, generation + 2, [])
+
+
+def test_changes_since_needs_snapshot_when_log_is_short(storage, tmp_path, monkeypatch):
+    monkeypatch.setattr(tally_module, "CHANGE_LOG_SIZE", 1)
+    tally = Tally(storage, str(tmp_path / "candidates.json"))
+    epoch, generation = tally.position()
+
+    storage.record_ballots([ballot("box1", "v1", "c2"), ballot("box1", "v2", "c2")])
+    assert tally.changes_since(epoch, generation) is None
+    assert tally.changes_since(epoch, generation + 1)[2] == [(generation + 2, "box1", {"c2": 1})]
+
+
+def test_replaced_counts_reset_the_epoch(storage, tally):
+    epoch, generation = tally.position()
+
+    storage.save({"box3": {"c2": 5}}, storage.vote_counts_file)
+    new_epoch, _ = tally.position()
+
+    assert new_epoch == epoch + 1
+    assert tally.changes_since(epoch, generation) is None
+    assert tally.totals() == {"c2": 5}
+    assert tally.box("box1") == {}
+    assert tally.totals_by_category() == {"Council": 5}
+
+
+def test_category_changes_are_picked_up(storage, tally, tmp_path):
+    assert tally.totals_by_category() == {"Mayor": 2}
+
+    storage.save({
+        "c1": {"name": "Ana", "party": "Party 1", "category": "Governor"},
+    }, str(tmp_path / "candidates.json"))
+    assert tally.totals_by_category() == {"Governor": 2}
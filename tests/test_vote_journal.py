@@ -0,0 +1,79 @@
+import os
+
+from vote_journal import VoteJournal
+
+
+def ballot(i):
+    return {"box_id": f"box{i % 3}", "vote_id": f"vote{i}", "candidates": [f"c{i % 5}"]}
+
+
+def test_append_and_read(tmp_path):
+    journal = VoteJournal(str(tmp_path))
+    assert journal.append([ballot(0), ballot(1)]) == 2
+    assert journal.append([ballot(2)]) == 3
+
+    assert journal.position() == 3
+    assert list(journal.read()) == [(0, ballot(0)), (1, ballot(1)), (2, ballot(2))]
+    assert list(journal.read(1, 2)) == [(1, ballot(1))]
+
+
+def test_partial_write_is_repaired_on_open(tmp_path):
+    journal = VoteJournal(str(tmp_path))
+    journal.append([ballot(0), ballot(1)])
+    (_, data_path, index_path), = journal.segments()
+    committed = os.path.getsize(data_path)
+
+    # A crash mid-append: half a line in the segment and half an offset in
+    # the index, neither committed
+    with open(data_path, "ab") as f:
+        f.write(b'{"box_id":"box0","vote_id":"torn"')
+    with open(index_path, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    assert journal.position() == 2
+    assert [record for _, record in journal.read()] == [ballot(0), ballot(1)]
+
+    reopened = VoteJournal(str(tmp_path))
+    assert reopened.append([ballot(2)]) == 3
+    assert os.path.getsize(index_path) == 3 * 8
+    assert [record for _, record in reopened.read()] == [ballot(0), ballot(1), ballot(2)]
+    with open(data_path, "rb") as f:
+        assert b"torn" not in f.read()
+    assert os.path.getsize(data_path) > committed
+
+
+def test_segments_roll_over(tmp_path):
+    journal = VoteJournal(str(tmp_path), segment_max_bytes=200)
+    for i in range(20):
+        journal.append([ballot(i)])
+
+    segments = journal.segments()
+    assert len(segments) > 1
+    assert [first_seq for first_seq, _, _ in segments] == sorted(first_seq for first_seq, _, _ in segments)
+    assert journal.position() == 20
+    assert [record for _, record in journal.read()] == [ballot(i) for i in range(20)]
+    assert [seq for seq, _ in journal.read(7, 12)] == list(range(7, 12))
+
+
+def test_discard_before_keeps_positions(tmp_path):
+    journal = VoteJournal(str(tmp_path), segment_max_bytes=200)
+    for i in range(20):
+        journal.append([ballot(i)])
+    segments = journal.segments()
+    keep_from = segments[2][0]
+
+    journal.discard_before(keep_from)
+
+    assert journal.segments()[0][0] == keep_from
+    assert journal.position() == 20
+    assert list(journal.read(keep_from)) == [(i, ballot(i)) for i in range(keep_from, 20)]
+    assert journal.append([ballot(20)]) == 21
+
+
+def test_archived_segments_are_still_read(tmp_path):
+    journal = VoteJournal(str(tmp_path), segment_max_bytes=200)
+    for i in range(20):
+        journal.append([ballot(i)])
+
+    assert journal.archive_before(journal.segments()[-1][0]) > 0
+    assert [record for _, record in journal.read()] == [ballot(i) for i in range(20)]
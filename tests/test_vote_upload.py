@@ -0,0 +1,90 @@
+import json
+import uuid
+
+import pytest
+
+
+def new_box():
+    return str(uuid.uuid4())
+
+
+def test_json_tally_sheet(app):
+    content = json.dumps({"counts": {"c1": 5.0, "c2": "3", "c3": 0}})
+    assert app.parse_vote_upload("sheet.json", content) == {"c1": 5, "c2": 3, "c3": 0}
+
+
+def test_json_ballots(app):
+    ballots = [["c1"], ["c1", "c2"], ["invalid"]]
+    assert app.parse_vote_upload("ballots.json", json.dumps({"ballots": ballots})) == ballots
+    assert app.parse_vote_upload("ballots.json", json.dumps(ballots)) == ballots
+
+
+@pytest.mark.parametrize("data", [
+    {"counts": [["c1", 5]]},
+    {"ballots": ["c1", "c2"]},
+    {"ballots": [["c1", 2]]},
+    {"votes": []},
+    "c1",
+])
+def test_malformed_json_is_rejected(app, data):
+    with pytest.raises(ValueError):
+        app.parse_vote_upload("upload.json", json.dumps(data))
+
+
+def test_csv_tally_sheet(app):
+    content = "candidate_id,count\nc1,4\nc2,1\nc1,2\n"
+    assert app.parse_vote_upload("sheet.csv", content) == {"c1": 6, "c2": 1}
+
+
+def test_csv_ballots(app):
+    content = "candidates\nc1;c2\n c2 \n\n"
+    assert app.parse_vote_upload("ballots.csv", content) == [["c1", "c2"], ["c2"]]
+
+
+@pytest.mark.parametrize("content", [
+    "candidate_id,count\nc1\n",
+    "candidate_id,count\n,3\n",
+    "candidate_id,count\nc1,three\n",
+    "name,votes\nAna,3\n",
+])
+def test_malformed_csv_is_rejected(app, content):
+    with pytest.raises(ValueError):
+        app.parse_vote_upload("upload.csv", content)
+
+
+def test_record_tally_sheet(app, candidate_ids):
+    box_id = new_box()
+    ana, ben = candidate_ids["Ana"], candidate_ids["Ben"]
+
+    assert app.record_votes_batch(box_id, {ana: 4, ben: 0, "invalid": 1}, "counter1") == (True, "Recorded 5 votes")
+    assert app.tally.box(box_id) == {ana: 4, "invalid": 1}
+
+
+def test_record_ballots(app, candidate_ids):
+    box_id = new_box()
+    ana, ben = candidate_ids["Ana"], candidate_ids["Ben"]
+
+    assert app.record_votes_batch(box_id, [[ana], [ana, ben]], "counter1") == (True, "Recorded 2 votes")
+    assert app.tally.box(box_id) == {ana: 2, ben: 1}
+
+
+@pytest.mark.parametrize("votes", [
+    {"unknown": 1},
+    {"Ana": -1},
+    {"Ana": 1.5},
+    {"Ana": True},
+    {"Ana": 0},
+    [["unknown"]],
+    [["Ana"], []],
+    [],
+])
+def test_bad_batches_record_nothing(app, candidate_ids, votes):
+    box_id = new_box()
+    if isinstance(votes, dict):
+        votes = {candidate_ids.get(cid, cid): count for cid, count in votes.items()}
+    else:
+        votes = [[candidate_ids.get(cid, cid) for cid in ballot] for ballot in votes]
+
+    recorded, _ = app.record_votes_batch(box_id, votes, "counter1")
+    assert not recorded
+    assert app.tally.box(box_id) == {}
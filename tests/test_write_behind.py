@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from storage import JsonStorage
+from tally import Tally
+from vote_journal import VoteJournal
+from write_behind import WriteBehindQueue
+
+
+# One process's view of a shared data directory: its own storage, tally and
+# write-behind queue over the same files
+def open_process(data_dir):
+    storage = JsonStorage(
+        os.path.join(data_dir, "votes.json"),
+        os.path.join(data_dir, "vote_counts.json"),
+        VoteJournal(os.path.join(data_dir, "journal"))
+    )
+    tally = Tally(storage, os.path.join(data_dir, "candidates.json"))
+
+    def commit(records):
+        storage.record_ballots(records)
+        tally.sync()
+
+    return tally, WriteBehindQueue(os.path.join(data_dir, "pending"), storage, tally, commit)
+
+
+def ballot(vote_id, *candidates):
+    return {"box_id": "box1", "vote_id": vote_id, "candidates": list(candidates)}
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path)
+
+
+def test_pending_ballots_count_before_the_flush(data_dir):
+    tally, queue = open_process(data_dir)
+    queue.submit([ballot("v1", "a"), ballot("v2", "a", "b")])
+
+    assert tally.box("box1") == {}
+    assert queue.box_counts("box1") == {"a": 2, "b": 1}
+    assert queue.backlog() == 2
+
+
+def test_flush_moves_ballots_into_the_store(data_dir):
+    tally, queue = open_process(data_dir)
+    queue.start()
+    queue.submit([ballot("v1", "a"), ballot("v2", "b")])
+
+    assert queue.flush(timeout=10)
+    assert tally.box("box1") == {"a": 1, "b": 1}
+    assert queue.box_counts("box1") == {"a": 1, "b": 1}
+    assert queue.backlog() == 0
+
+
+def test_ballots_committed_by_another_process_count_once(data_dir):
+    tally, queue = open_process(data_dir)
+    _, other_queue = open_process(data_dir)
+    queue.submit([ballot("v1", "a")])
+    # Warm this process's tally before the other process commits
+    assert queue.box_counts("box1") == {"a": 1}
+
+    other_queue.drain()
+
+    assert queue.box_counts("box1", max_age=60) == {"a": 1}
+    assert queue.backlog() == 0
+
+
+def test_replayed_ballots_are_not_committed_twice(data_dir):
+    tally, queue = open_process(data_dir)
+    queue.submit([ballot("v1", "a")])
+    queue.drain()
+    # A crash before the high-water mark was written replays the ballot
+    os.remove(os.path.join(data_dir, "pending", "committed.json"))
+    _, restarted = open_process(data_dir)
+    restarted.drain()
+
+    assert tally.box("box1") == {"a": 1}
@@ -0,0 +1,289 @@
+import gzip
+import json
+import os
+import shutil
+import struct
+
+from locking import file_lock, fsync_dir
+from metrics import count_bytes
+
+# Append-only ballot journal
+#
+# Every ballot is appended as one JSON line to the current segment file and
+# fsync'd, then its end offset is appended to the segment's ".idx" file and
+# fsync'd. A record only counts as committed once its offset is in the index,
+# so readers never see a half-written line and a crash mid-write is repaired
+# on the next open by truncating the segment back to the last indexed offset.
+#
+# Segments are named after the global sequence number of their first record,
+# e.g. "votes-000000000000.jsonl", so a reader can seek straight to any
+# position without scanning older segments. Appends are serialised across
+# threads and processes by a lock file in the journal directory.
+#
+# archive_before() gzips old, full segments into the "archive" subdirectory;
+# reads still see their records, only more slowly.
+
+JOURNAL_DIR = "data/journal"
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+
+_OFFSET = struct.Struct("<Q")
+_SEGMENT_PREFIX = "votes-"
+_SEGMENT_SUFFIX = ".jsonl"
+_INDEX_SUFFIX = ".idx"
+_ARCHIVE_DIR = "archive"
+_ARCHIVE_SUFFIX = ".gz"
+
+
+def _segment_name(first_seq):
+    return f"{_SEGMENT_PREFIX}{first_seq:012d}"
+
+
+class VoteJournal:
+    def __init__(self, directory=JOURNAL_DIR, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self._tail = None
+        os.makedirs(directory, exist_ok=True)
+        # Appenders in every thread and process serialise on this lock
+        self._lock = file_lock(os.path.join(directory, "append"))
+
+    def _list_segments(self, directory, suffix):
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return {}
+        segments = {}
+        for name in names:
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(suffix):
+                stem = name[:-len(suffix)]
+                try:
+                    first_seq = int(stem[len(_SEGMENT_PREFIX):])
+                except ValueError:
+                    continue
+                segments[first_seq] = (
+                    first_seq,
+                    os.path.join(directory, name),
+                    os.path.join(directory, _segment_name(first_seq) + _INDEX_SUFFIX)
+                )
+        return segments
+
+    # List segments as (first_seq, data_path, index_path), oldest first;
+    # archived segments are included, a live copy wins over an archived one
+    def segments(self):
+        segments = self._list_segments(
+            os.path.join(self.directory, _ARCHIVE_DIR), _SEGMENT_SUFFIX + _ARCHIVE_SUFFIX
+        )
+        segments.update(self._list_segments(self.directory, _SEGMENT_SUFFIX))
+        return sorted(segments.values())
+
+    # Committed end offsets of every record in a segment
+    def _read_offsets(self, index_path):
+        try:
+            with open(index_path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        usable = len(raw) - len(raw) % _OFFSET.size
+        return [offset for (offset,) in _OFFSET.iter_unpack(raw[:usable])]
+
+    # Number of committed records in the whole journal
+    def position(self):
+        segments = self.segments()
+        if not segments:
+            return 0
+        first_seq, _, index_path = segments[-1]
+        try:
+            size = os.path.getsize(index_path)
+        except FileNotFoundError:
+            size = 0
+        return first_seq + size // _OFFSET.size
+
+    # Drop anything past the last indexed record of the newest segment
+    def _repair_tail(self, data_path, index_path):
+        offsets = self._read_offsets(index_path)
+        committed = offsets[-1] if offsets else 0
+        with open(index_path, "ab") as f:
+            f.truncate(len(offsets) * _OFFSET.size)
+        with open(data_path, "ab") as f:
+            if f.tell() != committed:
+                f.truncate(committed)
+        return len(offsets), committed
+
+    def _new_segment(self, first_seq):
+        stem = os.path.join(self.directory, _segment_name(first_seq))
+        data_path = stem + _SEGMENT_SUFFIX
+        index_path = stem + _INDEX_SUFFIX
+        open(data_path, "ab").close()
+        open(index_path, "ab").close()
+        fsync_dir(self.directory)
+        return [first_seq, 0, data_path, index_path, 0]
+
+    # Tail segment as [first_seq, count, data_path, index_path, size]
+    def _open_tail(self):
+        segments = self.segments()
+        if not segments:
+            return self._new_segment(0)
+        first_seq, data_path, index_path = segments[-1]
+        count, size = self._repair_tail(data_path, index_path)
+        return [first_seq, count, data_path, index_path, size]
+
+    # Cheap check that nobody else moved the tail since we last wrote to it
+    def _tail_is_current(self, tail):
+        _, count, data_path, index_path, size = tail
+        try:
+            return (
+                os.path.getsize(data_path) == size
+                and os.path.getsize(index_path) == count * _OFFSET.size
+            )
+        except FileNotFoundError:
+            return False
+
+    # Append records in a single write; returns the sequence number after them
+    def append(self, records):
+        if not records:
+            return self.position()
+
+        lines = [
+            (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+            for record in records
+        ]
+
+        with self._lock:
+            tail = self._tail
+            if tail is None or not self._tail_is_current(tail):
+                tail = self._open_tail()
+            if tail[4] >= self.segment_max_bytes:
+                tail = self._new_segment(tail[0] + tail[1])
+            first_seq, count, data_path, index_path, size = tail
+
+            offsets = []
+            end = size
+            for line in lines:
+                end += len(line)
+                offsets.append(end)
+
+            with open(data_path, "ab") as f:
+                f.write(b"".join(lines))
+                count_bytes(written=end - size)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with open(index_path, "ab") as f:
+                f.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+                count_bytes(written=len(offsets) * _OFFSET.size)
+                f.flush()
+                os.fsync(f.fileno())
+
+            count += len(records)
+            self._tail = [first_seq, count, data_path, index_path, end]
+            return first_seq + count
+
+    # Yield (seq, record) for every committed record at or after `start`
+    def read(self, start=0, stop=None):
+        segments = self.segments()
+        for i, (first_seq, data_path, index_path) in enumerate(segments):
+            next_first = segments[i + 1][0] if i + 1 < len(segments) else None
+            if next_first is not None and next_first <= start:
+                continue
+
+            offsets = self._read_offsets(index_path)
+            if not offsets and not os.path.exists(index_path):
+                # Archived since we listed the segments
+                _, data_path, index_path = self._archived(first_seq)
+                offsets = self._read_offsets(index_path)
+            if not offsets:
+                continue
+
+            skip = max(0, start - first_seq)
+            if skip >= len(offsets):
+                continue
+            if stop is not None:
+                offsets = offsets[:max(0, stop - first_seq)]
+                if skip >= len(offsets):
+                    return
+
+            begin = offsets[skip - 1] if skip > 0 else 0
+            with self._open_data(first_seq, data_path) as f:
+                f.seek(begin)
+                chunk = f.read(offsets[-1] - begin)
+            count_bytes(read=len(chunk))
+
+            seq = first_seq + skip
+            for line in chunk.splitlines():
+                yield seq, json.loads(line)
+                seq += 1
+
+    def _archived(self, first_seq):
+        stem = os.path.join(self.directory, _ARCHIVE_DIR, _segment_name(first_seq))
+        return first_seq, stem + _SEGMENT_SUFFIX + _ARCHIVE_SUFFIX, stem + _INDEX_SUFFIX
+
+    def _open_data(self, first_seq, data_path):
+        if data_path.endswith(_ARCHIVE_SUFFIX):
+            return gzip.open(data_path, "rb")
+        try:
+            return open(data_path, "rb")
+        except FileNotFoundError:
+            return gzip.open(self._archived(first_seq)[1], "rb")
+
+    # Gzip whole segments that hold only records before `seq` into the
+    # archive directory, then drop the live copies; returns how many moved.
+    # The tail segment is never archived.
+    def archive_before(self, seq):
+        archive_dir = os.path.join(self.directory, _ARCHIVE_DIR)
+        os.makedirs(archive_dir, exist_ok=True)
+        moved = 0
+        with self._lock:
+            segments = self.segments()
+            for (first_seq, data_path, index_path), (next_first, _, _) in zip(segments, segments[1:]):
+                if next_first > seq:
+                    break
+                if data_path.endswith(_ARCHIVE_SUFFIX):
+                    continue
+                _, archived_data, archived_index = self._archived(first_seq)
+                with open(data_path, "rb") as source, gzip.open(archived_data + ".tmp", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                shutil.copyfile(index_path, archived_index + ".tmp")
+                for path in (archived_data, archived_index):
+                    with open(path + ".tmp", "rb+") as f:
+                        os.fsync(f.fileno())
+                    os.replace(path + ".tmp", path)
+                fsync_dir(archive_dir)
+                os.remove(index_path)
+                os.remove(data_path)
+                moved += 1
+            fsync_dir(self.directory)
+        return moved
+
+    # Delete whole segments that hold only records before `seq`; positions
+    # stay valid since segments are named after their first record. Callers
+    # must make sure nobody still reads those records.
+    def discard_before(self, seq):
+        with self._lock:
+            segments = self.segments()
+            for (_, data_path, index_path), (next_first, _, _) in zip(segments, segments[1:]):
+                if next_first > seq:
+                    break
+                os.remove(data_path)
+                os.remove(index_path)
+            fsync_dir(self.directory)
+
+
+# Fold a journal record into the votes.json layout (box -> vote_id -> ballot)
+def apply_to_votes(votes, record):
+    ballot = {key: value for key, value in record.items() if key not in ("box_id", "vote_id")}
+    votes.setdefault(record["box_id"], {})[record["vote_id"]] = ballot
+
+
+# Ballot record -> (candidate_id, count) pairs; legacy batch records carry a
+# "counts" map, single ballots a "candidates" list
+def ballot_deltas(record):
+    if "counts" in record:
+        return record["counts"].items()
+    return ((candidate_id, 1) for candidate_id in record["candidates"])
+
+
+# Fold a journal record into the vote_counts.json layout (box -> candidate -> count)
+def apply_to_counts(vote_counts, record):
+    box_counts = vote_counts.setdefault(record["box_id"], {})
+    for candidate_id, count in ballot_deltas(record):
+        box_counts[candidate_id] = box_counts.get(candidate_id, 0) + count
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from locking import atomic_write_json, file_lock
+from vote_journal import VoteJournal, ballot_deltas
+
+# Write-behind queue for ballots
+#
+# submit() appends ballots to a small local journal (fsync'd, so they survive
+# a crash) and returns; a background writer then moves everything journaled
+# since the last flush into the main store in one group commit and records
+# how far it got in "committed.json". Counter latency is one short append no
+# matter how busy the store is, and a busy store gets fewer, bigger writes.
+#
+# The journal directory is shared by every process on the data directory;
+# whichever writer holds the drain lock commits for all of them, so ballots
+# left behind by a process that died are picked up by the next flush. A crash
+# between the commit and the high-water mark update would replay ballots, so
+# IDs already in the store are skipped. Ballots submitted by this process but
+# not committed yet are kept in memory and added to box_counts(), so the
+# counter sees its vote counted straight away. Another process's writer may
+# commit them first; box_counts() re-reads the high-water mark, drops what
+# it passed and syncs the tally fully, so they are never counted twice.
+
+SEGMENT_MAX_BYTES = 1024 * 1024
+MAX_BATCH = 2000
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, directory, storage, tally, commit, max_batch=MAX_BATCH, poll_interval=1.0):
+        self.directory = directory
+        self.storage = storage
+        self.tally = tally
+        self.commit = commit
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.journal = VoteJournal(directory, SEGMENT_MAX_BYTES)
+        self._committed_file = os.path.join(directory, "committed.json")
+        self._drain_lock = file_lock(os.path.join(directory, "drain"))
+        # Guards _pending and _committed; flush() waits on it
+        self._changed = threading.Condition()
+        # Held while a batch moves from _pending into the tally, so
+        # box_counts() never counts it twice or not at all
+        self._view_lock = threading.Lock()
+        self._pending = {}  # seq -> (box_id, [(candidate_id, count)])
+        self._committed = self._read_committed()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _read_committed(self):
+        try:
+            with open(self._committed_file, "r") as f:
+                return json.load(f)["position"]
+        except FileNotFoundError:
+            return 0
+
+    # Journal ballot records for the writer; returns once they are durable
+    def submit(self, records):
+        end = self.journal.append(records)
+        with self._changed:
+            for seq, record in enumerate(records, end - len(records)):
+                if seq >= self._committed:
+                    self._pending[seq] = (record["box_id"], list(ballot_deltas(record)))
+        self._wake.set()
+        return end
+
+    # Move past ballots any process's writer has committed; True if that
+    # dropped some of ours from _pending
+    def _catch_up(self):
+        position = self._read_committed()
+        with self._changed:
+            dropped = any(seq < position for seq in self._pending)
+        self._advance(position)
+        return dropped
+
+    # Committed counts for a box plus this process's queued ballots
+    def box_counts(self, box_id, max_age=0):
+        with self._view_lock:
+            # A writer commits ballots before moving the high-water mark, so
+            # a full sync sees every ballot _catch_up dropped
+            if self._catch_up():
+                max_age = 0
+            counts = dict(self.tally.box(box_id, max_age))
+            with self._changed:
+                for pending_box, deltas in self._pending.values():
+                    if pending_box == box_id:
+                        for candidate_id, count in deltas:
+                            counts[candidate_id] = counts.get(candidate_id, 0) + count
+        return counts
+
+    # Ballots journaled by any process but not yet in the main store
+    def backlog(self):
+        self._catch_up()
+        return max(0, self.journal.position() - self._committed)
+
+    def _advance(self, position):
+        with self._changed:
+            if position > self._committed:
+                self._committed = position
+            for seq in [seq for seq in self._pending if seq < self._committed]:
+                del self._pending[seq]
+            self._changed.notify_all()
+
+    # Commit everything journaled so far, max_batch records at a time
+    def drain(self):
+        with self._drain_lock:
+            committed = self._read_committed()
+            while True:
+                end = min(self.journal.position(), committed + self.max_batch)
+                if end <= committed:
+                    break
+                records = [record for _, record in self.journal.read(committed, end)]
+                replayed = self.storage.existing_vote_ids(record["vote_id"] for record in records)
+                records = [record for record in records if record["vote_id"] not in replayed]
+                with self._view_lock:
+                    if records:
+                        self.commit(records)
+                    atomic_write_json({"position": end}, self._committed_file)
+                    self._advance(end)
+                committed = end
+            self._advance(committed)
+            self.journal.discard_before(committed)
+
+    # Wait until everything submitted before the call is in the main store
+    def flush(self, timeout=None):
+        target = self.journal.position()
+        self._wake.set()
+        with self._changed:
+            return self._changed.wait_for(lambda: self._committed >= target, timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                log.exception("Committing queued ballots failed")
+                time.sleep(self.poll_interval)
+
+    def start(self):
+        if self._thread is None:
+            # Drain right away: a previous run may have left ballots behind
+            self._wake.set()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()